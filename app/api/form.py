@@ -1,20 +1,18 @@
 # app/api/form.py
+import asyncio
 import logging
-import json
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 
-from app.models.form import Form, CreateFormRequest
-from app.mongodb import get_forms
-from fastapi import APIRouter, HTTPException, Query, Body
+from fastapi.exceptions import RequestValidationError
 
-from app.services.clean_html import clean_html
-from app.services.gemini_prompt import form_widget_detection, extract_form_elements, fill_form_values
+from app.middleware import read_spooled_json
+from app.services.form_pipeline import process_form
+from app.settings import settings
 
-from pydantic import BaseModel
-from typing import Optional
-from bson import json_util
-router = APIRouter()
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional
+router = APIRouter(default_response_class=ORJSONResponse)
 logger = logging.getLogger(__name__)
 
 '''
@@ -61,12 +59,98 @@ class FormRequest(BaseModel):
     dom: Optional[str] = None
     user_prompt: Optional[str] = None
     custom_command: Optional[str] = None
+    # "staged", "combined" or "auto", defaults to PIPELINE_MODE
+    pipeline_mode: Optional[str] = None
 
 
-@router.post("/{domain}", response_model=dict)
+class BatchFormItem(BaseModel):
+    domain: str
+    url: Optional[str] = None
+    dom: Optional[str] = None
+    custom_command: Optional[str] = None
+
+
+class BatchFormRequest(BaseModel):
+    # Shared by every item so the long profile is only sent once
+    user_prompt: Optional[str] = None
+    custom_command: Optional[str] = None
+    pipeline_mode: Optional[str] = None
+    items: List[BatchFormItem]
+
+
+async def parse_body(request: Request, model):
+    """
+    Validate a JSON body read through the spooled reader.
+
+    The form endpoints read their own bodies so a multi-megabyte DOM is never
+    held as raw bytes, cached body and parsed copy for the whole request.
+    """
+    payload = await read_spooled_json(request)
+    try:
+        return model.model_validate(payload)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+
+def body_schema(model) -> dict:
+    """OpenAPI request body for an endpoint that parses its own body, nested models inlined"""
+    schema = model.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def inline(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return inline(definitions[node["$ref"].split("/")[-1]])
+            return {key: inline(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [inline(value) for value in node]
+        return node
+
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": inline(schema)}}}}
+
+
+@router.post("/batch", response_model=dict, openapi_extra=body_schema(BatchFormRequest))
+async def batch_forms(request: Request):
+    """
+    Process several forms (pages of a multi-step flow, or several forms) in one call.
+
+    Items run concurrently; Gemini calls are still bounded by the process-wide LLM
+    concurrency limit, so the wall time approaches the slowest item. Every item
+    gets its own status code and either a result or an error.
+    """
+    batch_data = await parse_body(request, BatchFormRequest)
+    if not batch_data.items:
+        raise HTTPException(status_code=422, detail="Batch contains no items")
+    if len(batch_data.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=422, detail=f"Batch is limited to {settings.BATCH_MAX_ITEMS} items")
+
+    async def run_item(item: BatchFormItem):
+        # Hand the DOM over so process_form holds the only reference to it
+        dom, item.dom = item.dom, None
+        try:
+            status_code, content = await process_form(
+                item.domain,
+                dom,
+                batch_data.user_prompt,
+                item.custom_command or batch_data.custom_command,
+                batch_data.pipeline_mode,
+                item.url
+            )
+            return {"domain": item.domain, "status_code": status_code, "result": content}
+        except HTTPException as e:
+            return {"domain": item.domain, "status_code": e.status_code, "error": e.detail}
+        except Exception as e:
+            logger.error(f"Error processing batch item for {item.domain}: {str(e)}")
+            return {"domain": item.domain, "status_code": 500, "error": f"Failed to process form request: {str(e)}"}
+
+    results = await asyncio.gather(*[run_item(item) for item in batch_data.items])
+    return ORJSONResponse(content={"results": results})
+
+
+@router.post("/{domain}", response_model=dict, openapi_extra=body_schema(FormRequest))
 async def get_or_create_form(
     domain: str,
-    form_data: FormRequest = Body(...)
+    request: Request
 ):
     """
     Get an existing form by domain or create a new one if not found.
@@ -76,108 +160,23 @@ async def get_or_create_form(
     2. If not found, process the DOM to extract form elements
     3. Return the structured form data for the extension
     """
-    print(domain)
-    print(form_data)
-    dom = form_data.dom
-    user_prompt = form_data.user_prompt
-    custom_command = form_data.custom_command
-    print(domain)
+    logger.info(f"Processing form request for domain: {domain}")
+    form_data = await parse_body(request, FormRequest)
+    # Hand the DOM over so process_form holds the only reference to it
+    dom, form_data.dom = form_data.dom, None
     
     try:
-        # Try to find the form first in the database
-        forms_collection = get_forms()
-        existing_form = await forms_collection.find_one({"domain": domain})
-        
-        if existing_form:
-            serialized_form = json.loads(json_util.dumps(existing_form))
-            query_selector = serialized_form.get("mapping", {}).get("querySelectorAll")
-            
-            # Skip cleaning the DOM for Typeform domains to preserve window.rendererData
-            html_to_process = dom if "typeform" in domain else clean_html(dom)
-            
-            form_elements = await extract_form_elements(html_to_process, query_selector, domain)
-            form_elements = await fill_form_values(form_elements, [
-                        {"role": "user", "parts": [user_prompt]},
-                        {"role": "user", "parts": [custom_command] if custom_command else ["Please fill this form based on the information provided."]}
-                    ], domain)
-            logger.info(f"Found existing form for domain: {domain}")
-            return JSONResponse(content=form_elements)
-        
-        # Process the DOM if provided
-        if dom:
-            query_selector = ""
-            form_elements = []
-            
-            # Skip cleaning the DOM for Typeform domains to preserve window.rendererData
-            html_to_process = dom if "typeform" in domain else clean_html(dom)
-            
-            # For Typeform, we don't need widget detection as we extract from window.rendererData
-            if "typeform" in domain:
-                # Use a dummy query selector as it will be ignored for Typeform
-                query_selector = "form"
-                
-                # Extract directly from window.rendererData
-                form_elements = await extract_form_elements(html_to_process, query_selector, domain)
-                
-                # Fill form values if user prompt is provided
-                if user_prompt:
-                    form_elements = await fill_form_values(form_elements, [
-                        {"role": "user", "parts": [user_prompt]},
-                        {"role": "user", "parts": [custom_command] if custom_command else ["Please fill this form based on the information provided."]}
-                    ], domain)
-            else:
-                # Standard flow for non-Typeform sites
-                try:
-                    # Step 1: Get the query selector for form widgets
-                    widget_detection_result = await form_widget_detection(html_to_process)
-                    
-                    # Parse the response to get the querySelectorAll
-                    if isinstance(widget_detection_result, str):
-                        # Handle string response (potentially error or raw JSON)
-                        widget_detection_data = json.loads(widget_detection_result)
-                    else:
-                        # Handle object response from Gemini
-                        widget_detection_data = widget_detection_result
-                    
-                    query_selector = widget_detection_data.get("querySelectorAll")
-                    
-                    if not query_selector:
-                        logger.error("No query selector found in widget detection response")
-                        raise HTTPException(status_code=400, detail="Could not detect form widgets")
-                    
-                    # Step 2: Extract form elements using the querySelectorAll
-                    form_elements = await extract_form_elements(html_to_process, query_selector, domain)
-                    
-                    # Step 3: Fill form values if user prompt is provided
-                    if user_prompt:
-                        form_elements = await fill_form_values(form_elements, [
-                            {"role": "user", "parts": [user_prompt]},
-                            {"role": "user", "parts": [custom_command] if custom_command else ["Please fill this form based on the information provided."]}
-                        ], domain)
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON parsing error: {str(e)}")
-                    raise HTTPException(status_code=422, detail=f"Failed to parse widget detection result: {str(e)}")
-            
-            # Create and save the form
-            new_form = Form(
-                domain=domain,
-                mapping={"querySelectorAll": query_selector},
-                parent_container="form",  # Default container, could be updated based on DOM analysis
-                verified=False
-            )
-            
-            # Save form to database
-            await new_form.save()
-            
-            # Return the form elements for the extension
-            return JSONResponse(status_code=201, content=form_elements)
-        else:
-            # No form found and no DOM to process
-            raise HTTPException(status_code=404, detail=f"Form with domain '{domain}' not found and no DOM provided")
-            
+        status_code, content = await process_form(
+            domain,
+            dom,
+            form_data.user_prompt,
+            form_data.custom_command,
+            form_data.pipeline_mode,
+            form_data.url
+        )
+        return ORJSONResponse(status_code=status_code, content=content)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error processing form request: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to process form request: {str(e)}")
-
@@ -1,19 +1,80 @@
 # app/api/form_detect.py
+import hashlib
 import logging
-from fastapi import APIRouter, HTTPException, Body
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Body, Query, Request, Response
+from fastapi.responses import ORJSONResponse
 from urllib.parse import urlparse
-from typing import List
+from typing import List, Optional
 
-from app.models.form_detect import find_form_detection_by_domain, FormDetectionResponse
+from app.models.form_detect import (
+    get_detection_snapshot,
+    DetectionSnapshotResponse,
+    FormDetectionResponse,
+)
+from app.services.caches import find_detection_cached
+from app.settings import settings
 from pydantic import BaseModel
 
 class UrlRequest(BaseModel):
     url: str
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 logger = logging.getLogger(__name__)
 
+'''
+The GET variants answer the same questions as the POST endpoints but are
+cacheable: responses carry an ETag and a Cache-Control max-age, and a matching
+If-None-Match gets an empty 304. /snapshot serves the whole detection domain
+list (or the changes since a version) so the extension can answer most checks
+locally.
+'''
+
+
+def cacheable_response(request: Request, content: dict, max_age: int, etag: Optional[str] = None) -> Response:
+    """JSON response with validators and Cache-Control, 304 when the client already has it"""
+    response = ORJSONResponse(content=content)
+    etag = etag or f'"{hashlib.sha1(response.body).hexdigest()[:16]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}, stale-while-revalidate={max_age}",
+    }
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
+
+
+async def any_domain_detected(urls: List[str]) -> bool:
+    # Extract domains from the URLs
+    domains = []
+    for url in urls:
+        parsed_url = urlparse(url)
+        domain = parsed_url.netloc
+        if domain:
+            domains.append(domain)
+
+    # Check if any domain exists in the database
+    for domain in domains:
+        existing_record = await find_detection_cached(domain)
+        if existing_record is not None:
+            return True
+    return False
+
+
+async def is_false_positive(url: str) -> bool:
+    # Extract domain from the URL
+    parsed_url = urlparse(url)
+    domain = parsed_url.netloc
+
+    if not domain:
+        logger.warning(f"Invalid URL provided: {url}")
+        return True  # Reported as form=False
+
+    # Check if domain exists in the database with form=False
+    existing_record = await find_detection_cached(domain)
+    return bool(existing_record) and existing_record.get("form") is False
+
+
 @router.post("/form-detect", response_model=FormDetectionResponse)
 async def detect_form_from_urls(
     urls: List[str] = Body(...)
@@ -28,22 +89,7 @@ async def detect_form_from_urls(
         - form: Boolean indicating if any URL domain is detected in our database
     """
     try:
-        # Extract domains from the URLs
-        domains = []
-        for url in urls:
-            parsed_url = urlparse(url)
-            domain = parsed_url.netloc
-            if domain:
-                domains.append(domain)
-        
-        # Check if any domain exists in the database
-        for domain in domains:
-            existing_record = await find_form_detection_by_domain(domain)
-            if existing_record:
-                return FormDetectionResponse(form=True)
-        
-        return FormDetectionResponse(form=False)
-        
+        return FormDetectionResponse(form=await any_domain_detected(urls))
     except Exception as e:
         logger.error(f"Error in URL domain checking API: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to check domains: {str(e)}")
@@ -62,25 +108,59 @@ async def blacklisted_domains(
         - form: Boolean value "false" if the domain is present in the database with form=false
     """
     try:
-        # Extract domain from the URL
-        url = request.url
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc
-        
-        if not domain:
-            logger.warning(f"Invalid URL provided: {url}")
-            return FormDetectionResponse(form=False)  # Default to true if we can't extract domain
-        
-        # Check if domain exists in the database
-        existing_record = await find_form_detection_by_domain(domain)
-        
-        # If domain exists and form is False, return form=False
-        if existing_record and existing_record.get("form") is False:
-            return FormDetectionResponse(form=False)
-        
-        # Otherwise return form=True (domain not blacklisted)
-        return FormDetectionResponse(form=True)
-        
+        # form=False when the domain is stored with form=False, otherwise not blacklisted
+        return FormDetectionResponse(form=not await is_false_positive(request.url))
+    except Exception as e:
+        logger.error(f"Error in blacklisted domain checking API: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to check domain: {str(e)}")
+
+
+@router.get("/form-detect", response_model=FormDetectionResponse)
+async def detect_form_from_urls_cached(
+    request: Request,
+    urls: List[str] = Query(..., alias="url")
+):
+    """Cacheable GET variant of POST /form-detect, URLs passed as repeated ?url= parameters"""
+    try:
+        content = FormDetectionResponse(form=await any_domain_detected(urls)).model_dump()
+    except Exception as e:
+        logger.error(f"Error in URL domain checking API: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to check domains: {str(e)}")
+    return cacheable_response(request, content, settings.DETECT_CACHE_MAX_AGE)
+
+
+@router.get("/false_positive_forms", response_model=FormDetectionResponse)
+async def blacklisted_domains_cached(
+    request: Request,
+    url: str = Query(...)
+):
+    """Cacheable GET variant of POST /false_positive_forms"""
+    try:
+        content = FormDetectionResponse(form=not await is_false_positive(url)).model_dump()
     except Exception as e:
         logger.error(f"Error in blacklisted domain checking API: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to check domain: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to check domain: {str(e)}")
+    return cacheable_response(request, content, settings.DETECT_CACHE_MAX_AGE)
+
+
+@router.get("/snapshot", response_model=DetectionSnapshotResponse)
+async def detection_snapshot(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0)
+):
+    """
+    Versioned list of the detection domains for local lookups in the extension.
+
+    Without `since` the full list is returned; with it, only the domains written
+    after that version (full=false), which the client merges into its copy
+    before storing the returned version. A domain counts as detected for
+    /form-detect when it is in either list, and as a false positive when it is
+    in false_positives.
+    """
+    try:
+        content = await get_detection_snapshot(since)
+    except Exception as e:
+        logger.error(f"Error building detection snapshot: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to build snapshot: {str(e)}")
+    etag = f'"{content["version"]}"' if content["full"] else f'"{since}-{content["version"]}"'
+    return cacheable_response(request, content, settings.SNAPSHOT_CACHE_MAX_AGE, etag=etag)
\ No newline at end of file
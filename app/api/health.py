@@ -0,0 +1,29 @@
+# app/api/health.py
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+
+from app.lifecycle import AppState
+from app.services.degradation import mode_name
+from app.services.jobs import JobQueue
+from app.services.llm_limiter import LLMLimiter
+
+router = APIRouter(default_response_class=ORJSONResponse)
+
+
+@router.get("/live")
+async def liveness():
+    """The process is up and serving the event loop"""
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness():
+    """The worker finished warm-up and is not shutting down"""
+    if not AppState.ready:
+        return ORJSONResponse(status_code=503, content={"status": "not ready"})
+    return {
+        "status": "ready",
+        "llm_inflight": LLMLimiter.inflight(),
+        "job_queue": JobQueue.depth(),
+        "degradation_mode": mode_name(),
+    }
@@ -0,0 +1,63 @@
+# app/api/jobs.py
+import logging
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
+
+from app.api.form import FormRequest, body_schema, parse_body
+from app.services.jobs import get_job, submit_form_job
+from app.settings import settings
+
+router = APIRouter(default_response_class=ORJSONResponse)
+logger = logging.getLogger(__name__)
+
+'''
+Job variant of POST /api/v1/form/{domain}. Submitting returns 202 with a job
+id right away; the result is fetched from GET /api/v1/jobs/{job_id}, which
+long-polls for up to `wait` seconds. A finished job carries the status_code
+and result (or error) the synchronous endpoint would have returned.
+'''
+
+JOB_FIELDS = ("job_id", "status", "domain", "created_at", "updated_at", "status_code", "result", "error")
+
+
+def job_content(job: dict) -> dict:
+    return {field: job[field] for field in JOB_FIELDS if field in job}
+
+
+@router.post("/form/{domain}", status_code=202, response_model=dict, openapi_extra=body_schema(FormRequest))
+async def submit_form_job_endpoint(
+    domain: str,
+    request: Request
+):
+    """Queue a form request for the background workers and return its job id"""
+    form_data = await parse_body(request, FormRequest)
+    if form_data.dom and len(form_data.dom) > settings.MAX_DOM_CHARS:
+        # Reject now rather than after the job was queued
+        raise HTTPException(status_code=413, detail=f"DOM exceeds {settings.MAX_DOM_CHARS} characters")
+
+    job = await submit_form_job(domain, {
+        "dom": form_data.dom,
+        "user_prompt": form_data.user_prompt,
+        "custom_command": form_data.custom_command,
+        "pipeline_mode": form_data.pipeline_mode,
+        "url": form_data.url,
+    })
+    logger.info(f"Queued form job {job['job_id']} for domain: {domain}")
+    status_url = request.url_for("get_job_endpoint", job_id=job["job_id"])
+    return ORJSONResponse(
+        status_code=202,
+        content={**job_content(job), "status_url": str(status_url)},
+        headers={"Location": str(status_url)}
+    )
+
+
+@router.get("/{job_id}", response_model=dict)
+async def get_job_endpoint(
+    job_id: str,
+    wait: float = Query(0, ge=0, description="Seconds to wait for the job to finish (long-poll)")
+):
+    """State of a job, waiting up to `wait` seconds (capped at JOB_MAX_WAIT_SECONDS) for it to finish"""
+    job = await get_job(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found or expired")
+    return ORJSONResponse(content=job_content(job))
@@ -0,0 +1,73 @@
+# app/lifecycle.py
+import asyncio
+import logging
+import signal
+import threading
+
+from app.mongodb import ensure_indexes, ping_database
+from app.services.gemini_prompt import warm_up_llm
+from app.services.token_budget import warm_up_token_counter
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# The tokenizer may have to be downloaded; don't hold up readiness for longer than this
+TOKEN_COUNTER_WARM_UP_TIMEOUT = 10
+
+
+class AppState:
+    """Readiness of this worker, separate from liveness"""
+    ready: bool = False
+    stopping: bool = False
+
+
+async def warm_up():
+    """
+    Prepare the worker before it is reported ready.
+
+    Steps:
+    1. Ping Mongo so the connection pool is established
+    2. Make sure the lookup indexes exist
+    3. Initialise the LLM provider and the tokenizer used for output budgets
+    """
+    await ping_database()
+    await ensure_indexes()
+    warm_up_llm()
+    try:
+        await asyncio.wait_for(asyncio.to_thread(warm_up_token_counter), TOKEN_COUNTER_WARM_UP_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Tokenizer is still loading, estimating token counts from length until it is ready")
+    AppState.ready = True
+    logger.info("Warm-up finished, worker is ready")
+
+
+def install_shutdown_signal_hook():
+    """
+    Report not-ready as soon as SIGTERM arrives and pass the signal on to
+    uvicorn SHUTDOWN_READINESS_DELAY seconds later.
+
+    uvicorn stops accepting connections when it handles SIGTERM and only runs
+    the lifespan shutdown once in-flight requests are done, so readiness has
+    to drop here for a load balancer to see it before the socket closes.
+    In-flight requests are then bounded by timeout_graceful_shutdown (see
+    app.server). Must run inside uvicorn's serve(), whose handler it wraps.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    previous = signal.getsignal(signal.SIGTERM)
+    if not callable(previous):
+        # Not served by uvicorn (tests, scripts), nothing to delay
+        return
+    loop = asyncio.get_running_loop()
+
+    def on_sigterm(sig, frame):
+        if AppState.stopping:
+            # A second SIGTERM skips the delay
+            previous(sig, frame)
+            return
+        AppState.stopping = True
+        AppState.ready = False
+        logger.info(f"SIGTERM received, reporting not ready for {settings.SHUTDOWN_READINESS_DELAY}s before shutting down")
+        loop.call_soon_threadsafe(loop.call_later, settings.SHUTDOWN_READINESS_DELAY, previous, sig, None)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
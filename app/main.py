@@ -1,17 +1,51 @@
 # app/main.py
-from app.mongodb import close_db_connection
+from contextlib import asynccontextmanager
+from app.mongodb import MongoDBClient, close_db_connection
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.form import router as form_router
 from app.api.form_detect import router as form_detect_router
+from app.api.health import router as health_router
+from app.api.jobs import router as jobs_router
+from app.lifecycle import install_shutdown_signal_hook, warm_up
 from app.settings import settings
+from app.services.cache_snapshot import start_cache_snapshots, stop_cache_snapshots
+from app.services.cpu_pool import start_cpu_pool, shutdown_cpu_pool
+from app.services.jobs import start_job_workers, stop_job_workers
+from app.services.traffic_capture import start_traffic_capture, stop_traffic_capture
+from app.services.write_behind import start_write_behind, stop_write_behind
 from app.logging_config import setup_logging, logger
+from app.middleware import BodySizeLimitMiddleware, TrafficCaptureMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
 
 # Set up logging
 setup_logging()
 
-app = FastAPI(title=settings.PROJECT_NAME)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the worker up before it takes traffic and stop its background work on the way out"""
+    logger.info("Starting up the FastAPI application.")
+    MongoDBClient.connect()
+    await start_cpu_pool()
+    await warm_up()
+    install_shutdown_signal_hook()
+    start_cache_snapshots()
+    start_write_behind()
+    start_job_workers()
+    start_traffic_capture()
+    yield
+    logger.info("Shutting down the FastAPI application.")
+    await stop_traffic_capture()
+    await stop_job_workers(settings.SHUTDOWN_DRAIN_TIMEOUT)
+    await stop_write_behind()
+    await stop_cache_snapshots()
+    await close_db_connection()
+    shutdown_cpu_pool()
+
+
+app = FastAPI(title=settings.PROJECT_NAME, default_response_class=ORJSONResponse, lifespan=lifespan)
 
 
 # Add CORS middleware
@@ -28,24 +62,20 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Sample requests for replay (a no-op unless TRAFFIC_CAPTURE_ENABLED)
+app.add_middleware(TrafficCaptureMiddleware)
+
+# Reject oversized bodies before any of it is buffered
+app.add_middleware(BodySizeLimitMiddleware)
+
 # Include the API routers
 app.include_router(form_router, prefix="/api/v1/form")
 app.include_router(form_detect_router, prefix="/api/v1/detect")
+app.include_router(jobs_router, prefix="/api/v1/jobs")
+app.include_router(health_router, prefix="/health")
 
 Instrumentator().instrument(app).expose(app)
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to the FastAPI application!"}
-
-
-# Optional: Log startup events
-@app.on_event("startup")
-async def startup_event():
-    logger.info("Starting up the FastAPI application.")
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    logger.info("Shutting down the FastAPI application.")
-    await close_db_connection()
@@ -0,0 +1,56 @@
+# app/metrics.py
+from prometheus_client import Counter, Gauge, Histogram
+
+'''
+Application metrics exposed on /metrics next to the HTTP metrics from
+prometheus_fastapi_instrumentator. Values are per worker process.
+'''
+
+MONGO_POOL_OPEN_CONNECTIONS = Gauge(
+    "mongo_pool_open_connections", "Open connections in the Mongo pool", ["address"]
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "mongo_pool_checked_out_connections", "Mongo connections currently in use", ["address"]
+)
+MONGO_POOL_WAITING = Gauge(
+    "mongo_pool_wait_queue", "Operations waiting for a free Mongo connection", ["address"]
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "mongo_pool_checkout_failures_total", "Failed Mongo connection checkouts", ["address", "reason"]
+)
+MONGO_POOL_MAX_SIZE = Gauge(
+    "mongo_pool_max_size", "Configured maximum size of the Mongo pool"
+)
+MONGO_OPERATION_SECONDS = Histogram(
+    "mongo_operation_seconds", "Latency of Mongo commands", ["command"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+MONGO_OPERATION_FAILURES = Counter(
+    "mongo_operation_failures_total", "Failed Mongo commands", ["command"]
+)
+
+FORM_WRITES_PENDING = Gauge(
+    "form_writes_pending", "Form mapping writes waiting in the write-behind queue"
+)
+FORM_WRITE_BATCH_SIZE = Histogram(
+    "form_write_batch_size", "Operations per write-behind bulk_write",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500),
+)
+FORM_WRITE_FAILURES = Counter(
+    "form_write_failures_total", "Form mapping writes that failed or were dropped", ["reason"]
+)
+
+LLM_CALL_SECONDS = Histogram(
+    "llm_call_seconds", "Latency of Gemini calls including the wait for a concurrency slot", ["stage"],
+    buckets=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0),
+)
+LLM_CALL_FAILURES = Counter(
+    "llm_call_failures_total", "Gemini calls that failed or timed out", ["stage"]
+)
+DEGRADATION_MODE = Gauge(
+    "pipeline_degradation_mode",
+    "Current pipeline mode: 0 full, 1 no LLM extraction, 2 reduced budget, 3 cached only"
+)
+DEGRADATION_TRANSITIONS = Counter(
+    "pipeline_degradation_transitions_total", "Pipeline mode changes", ["from_mode", "to_mode"]
+)
@@ -0,0 +1,161 @@
+# app/middleware.py
+import io
+import logging
+import mmap
+import tempfile
+import time
+
+import orjson
+from fastapi import HTTPException, Request
+from fastapi.responses import ORJSONResponse
+
+from app.services.traffic_capture import capture_offset, should_capture, submit_capture
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+'''
+Bounded request ingestion for the large DOM payloads the form endpoints accept.
+
+BodySizeLimitMiddleware rejects bodies over MAX_REQUEST_BYTES with a 413, from
+Content-Length before anything is read and while streaming for chunked
+uploads. read_spooled_json() writes a body into one buffer instead of a chunk
+list plus the joined copy, and moves it to a temporary file once it passes
+REQUEST_SPOOL_MAX_BYTES. orjson parses straight from the buffer, or from a
+read-only mmap of the file, so a spilled body is never copied into the heap:
+its bytes stay in the page cache and only the parsed payload is held. The raw
+bytes are released as soon as they are parsed rather than cached on the
+request.
+
+TrafficCaptureMiddleware records a sample of the API requests for replay, see
+app.services.traffic_capture.
+'''
+
+
+class RequestTooLarge(HTTPException):
+    """Raised while streaming a body past the limit, rendered as a 413 by the app"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(status_code=413, detail=f"Request body exceeds {max_bytes} bytes")
+
+
+class BodySizeLimitMiddleware:
+    def __init__(self, app, max_bytes: int = None):
+        self.app = app
+        self.max_bytes = max_bytes or settings.MAX_REQUEST_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope.get("headers") or []).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise RequestTooLarge(self.max_bytes)
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except RequestTooLarge:
+            if response_started:
+                raise
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope, receive, send):
+        logger.warning(f"Rejected request body over {self.max_bytes} bytes: {scope.get('path')}")
+        response = ORJSONResponse(
+            status_code=413,
+            content={"detail": f"Request body exceeds {self.max_bytes} bytes"}
+        )
+        await response(scope, receive, send)
+
+
+class TrafficCaptureMiddleware:
+    """Tee the body and outcome of sampled requests to the capture writer"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not should_capture(scope.get("path", "")):
+            await self.app(scope, receive, send)
+            return
+
+        record = {
+            "t": round(capture_offset(), 3),
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+        }
+        chunks = []
+        size = 0
+        started = time.monotonic()
+
+        async def teed_receive():
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request" and not record.get("body_dropped"):
+                body = message.get("body", b"")
+                size += len(body)
+                if size <= settings.TRAFFIC_CAPTURE_MAX_BODY_BYTES:
+                    chunks.append(body)
+                else:
+                    # Too large to keep around for capture, record the request without its body
+                    chunks.clear()
+                    record["body_dropped"] = True
+            return message
+
+        async def tracked_send(message):
+            if message["type"] == "http.response.start":
+                record["status"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, teed_receive, tracked_send)
+        finally:
+            record["duration"] = round(time.monotonic() - started, 4)
+            record.setdefault("status", 500)
+            submit_capture(record, None if record.get("body_dropped") else b"".join(chunks))
+
+
+async def read_spooled_json(request: Request):
+    """Parse a JSON request body read through a spooled buffer, see the module notes"""
+    buffer = io.BytesIO()
+    spilled = None
+    try:
+        async for chunk in request.stream():
+            if spilled is None and buffer.tell() + len(chunk) > settings.REQUEST_SPOOL_MAX_BYTES:
+                spilled = tempfile.TemporaryFile()
+                spilled.write(buffer.getbuffer())
+                buffer = io.BytesIO()
+            (spilled or buffer).write(chunk)
+        try:
+            if spilled is None:
+                with buffer.getbuffer() as body:
+                    return orjson.loads(body)
+            spilled.flush()
+            with mmap.mmap(spilled.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as body:
+                return orjson.loads(body)
+        except orjson.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {str(e)}")
+    finally:
+        if spilled is not None:
+            spilled.close()
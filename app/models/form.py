@@ -1,5 +1,9 @@
+from typing import Optional
 from pydantic import BaseModel
+from pymongo import UpdateOne
+from app.models.validation import require_type
 from app.mongodb import get_forms
+from app.services.url_template import template_prefixes
 
 
 class Form:
@@ -9,25 +13,28 @@ class Form:
         mapping: dict,
         parent_container: str,
         verified: bool = False,
+        path_template: Optional[str] = None,
     ):
-        # Type assertions for validation
-        assert isinstance(domain, str)
-        assert isinstance(mapping, dict)
-        assert isinstance(parent_container, str)
-        assert isinstance(verified, bool)
+        require_type("domain", domain, str)
+        require_type("mapping", mapping, dict)
+        require_type("parent_container", parent_container, str)
+        require_type("verified", verified, bool)
+        require_type("path_template", path_template, str, optional=True)
 
         self.document = {
             "domain": domain,
             "mapping": mapping,
             "parent_container": parent_container,
-            "verified": verified
+            "verified": verified,
+            # None for a domain-wide mapping
+            "path_template": path_template
         }
 
     async def save(self):
-        existing_form = await find_form_by_domain(
-            self.document["domain"]
-        )  # Ensure this function is async
-        if existing_form:
+        existing_form = await get_forms().find_one(
+            self._key(), projection={"_id": 1}
+        )  # Only checks for existence
+        if existing_form is not None:
             return existing_form
         else:
             await get_forms().insert_one(
@@ -35,12 +42,54 @@ class Form:
             )  # Uses the get_forms function imported at the top
         return self.document
 
-async def find_form_by_domain(domain: str):
+    async def replace(self):
+        """Overwrite the stored mapping for the domain and path, used when it was re-detected"""
+        await get_forms().update_one(
+            self._key(),
+            {"$set": self.document},
+            upsert=True
+        )
+        return self.document
+
+    def write_operation(self, replace: bool = False) -> UpdateOne:
+        """
+        save() (insert unless present) or replace() as one upsert for bulk_write,
+        without the existence check round trip.
+        """
+        operator = "$set" if replace else "$setOnInsert"
+        return UpdateOne(self._key(), {operator: self.document}, upsert=True)
+
+    def _key(self) -> dict:
+        return {"domain": self.document["domain"], "path_template": self.document["path_template"]}
+
+FORM_PROJECTION = {"_id": 0, "domain": 1, "mapping": 1, "parent_container": 1, "verified": 1, "path_template": 1}
+
+
+async def find_form_by_domain(domain: str, projection: dict = None):
     """
     Helper function to find a form by domain
+
+    Only the fields in projection are fetched, defaults to the public form fields.
     """
     forms_collection = get_forms()
-    return await forms_collection.find_one({"domain": domain})
+    return await forms_collection.find_one({"domain": domain}, projection or FORM_PROJECTION)
+
+
+async def find_form_by_path(domain: str, path_template: Optional[str], projection: dict = None):
+    """
+    Find the most specific form for a domain and URL path template.
+
+    Mappings stored for the template itself or any parent path are candidates,
+    as are domain-wide mappings (no path_template, including those stored
+    before forms were indexed by path). The longest matching template wins.
+    """
+    prefixes = template_prefixes(path_template)
+    projection = {**(projection or FORM_PROJECTION), "path_template": 1}
+    cursor = get_forms().find({"domain": domain, "path_template": {"$in": prefixes + [None]}}, projection)
+    candidates = await cursor.to_list(length=None)
+    if not candidates:
+        return None
+    return max(candidates, key=lambda form: len(form.get("path_template") or ""))
 
 class CreateFormRequest(BaseModel):
     domain: str
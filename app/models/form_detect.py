@@ -1,5 +1,26 @@
+from typing import List, Optional
 from pydantic import BaseModel
-from app.mongodb import get_database
+from pymongo import ReturnDocument
+from app.models.validation import require_type
+from app.mongodb import get_collection, get_db_cache
+
+# Counter document in the counters collection that versions the detection list
+DETECTION_VERSION_COUNTER = "form_detections"
+
+'''
+Form detection records, one per domain, and the versioned snapshot of them.
+
+No endpoint of this service writes detections: they are maintained by
+external writers (the admin tooling and data imports) through
+FormDetectionModel.save(), the API only reads them.
+
+Versions are two numbers on the counter document: "seq" hands out a version
+to every write and "committed" is the highest version whose record has been
+written. Snapshots report "committed", so a client never holds a version
+whose record wasn't there yet when it asked. This assumes one writer at a
+time: with concurrent writers, a later version finishing first would publish
+past an earlier one still being written.
+'''
 
 
 class FormDetectionModel:
@@ -11,12 +32,11 @@ class FormDetectionModel:
         iframe: str,
         form: bool,
     ):
-        # Type assertions for validation
-        assert isinstance(url, str)
-        assert isinstance(provider, bool)
-        assert isinstance(domain, str)
-        assert isinstance(iframe, str)
-        assert isinstance(form, bool)
+        require_type("url", url, str)
+        require_type("provider", provider, bool)
+        require_type("domain", domain, str)
+        require_type("iframe", iframe, str)
+        require_type("form", form, bool)
 
         self.document = {
             "url": url,
@@ -27,8 +47,11 @@ class FormDetectionModel:
         }
 
     async def save(self):
+        # Every write gets the next version so snapshot clients can fetch deltas,
+        # the version is published (committed) only once the record is written
+        self.document["version"] = await next_detection_version()
         existing_record = await find_form_detection_by_domain(
-            self.document["domain"]
+            self.document["domain"], projection={"_id": 1}
         )
         if existing_record:
             form_detections = get_form_detections()
@@ -36,23 +59,85 @@ class FormDetectionModel:
                 {"domain": self.document["domain"]},
                 {"$set": self.document}
             )
-            return self.document
         else:
             await get_form_detections().insert_one(
                 self.document
             )
+        await commit_detection_version(self.document["version"])
         return self.document
 
-async def find_form_detection_by_domain(domain: str):
+async def find_form_detection_by_domain(domain: str, projection: dict = None):
     """
     Helper function to find a form detection record by domain
+
+    The detection endpoints only read the form flag, so that is all we fetch by default,
+    with the domain so a record stored without a form flag isn't an empty, falsy dict.
     """
     form_detections = get_form_detections()
-    return await form_detections.find_one({"domain": domain})
+    return await form_detections.find_one({"domain": domain}, projection or {"_id": 0, "domain": 1, "form": 1})
 
 def get_form_detections():
-    db = get_database()
-    return db["form_detections"]
+    return get_collection("form_detections")
+
+async def next_detection_version() -> int:
+    counter = await get_collection("counters").find_one_and_update(
+        {"_id": DETECTION_VERSION_COUNTER},
+        {"$inc": {"seq": 1}, "$setOnInsert": {"committed": 0}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+async def commit_detection_version(version: int) -> None:
+    await get_collection("counters").update_one(
+        {"_id": DETECTION_VERSION_COUNTER},
+        {"$max": {"committed": version}}
+    )
+
+async def current_detection_version() -> int:
+    """The highest version whose record is written, counters from before "committed" existed use seq"""
+    counter = await get_collection("counters").find_one({"_id": DETECTION_VERSION_COUNTER})
+    if not counter:
+        return 0
+    return counter.get("committed", counter["seq"])
+
+async def get_detection_snapshot(since: Optional[int] = None) -> dict:
+    """
+    The detection domain list at the current version, or the changes after `since`.
+
+    Full snapshots are cached per version, so only the counter is read while
+    nothing has changed. Records written before versioning existed have no
+    version and are only part of full snapshots. A `since` ahead of the
+    current version (e.g. after the counter was reset) gets a full snapshot.
+    """
+    version = await current_detection_version()
+    full = since is None or since > version
+    if not full and since == version:
+        return _snapshot_payload(version, False, [])
+
+    cache = get_db_cache()
+    cache_key = f"detection_snapshot:{version}"
+    if full:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    query = {} if full else {"version": {"$gt": since}}
+    cursor = get_form_detections().find(query, {"_id": 0, "domain": 1, "form": 1})
+    records = await cursor.to_list(length=None)
+    payload = _snapshot_payload(version, full, records)
+    if full:
+        cache.set(cache_key, payload)
+    return payload
+
+def _snapshot_payload(version: int, full: bool, records: List[dict]) -> dict:
+    # Two sorted domain lists are far smaller than a list of records
+    return {
+        "version": version,
+        "full": full,
+        "forms": sorted(record["domain"] for record in records if record.get("form") is not False),
+        "false_positives": sorted(record["domain"] for record in records if record.get("form") is False),
+    }
 
 class FormDetectionRequest(BaseModel):
     url: str
@@ -60,4 +145,10 @@ class FormDetectionRequest(BaseModel):
     iframe: bool
 
 class FormDetectionResponse(BaseModel):
-    form: bool
\ No newline at end of file
+    form: bool
+
+class DetectionSnapshotResponse(BaseModel):
+    version: int
+    full: bool
+    forms: List[str]
+    false_positives: List[str]
\ No newline at end of file
@@ -0,0 +1,116 @@
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+'''
+The form element record passed between the extractors, the Gemini calls and
+the fill step.
+
+FormElement is a slotted class rather than a dict: a few hundred elements per
+form are created, copied and re-serialized on every request, and slots take a
+fraction of a dict's memory. Elements are decoded from Gemini answers and
+encoded for prompts and responses with orjson in a single pass; only the
+public shape ({"querySelectorInput", "label", optional "value" and "options"})
+ever leaves the pipeline.
+'''
+
+
+class FormElement:
+    __slots__ = ("querySelectorInput", "label", "value", "options")
+
+    def __init__(
+        self,
+        querySelectorInput: str,
+        label: str = "",
+        value: Optional[str] = None,
+        options: Optional[List[str]] = None,
+    ):
+        self.querySelectorInput = querySelectorInput
+        self.label = label
+        self.value = value
+        self.options = options
+
+    @classmethod
+    def from_dict(cls, item: Any) -> "FormElement":
+        """Validate one decoded element, raises TypeError when it doesn't have the element shape"""
+        if not isinstance(item, dict):
+            raise TypeError(f"form element must be an object, got {type(item).__name__}")
+        selector = item.get("querySelectorInput")
+        if not isinstance(selector, str) or not selector:
+            raise TypeError("form element needs a querySelectorInput string")
+        label = item.get("label")
+        value = item.get("value")
+        options = item.get("options")
+        if options is not None and (
+            not isinstance(options, list) or not all(isinstance(option, str) for option in options)
+        ):
+            raise TypeError("form element options must be a list of strings")
+        return cls(
+            selector,
+            label if isinstance(label, str) else "" if label is None else str(label),
+            # Gemini occasionally answers numbers or booleans for text fields
+            value if value is None or isinstance(value, str) else str(value),
+            options or None,
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        element = {"querySelectorInput": self.querySelectorInput, "label": self.label}
+        if self.value is not None:
+            element["value"] = self.value
+        if self.options:
+            element["options"] = self.options
+        return element
+
+    def with_value(self, value: Optional[str]) -> "FormElement":
+        return FormElement(self.querySelectorInput, self.label, value, self.options)
+
+    def __eq__(self, other):
+        if not isinstance(other, FormElement):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        return f"FormElement({self.as_dict()!r})"
+
+
+def parse_elements(raw: Union[bytes, str, Iterable[Any], None]) -> List[FormElement]:
+    """
+    Decode (if needed) and validate a list of elements in one pass.
+
+    Items that aren't elements are dropped rather than failing the whole list,
+    Gemini answers sometimes contain a stray string or an object without a
+    selector.
+    """
+    if raw is None:
+        return []
+    if isinstance(raw, (bytes, bytearray, memoryview, str)):
+        raw = orjson.loads(raw)
+    if not isinstance(raw, list):
+        raise TypeError(f"form elements must be a list, got {type(raw).__name__}")
+
+    elements = []
+    dropped = 0
+    for item in raw:
+        if isinstance(item, FormElement):
+            elements.append(item)
+            continue
+        try:
+            elements.append(FormElement.from_dict(item))
+        except TypeError:
+            dropped += 1
+    if dropped:
+        logger.warning(f"Dropped {dropped} malformed form elements")
+    return elements
+
+
+def dump_elements(elements: Iterable[FormElement]) -> str:
+    """Elements as a JSON array string, the prompt format of the extraction and fill calls"""
+    return orjson.dumps([element.as_dict() for element in elements]).decode()
+
+
+def elements_to_dicts(elements: Iterable[FormElement]) -> List[Dict[str, Any]]:
+    """The public shape, for responses and anything stored in Mongo"""
+    return [element.as_dict() for element in elements]
@@ -0,0 +1,15 @@
+from typing import Any, Tuple, Type, Union
+
+
+def require_type(name: str, value: Any, expected: Union[Type, Tuple[Type, ...]], optional: bool = False) -> None:
+    """
+    Raise TypeError unless value is an instance of expected (or None when optional).
+
+    Used instead of assert in the document constructors, asserts are stripped
+    under python -O and malformed documents would be written unchecked.
+    """
+    if value is None and optional:
+        return
+    if not isinstance(value, expected):
+        expected_names = " or ".join(t.__name__ for t in (expected if isinstance(expected, tuple) else (expected,)))
+        raise TypeError(f"{name} must be {expected_names}, got {type(value).__name__}")
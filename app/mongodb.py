@@ -1,6 +1,16 @@
 # app/mongodb.py
 import motor.motor_asyncio  # type: ignore
 import time
+from pymongo import monitoring
+from app.metrics import (
+    MONGO_OPERATION_FAILURES,
+    MONGO_OPERATION_SECONDS,
+    MONGO_POOL_CHECKED_OUT,
+    MONGO_POOL_CHECKOUT_FAILURES,
+    MONGO_POOL_MAX_SIZE,
+    MONGO_POOL_OPEN_CONNECTIONS,
+    MONGO_POOL_WAITING,
+)
 from app.settings import settings
 
 class SimpleCache:
@@ -10,12 +20,17 @@ class SimpleCache:
         self.ttl = ttl  # Time-to-live in seconds
 
     def purge(self):
-        print("purging")
-        for key, data in self.cache.items():
-            if time.time() - data['time'] > self.ttl:
+        # Collect first, popping while iterating the dict raises RuntimeError
+        now = time.time()
+        expired = [key for key, data in self.cache.items() if now - data['time'] > self.ttl]
+        for key in expired:
+            self.cache.pop(key, None)
+        # Still over the limit with nothing expired: drop the oldest entries
+        if len(self.cache) > self.limit:
+            oldest = sorted(self.cache, key=lambda key: self.cache[key]['time'])
+            for key in oldest[:len(self.cache) - self.limit]:
                 self.cache.pop(key, None)
 
-
     def get(self, key):
         data = self.cache.get(key)
         if data and (time.time() - data['time'] < self.ttl):
@@ -29,17 +44,125 @@ class SimpleCache:
         if len(self.cache) > self.limit:
             self.purge()
 
+    def delete(self, key):
+        self.cache.pop(key, None)
+
+    def entries(self):
+        """Unexpired (key, value, time) entries, for snapshots"""
+        now = time.time()
+        return [(key, data['value'], data['time']) for key, data in self.cache.items() if now - data['time'] < self.ttl]
+
+    def restore(self, key, value, stored_at):
+        """Load an entry from a snapshot, keeping its original age"""
+        if time.time() - stored_at >= self.ttl or key in self.cache:
+            return False
+        self.cache[key] = {'value': value, 'time': stored_at}
+        return True
+
+
+def _address(event):
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Publishes pool usage so the pool can be sized against the LLM concurrency"""
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        MONGO_POOL_OPEN_CONNECTIONS.labels(_address(event)).set(0)
+        MONGO_POOL_CHECKED_OUT.labels(_address(event)).set(0)
+
+    def connection_created(self, event):
+        MONGO_POOL_OPEN_CONNECTIONS.labels(_address(event)).inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_OPEN_CONNECTIONS.labels(_address(event)).dec()
+
+    def connection_check_out_started(self, event):
+        MONGO_POOL_WAITING.labels(_address(event)).inc()
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_WAITING.labels(_address(event)).dec()
+        MONGO_POOL_CHECKOUT_FAILURES.labels(_address(event), str(event.reason)).inc()
+
+    def connection_checked_out(self, event):
+        MONGO_POOL_WAITING.labels(_address(event)).dec()
+        MONGO_POOL_CHECKED_OUT.labels(_address(event)).inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.labels(_address(event)).dec()
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Records the latency of every Mongo command by command name"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_OPERATION_SECONDS.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_OPERATION_SECONDS.labels(event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_OPERATION_FAILURES.labels(event.command_name).inc()
+
 
 class MongoDBClient:
     _client = None
+    _database = None
+    _collections = {}
     _cache = None
 
     @classmethod
-    def get_client(cls):
+    def connect(cls):
+        """Create the client with the configured pool settings, called from the app lifespan"""
         if cls._client is None:
-            cls._client = motor.motor_asyncio.AsyncIOMotorClient(settings.DB_URL)
+            cls._client = motor.motor_asyncio.AsyncIOMotorClient(
+                settings.DB_URL,
+                maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+                minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+                waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+                readPreference=settings.MONGO_READ_PREFERENCE,
+                event_listeners=[PoolMetricsListener(), CommandMetricsListener()],
+            )
+            MONGO_POOL_MAX_SIZE.set(settings.MONGO_MAX_POOL_SIZE)
         return cls._client
 
+    @classmethod
+    def get_client(cls):
+        # Scripts and tests that don't run the lifespan still get a client on first use
+        return cls.connect()
+
+    @classmethod
+    def get_database(cls):
+        if cls._database is None:
+            cls._database = cls.get_client()[settings.DB_NAME]
+        return cls._database
+
+    @classmethod
+    def get_collection(cls, name: str):
+        collection = cls._collections.get(name)
+        if collection is None:
+            collection = cls.get_database()[name]
+            cls._collections[name] = collection
+        return collection
+
     @classmethod
     def get_cache(cls):
         if cls._cache is None:
@@ -50,12 +173,27 @@ def get_db_cache():
     return MongoDBClient.get_cache()
 
 def get_database():
-    client = MongoDBClient.get_client()
-    return client[settings.DB_NAME]
+    return MongoDBClient.get_database()
+
+def get_collection(name: str):
+    return MongoDBClient.get_collection(name)
 
 def get_forms():
-    db = get_database()
-    return db["forms"]
+    return MongoDBClient.get_collection("forms")
+
+
+async def ping_database():
+    await get_database().command("ping")
+
+
+async def ensure_indexes():
+    """Create the indexes the lookups rely on, a no-op when they already exist"""
+    # Serves both domain-only queries and the per-path lookup in find_form_by_path
+    await get_collection("forms").create_index([("domain", 1), ("path_template", 1)])
+    await get_collection("form_detections").create_index("domain")
+    await get_collection("form_detections").create_index("version")
+    # Finished and abandoned jobs are removed by Mongo once expires_at has passed
+    await get_collection("jobs").create_index("expires_at", expireAfterSeconds=0)
 
 
 async def close_db_connection():
@@ -65,5 +203,7 @@ async def close_db_connection():
     if MongoDBClient._client is not None:
         MongoDBClient._client.close()
         MongoDBClient._client = None
+        MongoDBClient._database = None
+        MongoDBClient._collections = {}
     else:
         print("MongoDB client is not initialized.")
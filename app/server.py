@@ -0,0 +1,47 @@
+# app/server.py
+"""
+Production entry point: python -m app.server
+
+Runs uvicorn without file watching, with one worker per available CPU unless
+WEB_CONCURRENCY is set, and with uvloop/httptools when they are installed.
+"""
+import importlib.util
+import os
+
+import uvicorn
+
+from app.services.cpu_pool import available_cpus
+from app.settings import settings
+
+
+def worker_count() -> int:
+    if settings.WEB_CONCURRENCY > 0:
+        return settings.WEB_CONCURRENCY
+    return available_cpus()
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def main():
+    workers = worker_count()
+    # Worker processes read this to size their own CPU pools
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
+    uvicorn.run(
+        "app.main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=workers,
+        loop="uvloop" if _installed("uvloop") else "asyncio",
+        http="httptools" if _installed("httptools") else "h11",
+        proxy_headers=True,
+        # How long in-flight requests (and their LLM calls) get to finish once the
+        # worker stops accepting connections, after SHUTDOWN_READINESS_DELAY
+        timeout_graceful_shutdown=int(settings.SHUTDOWN_DRAIN_TIMEOUT) + 5,
+    )
+
+
+if __name__ == "__main__":
+    main()
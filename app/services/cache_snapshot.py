@@ -0,0 +1,127 @@
+# app/services/cache_snapshot.py
+import asyncio
+import logging
+import mmap
+import os
+import time
+from typing import Dict, Tuple
+
+import orjson
+
+from app.services.caches import Caches
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+'''
+Snapshots of the in-process caches, so a restarted or newly scaled worker
+serves cache hits right away instead of re-warming them with Mongo reads and
+Gemini calls.
+
+The snapshot is a single orjson file written atomically (temporary file and
+os.replace) every CACHE_SNAPSHOT_INTERVAL seconds and on shutdown. At startup
+it is memory-mapped and decoded in one pass. A file written by another
+snapshot format, or older than CACHE_SNAPSHOT_MAX_AGE, is ignored; entries
+keep their original age, so each cache's own TTL still applies.
+'''
+
+SNAPSHOT_FORMAT = 1
+
+
+class CacheSnapshotter:
+    _task = None
+
+
+def _snapshot_bytes() -> Tuple[bytes, int]:
+    caches = {name: Caches.get(name).entries() for name in Caches.names()}
+    payload = orjson.dumps(
+        {"format": SNAPSHOT_FORMAT, "written_at": time.time(), "caches": caches},
+        default=str
+    )
+    return payload, sum(len(entries) for entries in caches.values())
+
+
+def _write_file(path: str, payload: bytes) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Workers share the path, each writes its own temporary file
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as snapshot_file:
+        snapshot_file.write(payload)
+    os.replace(temporary, path)
+
+
+def _read_file(path: str) -> Dict:
+    with open(path, "rb") as snapshot_file:
+        with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                return orjson.loads(view)
+
+
+async def write_snapshot() -> int:
+    """Write the current caches to CACHE_SNAPSHOT_PATH, returns the number of entries"""
+    payload, count = _snapshot_bytes()
+    await asyncio.to_thread(_write_file, settings.CACHE_SNAPSHOT_PATH, payload)
+    return count
+
+
+def load_snapshot() -> int:
+    """Restore the caches from CACHE_SNAPSHOT_PATH, returns the number of entries restored"""
+    path = settings.CACHE_SNAPSHOT_PATH
+    if not path or not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+    try:
+        snapshot = _read_file(path)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable cache snapshot {path}: {str(e)}")
+        return 0
+
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        logger.info(f"Ignoring cache snapshot {path} in format {snapshot.get('format')}")
+        return 0
+    age = time.time() - snapshot.get("written_at", 0)
+    if age > settings.CACHE_SNAPSHOT_MAX_AGE:
+        logger.info(f"Ignoring cache snapshot {path}, written {int(age)}s ago")
+        return 0
+
+    restored = 0
+    for name, entries in (snapshot.get("caches") or {}).items():
+        if name not in Caches.names():
+            continue
+        cache = Caches.get(name)
+        for key, value, stored_at in entries:
+            restored += cache.restore(key, value, stored_at)
+    logger.info(f"Restored {restored} cache entries from {path}")
+    return restored
+
+
+async def _snapshot_loop() -> None:
+    while True:
+        await asyncio.sleep(settings.CACHE_SNAPSHOT_INTERVAL)
+        try:
+            await write_snapshot()
+        except Exception as e:
+            logger.warning(f"Cache snapshot failed: {str(e)}")
+
+
+def start_cache_snapshots() -> None:
+    """Restore the last snapshot and start writing new ones"""
+    if not settings.CACHE_SNAPSHOT_PATH or CacheSnapshotter._task is not None:
+        return
+    load_snapshot()
+    CacheSnapshotter._task = asyncio.create_task(_snapshot_loop())
+
+
+async def stop_cache_snapshots() -> None:
+    """Stop the periodic snapshots and write a final one for the next worker"""
+    task, CacheSnapshotter._task = CacheSnapshotter._task, None
+    if task is None:
+        return
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    try:
+        count = await write_snapshot()
+        logger.info(f"Wrote {count} cache entries to {settings.CACHE_SNAPSHOT_PATH}")
+    except Exception as e:
+        logger.warning(f"Final cache snapshot failed: {str(e)}")
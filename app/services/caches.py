@@ -0,0 +1,85 @@
+# app/services/caches.py
+import hashlib
+import logging
+import re
+from typing import Dict, Optional
+
+from app.models.form_detect import find_form_detection_by_domain
+from app.mongodb import SimpleCache, get_db_cache
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+'''
+In-process caches in front of Mongo and Gemini. All of them are SimpleCache
+instances so cache_snapshot can save and restore them across restarts.
+
+- mappings: form mapping per (domain, requested path template), including
+  mappings this worker just detected
+- detections: form flag of the form_detections record (or its absence) per
+  domain
+- widget_selectors: container selector Gemini detected per page structure
+  fingerprint, so a page with a known structure skips widget detection
+- db: the generic cache from app.mongodb (detection snapshots)
+'''
+
+TAG_WITH_CLASS = re.compile(r'<([a-zA-Z][\w-]*)(?:[^>]*?\sclass="([^"]*)")?')
+
+
+class Caches:
+    _caches = {}
+
+    @classmethod
+    def get(cls, name: str) -> SimpleCache:
+        cache = cls._caches.get(name)
+        if cache is None:
+            if name == "db":
+                cache = get_db_cache()
+            else:
+                ttl, limit = {
+                    "mappings": (settings.MAPPING_CACHE_TTL, settings.MAPPING_CACHE_SIZE),
+                    "detections": (settings.DETECTION_CACHE_TTL, settings.DETECTION_CACHE_SIZE),
+                    "widget_selectors": (settings.WIDGET_CACHE_TTL, settings.WIDGET_CACHE_SIZE),
+                }[name]
+                cache = SimpleCache(ttl=ttl, limit=limit)
+            cls._caches[name] = cache
+        return cache
+
+    @classmethod
+    def names(cls):
+        return ["mappings", "detections", "widget_selectors", "db"]
+
+
+def _mapping_key(domain: str, path_template: Optional[str]) -> str:
+    return f"{domain}|{path_template or ''}"
+
+
+def cached_mapping(domain: str, path_template: Optional[str]) -> Optional[Dict]:
+    """The mapping last used for this exact domain and path template"""
+    return Caches.get("mappings").get(_mapping_key(domain, path_template))
+
+
+def cache_mapping(domain: str, path_template: Optional[str], mapping: Dict) -> None:
+    Caches.get("mappings").set(_mapping_key(domain, path_template), {"mapping": mapping})
+
+
+def forget_mapping(domain: str, path_template: Optional[str]) -> None:
+    Caches.get("mappings").delete(_mapping_key(domain, path_template))
+
+
+async def find_detection_cached(domain: str) -> Optional[Dict]:
+    """find_form_detection_by_domain() through the detections cache, misses are cached too"""
+    cache = Caches.get("detections")
+    cached = cache.get(domain)
+    if cached is None:
+        cached = {"record": await find_form_detection_by_domain(domain)}
+        cache.set(domain, cached)
+    return cached["record"]
+
+
+def structure_fingerprint(html: str) -> str:
+    """Hash of the tag and class sequence of a page, independent of its text"""
+    digest = hashlib.sha1()
+    for tag, classes in TAG_WITH_CLASS.findall(html or ""):
+        digest.update(f"{tag.lower()}.{classes}|".encode())
+    return digest.hexdigest()
@@ -2,6 +2,20 @@
 import re
 from bs4 import BeautifulSoup
 
+
+def release_soup(soup: BeautifulSoup) -> None:
+    """
+    Free a parsed tree immediately.
+
+    Tags reference their parents and siblings, so a tree is only reclaimed by the
+    cyclic GC, long after the request that parsed it. Decomposing the top-level
+    children breaks the cycles. (BeautifulSoup.decompose() on the root object
+    itself leaves the tree intact.)
+    """
+    for child in list(soup.contents):
+        child.decompose()
+
+
 def clean_html(html: str) -> str:
     """
     Clean HTML by removing unnecessary elements and attributes
@@ -31,24 +45,13 @@ def clean_html(html: str) -> str:
         for comment in soup.find_all(text=lambda text: isinstance(text, (str, bytes)) and text.strip().startswith('<!--')):
             comment.extract()
         
-        # Remove data-* attributes that aren't necessary for form identification
-        for tag in soup.find_all(True):
-            attrs_to_remove = [attr for attr in tag.attrs if attr.startswith('data-') and 
-                              attr not in ['data-id', 'data-name', 'data-field', 'data-label']]
-            for attr in attrs_to_remove:
-                del tag[attr]
-            
-            # Also remove event handlers
-            event_attrs = [attr for attr in tag.attrs if attr.startswith('on')]
-            for attr in event_attrs:
-                del tag[attr]
-        
         # Retain only the necessary attributes for form processing
         allowed_attrs = {
-            'input': ['type', 'name', 'id', 'placeholder', 'value', 'required', 'class', 'aria-label'],
-            'select': ['name', 'id', 'multiple', 'required', 'class', 'aria-label'],
-            'textarea': ['name', 'id', 'placeholder', 'required', 'class', 'aria-label'],
-            'label': ['for', 'class'],
+            # aria-labelledby (and the ids it points at) is how dom_utils labels inputs without <label for>
+            'input': ['type', 'name', 'id', 'placeholder', 'value', 'required', 'class', 'aria-label', 'aria-labelledby'],
+            'select': ['name', 'id', 'multiple', 'required', 'class', 'aria-label', 'aria-labelledby'],
+            'textarea': ['name', 'id', 'placeholder', 'required', 'class', 'aria-label', 'aria-labelledby'],
+            'label': ['for', 'class', 'id'],
             'form': ['id', 'name', 'class', 'action', 'method'],
             'option': ['value', 'selected'],
             'button': ['type', 'class', 'id'],
@@ -63,12 +66,25 @@ def clean_html(html: str) -> str:
             'p': ['class', 'id'],
         }
         
-        for tag in soup.find_all():
+        # One pass over the tags instead of one per attribute rule
+        for tag in soup.find_all(True):
             if tag.name in allowed_attrs:
                 tag.attrs = {attr: value for attr, value in tag.attrs.items() if attr in allowed_attrs[tag.name]}
+                continue
+
+            # Remove data-* attributes that aren't necessary for form identification
+            attrs_to_remove = [attr for attr in tag.attrs if attr.startswith('data-') and 
+                              attr not in ['data-id', 'data-name', 'data-field', 'data-label']]
+            # Also remove event handlers
+            attrs_to_remove += [attr for attr in tag.attrs if attr.startswith('on')]
+            for attr in attrs_to_remove:
+                del tag[attr]
         
-        # Convert the soup back to a string
+        # Convert the soup back to a string, then free the tree before the regex
+        # pass makes another copy of the document
         cleaned_html = str(soup)
+        release_soup(soup)
+        del soup
         
         # Remove empty lines
         cleaned_html = re.sub(r'^\s*$', '', cleaned_html, flags=re.MULTILINE)
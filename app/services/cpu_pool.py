@@ -0,0 +1,123 @@
+# app/services/cpu_pool.py
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+'''
+Process pool for the CPU-bound HTML stages (clean_html, DOM extraction,
+site extractors).
+
+BeautifulSoup holds the GIL for the whole parse, so running it inside a route
+handler blocks the event loop for every other request. Large DOMs are shipped
+to a pool of warm worker processes instead, which also lets a single API worker
+use more than one core. Small DOMs parse in a few milliseconds and stay inline,
+where the pickling round trip would cost more than it saves.
+'''
+
+
+def available_cpus() -> int:
+    """CPUs this process may actually use, honouring affinity and cgroup v2 quotas"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def _warm_worker():
+    # Import and exercise the parser once so the first real task doesn't pay for it
+    from bs4 import BeautifulSoup
+    BeautifulSoup("<form><input name='warm'></form>", 'html.parser')
+    return os.getpid()
+
+
+class CPUPool:
+    _executor = None
+    _slots = None
+
+    @classmethod
+    def worker_count(cls) -> int:
+        if settings.CPU_POOL_WORKERS > 0:
+            return settings.CPU_POOL_WORKERS
+        # Share the cores with the other API workers started by app.server
+        web_workers = max(1, settings.WEB_CONCURRENCY)
+        return max(1, min(4, available_cpus() // web_workers))
+
+    @classmethod
+    def get_executor(cls) -> ProcessPoolExecutor:
+        if cls._executor is None:
+            # spawn keeps the Mongo client threads and the event loop out of the workers
+            cls._executor = ProcessPoolExecutor(
+                max_workers=cls.worker_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+            )
+        return cls._executor
+
+    @classmethod
+    def get_slots(cls) -> asyncio.Semaphore:
+        # Bounds the number of tasks queued on the pool; callers wait for a free slot
+        if cls._slots is None:
+            cls._slots = asyncio.Semaphore(settings.CPU_POOL_MAX_PENDING)
+        return cls._slots
+
+
+def _payload_size(args) -> int:
+    return sum(len(arg) for arg in args if isinstance(arg, str))
+
+
+async def run_cpu_bound(func, *args):
+    """
+    Run a CPU-bound function on the process pool, or inline for small payloads.
+
+    func must be a module level function so it can be pickled to the worker.
+    Falls back to running inline if the pool is disabled or broken.
+    """
+    if not settings.CPU_POOL_ENABLED or _payload_size(args) <= settings.CPU_POOL_INLINE_MAX_BYTES:
+        return func(*args)
+
+    loop = asyncio.get_running_loop()
+    async with CPUPool.get_slots():
+        try:
+            return await loop.run_in_executor(CPUPool.get_executor(), functools.partial(func, *args))
+        except BrokenProcessPool:
+            logger.error(f"CPU pool is broken, running {func.__name__} inline")
+            shutdown_cpu_pool()
+            return func(*args)
+
+
+async def start_cpu_pool():
+    """Spawn and warm every worker before traffic arrives"""
+    if not settings.CPU_POOL_ENABLED:
+        return
+    loop = asyncio.get_running_loop()
+    executor = CPUPool.get_executor()
+    try:
+        pids = await asyncio.gather(*[
+            loop.run_in_executor(executor, _warm_worker) for _ in range(CPUPool.worker_count())
+        ])
+        logger.info(f"CPU pool started with {len(set(pids))} warm workers")
+    except BrokenProcessPool as e:
+        logger.error(f"Failed to start CPU pool: {str(e)}")
+        shutdown_cpu_pool()
+
+
+def shutdown_cpu_pool():
+    if CPUPool._executor is not None:
+        CPUPool._executor.shutdown(wait=False, cancel_futures=True)
+        CPUPool._executor = None
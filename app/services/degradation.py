@@ -0,0 +1,151 @@
+# app/services/degradation.py
+import logging
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from app.metrics import DEGRADATION_MODE, DEGRADATION_TRANSITIONS, LLM_CALL_FAILURES, LLM_CALL_SECONDS
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+'''
+SLO-aware degradation of the form pipeline.
+
+Every Gemini call records its latency and outcome under its stage (widget
+detection, extraction, fill, combined). The controller keeps a rolling
+DEGRADATION_WINDOW_SECONDS window per stage and compares it with the SLO:
+the budget burn of a stage is the larger of its latency percentile over
+DEGRADATION_LATENCY_SLO and its error rate over DEGRADATION_ERROR_RATE_SLO.
+
+When the worst stage burns more than its budget (> 1) the pipeline steps one
+mode down, at most every DEGRADATION_STEP_SECONDS:
+
+FULL               every stage as usual
+NO_LLM_EXTRACTION  forms are extracted by the site extractors and dom_utils,
+                   Gemini only fills values
+REDUCED_BUDGET     fills get a smaller output budget, no repair rounds and a
+                   hard timeout (DEGRADATION_LLM_TIMEOUT)
+CACHED_ONLY        no Gemini calls, stored mappings and deterministic
+                   extraction and profile prefill only
+
+It steps back up one mode once the burn is below DEGRADATION_RECOVER_RATIO
+and the current mode has been held for DEGRADATION_HOLD_SECONDS. Both
+decisions only look at calls started since the last transition, so the slow
+calls that caused a step can't cause the next one before it took effect. Stages with
+fewer than DEGRADATION_MIN_SAMPLES calls in the window count as healthy, so
+a worker that stopped calling Gemini in CACHED_ONLY probes its way back.
+Modes are per worker process.
+'''
+
+FULL = 0
+NO_LLM_EXTRACTION = 1
+REDUCED_BUDGET = 2
+CACHED_ONLY = 3
+MODE_NAMES = {
+    FULL: "full",
+    NO_LLM_EXTRACTION: "no_llm_extraction",
+    REDUCED_BUDGET: "reduced_budget",
+    CACHED_ONLY: "cached_only",
+}
+
+# Re-evaluate the windows at most this often (seconds), not on every request
+EVALUATE_INTERVAL = 1.0
+
+
+class StageWindow:
+    """(time, seconds, ok) samples of one stage over the rolling window"""
+
+    def __init__(self):
+        self.samples: Deque[Tuple[float, float, bool]] = deque()
+
+    def add(self, now: float, seconds: float, ok: bool) -> None:
+        self.samples.append((now, seconds, ok))
+
+    def trim(self, now: float) -> None:
+        horizon = now - settings.DEGRADATION_WINDOW_SECONDS
+        while self.samples and self.samples[0][0] < horizon:
+            self.samples.popleft()
+
+    def burn(self, since: float = float("-inf")) -> float:
+        """Share of the SLO budget used by calls started at or after since, 0 when there are too few to tell"""
+        samples = [sample for sample in self.samples if sample[0] - sample[1] >= since]
+        if len(samples) < settings.DEGRADATION_MIN_SAMPLES:
+            return 0.0
+        latencies = sorted(seconds for _, seconds, _ in samples)
+        index = min(len(latencies) - 1, math.ceil(settings.DEGRADATION_LATENCY_PERCENTILE * len(latencies)) - 1)
+        errors = sum(1 for _, _, ok in samples if not ok) / len(samples)
+        return max(latencies[index] / settings.DEGRADATION_LATENCY_SLO, errors / settings.DEGRADATION_ERROR_RATE_SLO)
+
+
+class DegradationController:
+    _windows: Dict[str, StageWindow] = {}
+    _mode = FULL
+    _changed_at = float("-inf")
+    _evaluated_at = float("-inf")
+
+    @classmethod
+    def record(cls, stage: str, seconds: float, ok: bool) -> None:
+        LLM_CALL_SECONDS.labels(stage).observe(seconds)
+        if not ok:
+            LLM_CALL_FAILURES.labels(stage).inc()
+        window = cls._windows.get(stage)
+        if window is None:
+            window = cls._windows[stage] = StageWindow()
+        window.add(time.monotonic(), seconds, ok)
+
+    @classmethod
+    def burn(cls, since: float = float("-inf")) -> Tuple[float, Optional[str]]:
+        """The highest burn of any stage over the samples from since on, and that stage"""
+        now = time.monotonic()
+        worst, worst_stage = 0.0, None
+        for stage, window in cls._windows.items():
+            window.trim(now)
+            stage_burn = window.burn(since)
+            if stage_burn > worst:
+                worst, worst_stage = stage_burn, stage
+        return worst, worst_stage
+
+    @classmethod
+    def evaluate(cls) -> int:
+        """Move at most one mode towards what the current burn calls for"""
+        if not settings.DEGRADATION_ENABLED:
+            return FULL
+        now = time.monotonic()
+        if now - cls._evaluated_at < EVALUATE_INTERVAL:
+            return cls._mode
+        cls._evaluated_at = now
+        held = now - cls._changed_at
+        # Only calls started in the current mode show whether it is enough
+        burn, stage = cls.burn(since=cls._changed_at)
+        if burn > 1.0 and cls._mode < CACHED_ONLY and held >= settings.DEGRADATION_STEP_SECONDS:
+            cls._set_mode(cls._mode + 1, now, f"{stage} is at {burn:.0%} of its SLO budget")
+        elif burn < settings.DEGRADATION_RECOVER_RATIO and cls._mode > FULL and held >= settings.DEGRADATION_HOLD_SECONDS:
+            cls._set_mode(cls._mode - 1, now, f"SLO burn is down to {burn:.0%}")
+        return cls._mode
+
+    @classmethod
+    def _set_mode(cls, mode: int, now: float, reason: str) -> None:
+        DEGRADATION_TRANSITIONS.labels(MODE_NAMES[cls._mode], MODE_NAMES[mode]).inc()
+        logger.warning(f"Pipeline degradation {MODE_NAMES[cls._mode]} -> {MODE_NAMES[mode]}: {reason}")
+        cls._mode = mode
+        cls._changed_at = now
+        DEGRADATION_MODE.set(mode)
+
+    @classmethod
+    def reset(cls) -> None:
+        cls._windows = {}
+        cls._mode = FULL
+        cls._changed_at = float("-inf")
+        cls._evaluated_at = float("-inf")
+        DEGRADATION_MODE.set(FULL)
+
+
+def current_mode() -> int:
+    """The mode a request should run in, evaluated when it starts"""
+    return DegradationController.evaluate()
+
+
+def mode_name(mode: Optional[int] = None) -> str:
+    return MODE_NAMES[DegradationController._mode if mode is None else mode]
@@ -0,0 +1,146 @@
+# app/services/dom_collapse.py
+import logging
+from typing import Dict, List, Tuple
+
+from bs4 import BeautifulSoup, Comment, NavigableString, Tag
+
+from app.models.form_element import FormElement
+from app.services.clean_html import release_soup
+from app.services.dom_utils import FORM_INPUT_TAGS
+from app.services.selector_utils import select
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+'''
+Structural collapsing of the cleaned HTML before it goes into a Gemini prompt.
+
+Country and university selects, repeated table rows and long lists add
+thousands of tokens that say nothing about where the form's containers and
+inputs are. collapse_dom() keeps DOM_COLLAPSE_KEEP representatives of
+- every <select> with more than DOM_COLLAPSE_MAX_OPTIONS options
+- every run of DOM_COLLAPSE_MIN_RUN or more consecutive siblings with the same
+  tag structure (text and attributes aside) that holds no input, select or
+  textarea and has no later sibling holding one
+and replaces the rest with a comment carrying the count.
+
+Runs holding inputs are never collapsed: every input needs its own selector
+in the extraction answer. Runs before an input's container aren't either,
+removing them would shift the nth-of-type/nth-child positions Gemini may use
+in its selectors. Selector scoring and the DOM extractors keep using
+the full HTML; only the prompts see the collapsed copy. The options cut from
+a select are put back on its extracted element by attach_select_options(),
+so the fill step still chooses from the real list.
+'''
+
+
+def _structure(soup: BeautifulSoup) -> Tuple[Dict[int, int], Dict[int, bool]]:
+    """Per tag: a hash of its tag structure and whether it holds a form input, children before parents"""
+    signatures = {}
+    has_input = {}
+    for tag in reversed(soup.find_all(True)):
+        children = [child for child in tag.children if isinstance(child, Tag)]
+        signatures[id(tag)] = hash((tag.name, tuple(signatures[id(child)] for child in children)))
+        has_input[id(tag)] = tag.name in FORM_INPUT_TAGS or any(has_input[id(child)] for child in children)
+    return signatures, has_input
+
+
+def _runs(tag: Tag, signatures: Dict[int, int]) -> List[List[Tag]]:
+    """Consecutive child tags with the same structure, whitespace between them doesn't break a run"""
+    runs = []
+    run = []
+    for child in tag.children:
+        if isinstance(child, Tag):
+            if run and signatures[id(child)] == signatures[id(run[0])]:
+                run.append(child)
+                continue
+            runs.append(run)
+            run = [child]
+        elif not isinstance(child, Comment) and child.strip():
+            runs.append(run)
+            run = []
+    runs.append(run)
+    return [run for run in runs if run]
+
+
+def _drop(tags: List[Tag]) -> None:
+    for tag in tags:
+        following = tag.next_sibling
+        if isinstance(following, NavigableString) and not isinstance(following, Comment) and not following.strip():
+            following.extract()
+        tag.decompose()
+
+
+def select_options(select_tag: Tag) -> List[str]:
+    """Visible option texts of a select, without the empty-value placeholder"""
+    options = []
+    for option in select_tag.find_all('option'):
+        if option.get('value') == "":
+            continue
+        text = option.get_text(strip=True) or option.get('value')
+        if text:
+            options.append(text)
+    return options
+
+
+def collapse_dom(html: str) -> str:
+    """The prompt copy of cleaned HTML, see the module notes"""
+    if not settings.DOM_COLLAPSE_ENABLED or not html:
+        return html
+    keep = max(1, settings.DOM_COLLAPSE_KEEP)
+    soup = BeautifulSoup(html, 'html.parser')
+    try:
+        for select_tag in soup.find_all('select'):
+            options = select_tag.find_all('option')
+            if len(options) > settings.DOM_COLLAPSE_MAX_OPTIONS:
+                options[keep - 1].insert_after(Comment(f" {len(options) - keep} more options "))
+                _drop(options[keep:])
+                for group in select_tag.find_all('optgroup'):
+                    if not group.find('option'):
+                        group.decompose()
+
+        signatures, has_input = _structure(soup)
+        pending = [soup]
+        while pending:
+            tag = pending.pop()
+            if tag.name in ('select', 'optgroup'):
+                continue
+            input_after = False
+            for run in reversed(_runs(tag, signatures)):
+                if len(run) >= settings.DOM_COLLAPSE_MIN_RUN and not has_input[id(run[0])] and not input_after:
+                    run[keep - 1].insert_after(Comment(f" {len(run) - keep} more <{run[0].name}> like the above "))
+                    _drop(run[keep:])
+                    run = run[:keep]
+                input_after = input_after or has_input[id(run[0])]
+                pending.extend(run)
+
+        collapsed = str(soup)
+    finally:
+        release_soup(soup)
+    logger.debug(f"Collapsed prompt HTML from {len(html)} to {len(collapsed)} characters")
+    return collapsed
+
+
+def attach_select_options(html: str, form_elements: List[FormElement]) -> List[FormElement]:
+    """
+    Give elements that target a collapsed select the full option list.
+
+    The extraction only saw a few options of such a select; the fill prompt
+    gets all of them through the element's options.
+    """
+    if not settings.DOM_COLLAPSE_ENABLED or '<select' not in html:
+        return form_elements
+    soup = BeautifulSoup(html, 'html.parser')
+    try:
+        result = []
+        for element in form_elements:
+            if element.options is None:
+                matches = select(soup, element.querySelectorInput)
+                # Same test as collapse_dom(), so exactly the collapsed selects get their options back
+                if (len(matches) == 1 and matches[0].name == 'select'
+                        and len(matches[0].find_all('option')) > settings.DOM_COLLAPSE_MAX_OPTIONS):
+                    element = FormElement(element.querySelectorInput, element.label, element.value, select_options(matches[0]))
+            result.append(element)
+        return result
+    finally:
+        release_soup(soup)
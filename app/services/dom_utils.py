@@ -1,131 +1,234 @@
 # app/services/dom_utils.py
 import logging
+import re
+from collections import Counter
 from bs4 import BeautifulSoup
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+from app.models.form_element import FormElement
+from app.services.clean_html import release_soup
+from app.services.selector_utils import select
 
 logger = logging.getLogger(__name__)
 
-def extract_form_elements_from_dom(html: str, query_selector: str) -> List[Dict[str, Any]]:
+FORM_INPUT_TAGS = ['input', 'select', 'textarea']
+# Input types that never need a value from the user
+SKIPPED_INPUT_TYPES = {'hidden', 'submit', 'button', 'reset', 'image'}
+
+CSS_IDENTIFIER = re.compile(r'^[A-Za-z_][\w-]*$')
+
+
+class DomIndex:
+    """
+    Lookup tables built in a single pass over the document.
+
+    Replaces the per-input soup.find()/find_all() calls, which made label
+    resolution quadratic in the size of the form.
+    """
+
+    def __init__(self, soup: BeautifulSoup):
+        self.inputs = []
+        self.label_for = {}
+        self.elements_by_id = {}
+        self.id_counts = Counter()
+        self.name_counts = Counter()
+        self._text_cache = {}
+
+        for tag in soup.find_all(True):
+            tag_id = tag.get('id')
+            if tag_id:
+                self.id_counts[tag_id] += 1
+                self.elements_by_id.setdefault(tag_id, tag)
+            if tag.name == 'label':
+                target = tag.get('for')
+                if target and target not in self.label_for:
+                    self.label_for[target] = tag
+            elif tag.name in FORM_INPUT_TAGS:
+                if tag.get('name'):
+                    self.name_counts[(tag.name, tag.get('name'))] += 1
+                if tag.name != 'input' or (tag.get('type') or '').lower() not in SKIPPED_INPUT_TYPES:
+                    self.inputs.append(tag)
+
+    def text(self, tag) -> str:
+        """get_text(strip=True), computed once per element"""
+        key = id(tag)
+        if key not in self._text_cache:
+            self._text_cache[key] = tag.get_text(strip=True)
+        return self._text_cache[key]
+
+    def labelledby_text(self, input_element) -> str:
+        """Text of the elements referenced by aria-labelledby"""
+        labelledby = input_element.get('aria-labelledby')
+        if not labelledby:
+            return ""
+        parts = [self.text(self.elements_by_id[ref]) for ref in labelledby.split() if ref in self.elements_by_id]
+        return " ".join(part for part in parts if part)
+
+    def label_text(self, input_element) -> str:
+        """Explicit label: <label for>, aria-labelledby, then a wrapping <label>"""
+        input_id = input_element.get('id')
+        if input_id and input_id in self.label_for:
+            text = self.text(self.label_for[input_id])
+            if text:
+                return text
+        text = self.labelledby_text(input_element)
+        if text:
+            return text
+        parent = input_element.parent
+        while parent is not None and parent.name not in ('form', 'body', '[document]'):
+            if parent.name == 'label':
+                return self.text(parent)
+            parent = parent.parent
+        return ""
+
+    def unique_selector(self, input_element) -> str:
+        """A CSS selector matching only this input"""
+        input_id = input_element.get('id')
+        if input_id and self.id_counts[input_id] == 1:
+            return f"#{input_id}" if CSS_IDENTIFIER.match(input_id) else f"[id='{_escape(input_id)}']"
+
+        input_name = input_element.get('name')
+        if input_name:
+            name_selector = f"{input_element.name}[name='{_escape(input_name)}']"
+            if self.name_counts[(input_element.name, input_name)] == 1:
+                return name_selector
+            # Radio groups share a name, the value tells the options apart
+            if input_element.get('value') is not None:
+                return f"{name_selector}[value='{_escape(input_element.get('value'))}']"
+
+        return self.path_selector(input_element)
+
+    def path_selector(self, element) -> str:
+        """nth-of-type path from the closest ancestor with a unique id"""
+        steps = []
+        node = element
+        while node is not None and node.name not in ('[document]', None):
+            node_id = node.get('id')
+            if node is not element and node_id and self.id_counts[node_id] == 1 and CSS_IDENTIFIER.match(node_id):
+                steps.append(f"#{node_id}")
+                break
+            if node.name in ('html', 'body'):
+                steps.append(node.name)
+                break
+            position = 1 + sum(1 for _ in node.find_previous_siblings(node.name))
+            steps.append(f"{node.name}:nth-of-type({position})")
+            node = node.parent
+        return " > ".join(reversed(steps))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+
+def _fallback_label(input_element) -> str:
+    return input_element.get('placeholder', '') or input_element.get('name', '') or input_element.get('aria-label', '')
+
+
+def _main_form_inputs(inputs: list) -> list:
+    """The inputs of the <form> holding the most of them, none if no input is in a form"""
+    by_form = {}
+    for input_element in inputs:
+        form = input_element.find_parent('form')
+        if form is not None:
+            by_form.setdefault(id(form), []).append(input_element)
+    return max(by_form.values(), key=len) if by_form else []
+
+
+def extract_labelled_inputs(html: str, main_form_only: bool = False) -> Dict[str, Any]:
+    """
+    Extract every fillable input with its explicit label, no container selector needed.
+
+    confidence is the share of inputs that have a real label (label[for],
+    aria-labelledby or a wrapping label) rather than a placeholder/name fallback.
+    With main_form_only, only the inputs of the largest <form> are taken, so
+    site search, newsletter and login boxes elsewhere on the page are left out.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    index = DomIndex(soup)
+    elements = []
+    labelled = 0
+    for input_element in (_main_form_inputs(index.inputs) if main_form_only else index.inputs):
+        label_text = index.label_text(input_element)
+        if label_text:
+            labelled += 1
+        elements.append(FormElement(index.unique_selector(input_element), label_text or _fallback_label(input_element)))
+    release_soup(soup)
+    return {"elements": elements, "confidence": labelled / len(elements) if elements else 0.0}
+
+
+def extract_form_elements_from_dom(html: str, query_selector: str) -> List[FormElement]:
     """
     Extract form elements directly from the DOM using the provided query selector
-    
+
     This is a fallback mechanism in case the Gemini API fails to extract elements properly
     """
+    soup = None
     try:
-        # Parse the HTML
+        # Parse the HTML and index labels, ids and inputs in one pass
         soup = BeautifulSoup(html, 'html.parser')
-        
+        index = DomIndex(soup)
+
         # Initialize result list
         result = []
-        
-        # Try to find all elements matching the query selector
-        # Note: BeautifulSoup doesn't directly support complex CSS selectors
-        # For complex selectors, we'd need to use a more sophisticated approach
-        # This is a simplified implementation
-        
-        # Convert query selector to something BeautifulSoup can understand
-        selector_parts = query_selector.split()
-        target_elements = soup.select(query_selector)
-        
+
+        # Find all elements matching the query selector, compiled once per process
+        target_elements = select(soup, query_selector)
+
         if not target_elements:
             logger.warning(f"No elements found using selector: {query_selector}")
-            # Fallback to find all form elements
-            form_elements = soup.find_all(['input', 'select', 'textarea'])
-            
-            for element in form_elements:
-                # Try to find associated label
-                label_text = ""
-                
-                # Check for label with for attribute
-                input_id = element.get('id')
-                if input_id:
-                    label = soup.find('label', attrs={'for': input_id})
-                    if label:
-                        label_text = label.get_text(strip=True)
-                
-                # If no label found, look for placeholder or name
-                if not label_text:
-                    label_text = element.get('placeholder', '') or element.get('name', '') or element.get('aria-label', '')
-                
-                # Generate a CSS selector for this input
-                if input_id:
-                    input_selector = f"#{input_id}"
-                elif element.get('name'):
-                    input_selector = f"{element.name}[name='{element.get('name')}']"
-                else:
-                    # Generate a path-based selector as last resort
-                    parent_classes = []
-                    parent = element.parent
-                    for _ in range(3):  # Look up to 3 levels up
-                        if not parent:
-                            break
-                        if parent.get('class'):
-                            parent_classes.append('.'.join(parent.get('class')))
-                        parent = parent.parent
-                    
-                    if parent_classes:
-                        input_selector = f"{' '.join(reversed(parent_classes))} {element.name}"
-                    else:
-                        input_selector = element.name
-                
-                result.append({
-                    "querySelectorInput": input_selector,
-                    "label": label_text
-                })
-            
+            # Fallback to all form elements in the document
+            for element in index.inputs:
+                result.append(FormElement(index.unique_selector(element), index.label_text(element) or _fallback_label(element)))
             return result
-        
-        # Process found elements
-        for container in target_elements:
-            # Find input elements in this container
-            inputs = container.find_all(['input', 'select', 'textarea'])
-            
-            for input_element in inputs:
-                input_id = input_element.get('id', '')
-                input_name = input_element.get('name', '')
-                
-                # Determine input selector
-                if input_id:
-                    input_selector = f"#{input_id}"
-                elif input_name:
-                    input_selector = f"{input_element.name}[name='{input_name}']"
-                else:
-                    # Create a fallback selector
-                    input_selector = f"{query_selector} {input_element.name}"
-                
-                # Extract label text
-                label_text = ""
-                
-                # Try finding associated label
-                if input_id:
-                    label = container.find('label', attrs={'for': input_id})
-                    if label:
-                        label_text = label.get_text(strip=True)
-                
-                # If no label with 'for' attribute, try checking for label as direct parent/ancestor
-                if not label_text:
-                    labels = container.find_all('label')
-                    if labels:
-                        label_text = labels[0].get_text(strip=True)
-                
-                # If still no label, try other text in the container
-                if not label_text:
-                    # Get all text in container excluding text in other input elements
-                    container_text = container.get_text(strip=True)
-                    input_text = ''.join([i.get_text(strip=True) for i in container.find_all(['input', 'select', 'textarea'])])
-                    label_text = container_text.replace(input_text, '').strip()
-                
-                # Final fallback to placeholder or name attribute
-                if not label_text:
-                    label_text = input_element.get('placeholder', '') or input_element.get('name', '') or input_element.get('aria-label', '')
-                
-                result.append({
-                    "querySelectorInput": input_selector,
-                    "label": label_text
-                })
-        
+
+        # Map every input to its closest matched container by walking up from the input,
+        # then compute the per-container label candidates once
+        container_ids = {id(container) for container in target_elements}
+        input_containers = []
+        container_input_text = {}
+        for input_element in index.inputs:
+            container = _closest_container(input_element, container_ids)
+            if container is not None:
+                input_containers.append((input_element, container))
+                container_input_text[id(container)] = container_input_text.get(id(container), "") + index.text(input_element)
+
+        container_labels = {}
+        for input_element, container in input_containers:
+            # Try the explicit label of the input first
+            label_text = index.label_text(input_element)
+
+            # Then the first label in the container
+            if not label_text:
+                if id(container) not in container_labels:
+                    label = container.find('label')
+                    container_labels[id(container)] = index.text(label) if label else ""
+                label_text = container_labels[id(container)]
+
+            # If still no label, use the container text without the text of its inputs
+            if not label_text:
+                label_text = index.text(container).replace(container_input_text[id(container)], '').strip()
+
+            # Final fallback to placeholder or name attribute
+            if not label_text:
+                label_text = _fallback_label(input_element)
+
+            result.append(FormElement(index.unique_selector(input_element), label_text))
+
         return result
-    
+
     except Exception as e:
         logger.error(f"Error extracting form elements from DOM: {str(e)}")
-        return []
\ No newline at end of file
+        return []
+    finally:
+        # Break the tree's reference cycles so it is freed without waiting for the GC
+        if soup is not None:
+            release_soup(soup)
+
+
+def _closest_container(input_element, container_ids: set) -> Optional[Any]:
+    node = input_element
+    while node is not None:
+        if id(node) in container_ids:
+            return node
+        node = node.parent
+    return None
@@ -0,0 +1,84 @@
+# app/services/fake_llm.py
+import asyncio
+import logging
+import types
+
+import orjson
+
+from app.services.cpu_pool import run_cpu_bound
+from app.services.dom_utils import extract_labelled_inputs
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+'''
+Deterministic stand-in for the google.generativeai module, selected with
+LLM_PROVIDER=fake for load tests and traffic replay.
+
+It answers each call from the response schema it was configured with, after
+FAKE_LLM_LATENCY seconds: a generic container selector (divs directly holding
+an input) for widget detection, the labelled inputs of the HTML for
+extraction, and every
+element echoed with a fixed value for fills. No network access or API key is
+needed, and the same input always gets the same answer, so two builds can be
+compared on the same captured traffic.
+
+Extraction parses the HTML, which goes through run_cpu_bound() like the real
+pipeline's parses and counts towards FAKE_LLM_LATENCY: a real call spends none
+of the event loop's time, so neither may the fake.
+'''
+
+FAKE_SELECTOR = "div:has(> input), div:has(> select), div:has(> textarea)"
+FAKE_VALUE = "test"
+
+
+def _elements(html: str):
+    return [element.as_dict() for element in extract_labelled_inputs(html or "")["elements"]]
+
+
+class FakeChatSession:
+    def __init__(self, config):
+        self.config = config or {}
+
+    async def send_message_async(self, message: str):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        answer = await self._answer(message)
+        await asyncio.sleep(max(0.0, settings.FAKE_LLM_LATENCY - (loop.time() - started)))
+        return types.SimpleNamespace(text=orjson.dumps(answer).decode())
+
+    async def _answer(self, message: str):
+        schema = self.config.get("response_schema") or {}
+        properties = schema.get("properties") or {}
+        item_properties = (schema.get("items") or {}).get("properties") or {}
+
+        if "elements" in properties:
+            # One-shot detect, extract and fill: the message is the HTML
+            answer = {
+                "querySelectorAll": FAKE_SELECTOR,
+                "elements": [{**element, "value": FAKE_VALUE} for element in await run_cpu_bound(_elements, message)],
+            }
+        elif "querySelectorAll" in properties:
+            answer = {"querySelectorAll": FAKE_SELECTOR}
+        elif "value" in item_properties:
+            answer = [{**element, "value": FAKE_VALUE} for element in orjson.loads(message)]
+        else:
+            answer = await run_cpu_bound(_elements, orjson.loads(message).get("html") or "")
+        return answer
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name=None, generation_config=None, system_instruction=None):
+        self.generation_config = generation_config
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self.generation_config)
+
+
+class FakeGenAI:
+    """The subset of google.generativeai the prompts use"""
+    GenerativeModel = FakeGenerativeModel
+
+    @staticmethod
+    def configure(**kwargs):
+        pass
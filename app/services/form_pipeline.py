@@ -0,0 +1,416 @@
+# app/services/form_pipeline.py
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.models.form import Form, find_form_by_path
+from app.models.form_element import FormElement, elements_to_dicts
+from app.services.caches import Caches, cache_mapping, cached_mapping, forget_mapping, structure_fingerprint
+from app.services.clean_html import clean_html
+from app.services.cpu_pool import run_cpu_bound
+from app.services.degradation import NO_LLM_EXTRACTION, current_mode, mode_name
+from app.services.dom_collapse import attach_select_options, collapse_dom
+from app.services.dom_utils import extract_form_elements_from_dom, extract_labelled_inputs
+from app.services.gemini_prompt import form_widget_detection, extract_form_elements, fill_form_values, detect_extract_and_fill
+from app.services.selector_utils import score_selector, is_acceptable_selector
+from app.services.site_extractors import extract_with_registry, fill_response_format
+from app.services.url_template import path_template, template_prefixes
+from app.services.write_behind import pending_form, persist_form
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+'''
+The get-or-create form pipeline shared by the single-form and batch endpoints.
+
+process_form() returns (status_code, content) where status_code is 200 for a
+domain with a stored mapping and 201 when the mapping was (re-)detected. Errors
+are raised as HTTPException so the routers can pass them through unchanged.
+
+A new domain races the site extractors, the local label-based extraction
+(inputs of the page's main <form>) and Gemini. The local path has no container
+selector to store, so when it wins, an in-flight Gemini detection is left to
+finish in the background and store its mapping for the next request.
+'''
+
+# Gemini detections finishing after a local extraction answered the request
+_background_detections = set()
+
+
+def profile_prompt(user_prompt: Optional[str], custom_command: Optional[str]) -> Optional[str]:
+    """The prompt fields may be prefilled from, none when a custom command could ask for something else"""
+    return None if custom_command else user_prompt
+
+
+def fill_history(user_prompt: Optional[str], custom_command: Optional[str]) -> List[Dict]:
+    """Chat history sent along with the form elements to fill_form_values"""
+    return [
+        {"role": "user", "parts": [user_prompt]},
+        {"role": "user", "parts": [custom_command] if custom_command else ["Please fill this form based on the information provided."]}
+    ]
+
+
+async def detect_query_selector(html: str, prompt_html: Optional[str] = None):
+    """
+    Ask Gemini for the widget container selector and validate it against the DOM.
+
+    Gemini gets prompt_html (the collapsed copy of html) when given, the
+    answers are always validated against the full html.
+
+    A selector that fails validation is re-detected once with the rejected answer
+    as a hint. Returns the best (selector, score) seen, which may still be below
+    the quality bar; the caller then uses it for this request but doesn't store it.
+
+    Pages built from the same template share a structure fingerprint, a selector
+    accepted for one of them is re-validated and reused without asking Gemini.
+    """
+    widget_cache = Caches.get("widget_selectors")
+    fingerprint = await run_cpu_bound(structure_fingerprint, html)
+    cached_selector = widget_cache.get(fingerprint)
+    if cached_selector:
+        selector_score = await run_cpu_bound(score_selector, html, cached_selector)
+        if is_acceptable_selector(selector_score):
+            return cached_selector, selector_score
+        widget_cache.delete(fingerprint)
+
+    best = None
+    rejected = []
+    for _ in range(2):
+        widget_detection_result = await form_widget_detection(prompt_html or html, rejected_selectors=rejected)
+
+        # Parse the response to get the querySelectorAll
+        if isinstance(widget_detection_result, str):
+            # Handle string response (potentially error or raw JSON)
+            widget_detection_data = json.loads(widget_detection_result)
+        else:
+            # Handle object response from Gemini
+            widget_detection_data = widget_detection_result
+
+        query_selector = widget_detection_data.get("querySelectorAll")
+        if not query_selector:
+            continue
+
+        selector_score = await run_cpu_bound(score_selector, html, query_selector)
+        if best is None or selector_score["score"] > best[1]["score"]:
+            best = (query_selector, selector_score)
+        if is_acceptable_selector(selector_score):
+            break
+        rejected.append(query_selector)
+
+    if best is None:
+        logger.error("No query selector found in widget detection response")
+        raise HTTPException(status_code=400, detail="Could not detect form widgets")
+    if is_acceptable_selector(best[1]):
+        widget_cache.set(fingerprint, best[0])
+    return best
+
+
+async def extract_elements(html: str, query_selector: str, domain: str, prompt_html: Optional[str] = None) -> List[FormElement]:
+    """Gemini extraction from the collapsed HTML, with the options cut from long selects put back"""
+    if prompt_html is None:
+        prompt_html = await run_cpu_bound(collapse_dom, html)
+    form_elements = await extract_form_elements(html, query_selector, domain, prompt_html=prompt_html)
+    return await run_cpu_bound(attach_select_options, html, form_elements)
+
+
+def choose_pipeline_mode(requested: Optional[str], html: str, user_prompt: Optional[str]) -> str:
+    """
+    Pick "staged" (detect, extract, fill as three calls) or "combined" (one call).
+
+    The combined call needs a prompt to fill from and has to fit selector,
+    elements and values into a single generation, so "auto" only picks it for
+    DOMs below COMBINED_PIPELINE_MAX_DOM_TOKENS.
+    """
+    mode = (requested or settings.PIPELINE_MODE).lower()
+    if not user_prompt or mode not in ("combined", "auto"):
+        return "staged"
+    if mode == "auto" and estimate_tokens(html) > settings.COMBINED_PIPELINE_MAX_DOM_TOKENS:
+        return "staged"
+    return "combined"
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for HTML
+    return len(text or "") // 4
+
+
+def _candidate(source: str, elements: List[FormElement], query_selector: Optional[str], confidence: float,
+               persist: bool, filled: bool = False, response_format: Optional[Dict] = None) -> Dict:
+    return {
+        "source": source,
+        "elements": elements,
+        "querySelectorAll": query_selector,
+        "confidence": confidence,
+        "persist": persist,
+        "filled": filled,
+        "response_format": response_format,
+    }
+
+
+async def _site_candidate(site_task) -> Optional[Dict]:
+    """Deterministic extraction for known platforms, always trusted"""
+    site_result = await asyncio.shield(site_task)
+    if not site_result:
+        return None
+    return _candidate(site_result["extractor"], site_result["elements"], site_result["querySelectorAll"], 1.0, True,
+                      response_format=site_result["response_format"])
+
+
+async def _local_candidate(html_task) -> Optional[Dict]:
+    """Label-based extraction from the DOM, confident when every input has a real label"""
+    html = await asyncio.shield(html_task)
+    local_result = await run_cpu_bound(extract_labelled_inputs, html, True)
+    if not local_result["elements"]:
+        return None
+    # No container selector comes out of this path, so there is nothing to store
+    return _candidate("dom", local_result["elements"], None, local_result["confidence"], False)
+
+
+async def _llm_candidate(html_task, domain: str, user_prompt: Optional[str], history: List[Dict],
+                         pipeline_mode: Optional[str]) -> Optional[Dict]:
+    """Gemini detection and extraction, or the one-shot combined call"""
+    html = await asyncio.shield(html_task)
+    # Prompts get the collapsed copy, answers are checked against the full HTML
+    prompt_html = await run_cpu_bound(collapse_dom, html)
+
+    if choose_pipeline_mode(pipeline_mode, prompt_html, user_prompt) == "combined":
+        # One Gemini call for selector, elements and values instead of three
+        combined = await detect_extract_and_fill(prompt_html, history)
+        if combined:
+            selector_score = await run_cpu_bound(score_selector, html, combined["querySelectorAll"])
+            acceptable = is_acceptable_selector(selector_score)
+            return _candidate("llm", combined["elements"], combined["querySelectorAll"],
+                              1.0 if acceptable else selector_score["score"], acceptable, filled=True)
+
+    query_selector, selector_score = await detect_query_selector(html, prompt_html)
+    form_elements = await extract_elements(html, query_selector, domain, prompt_html)
+    if not form_elements:
+        return None
+    acceptable = is_acceptable_selector(selector_score)
+    return _candidate("llm", form_elements, query_selector, 1.0 if acceptable else selector_score["score"], acceptable)
+
+
+async def race_candidates(candidates: List, concurrent: bool = True, keep_unstored: tuple = ()) -> Optional[Dict]:
+    """
+    Run the extraction paths and return the first sufficiently confident result.
+
+    With concurrent=True all paths start at once; as soon as one returns a
+    result with confidence >= SPECULATIVE_MIN_CONFIDENCE the others are
+    cancelled, which also cancels their in-flight Gemini calls, except the
+    keep_unstored tasks when that result can't be stored. Otherwise the
+    most confident result is returned once every path has finished. With
+    concurrent=False the paths run one after another in the given order.
+    """
+    best = None
+    if not concurrent:
+        for coroutine in candidates:
+            if best is not None and best["confidence"] >= settings.SPECULATIVE_MIN_CONFIDENCE:
+                coroutine.close()
+                continue
+            try:
+                candidate = await coroutine
+            except Exception as e:
+                logger.warning(f"Extraction path failed: {str(e)}")
+                continue
+            if candidate and (best is None or candidate["confidence"] > best["confidence"]):
+                best = candidate
+        return best
+
+    pending = {asyncio.ensure_future(coroutine) for coroutine in candidates}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    logger.warning(f"Extraction path failed: {str(task.exception())}")
+                    continue
+                candidate = task.result()
+                if candidate and (best is None or candidate["confidence"] > best["confidence"]):
+                    best = candidate
+            if best is not None and best["confidence"] >= settings.SPECULATIVE_MIN_CONFIDENCE:
+                break
+        return best
+    finally:
+        for task in pending:
+            if not (task in keep_unstored and best is not None and not best["persist"]):
+                task.cancel()
+
+
+def _new_form(domain: str, query_selector: str, template: Optional[str]) -> Form:
+    return Form(
+        domain=domain,
+        mapping={"querySelectorAll": query_selector},
+        parent_container="form",  # Default container, could be updated based on DOM analysis
+        verified=False,
+        path_template=template
+    )
+
+
+async def _store_background_detection(llm_task, domain: str, template: Optional[str], replace: bool) -> None:
+    """Store the mapping of a Gemini detection that lost the race to an unstored result"""
+    try:
+        candidate = await llm_task
+    except Exception as e:
+        logger.warning(f"Background detection for {domain} failed: {str(e)}")
+        return
+    if candidate and candidate["persist"]:
+        logger.info(f"Storing the background detection for {domain}")
+        await persist_form(_new_form(domain, candidate["querySelectorAll"], template), replace=replace)
+
+
+async def process_form(
+    domain: str,
+    dom: Optional[str],
+    user_prompt: Optional[str] = None,
+    custom_command: Optional[str] = None,
+    pipeline_mode: Optional[str] = None,
+    url: Optional[str] = None
+) -> Tuple[int, Any]:
+    """
+    Get an existing form by domain and URL or create a new one if not found.
+
+    Steps:
+    1. Look for the most specific existing form in the database
+    2. If not found, process the DOM to extract form elements
+    3. Return the structured form data for the extension
+
+    Callers should pass the only reference to dom; it is dropped as soon as the
+    parsing tasks have taken it so a large page isn't held for the Gemini calls.
+
+    While the degradation controller reports Gemini out of its SLO, forms are
+    extracted without it (site extractors and dom_utils) and fills are reduced
+    or prefill-only, see app.services.degradation.
+    """
+    if dom and len(dom) > settings.MAX_DOM_CHARS:
+        raise HTTPException(status_code=413, detail=f"DOM exceeds {settings.MAX_DOM_CHARS} characters")
+    mode = current_mode()
+
+    # Known form platforms (Typeform, Google Forms, Fillout, ...) are extracted
+    # deterministically from the raw DOM without any Gemini call; start that
+    # while we look for the form in the database
+    site_task = asyncio.ensure_future(run_cpu_bound(extract_with_registry, domain, dom))
+
+    # Try to find the form first in the database, only the mapping is needed.
+    # Multi-tenant hosts (docs.google.com, forms.fillout.com) serve many forms,
+    # so mappings are stored per URL path template
+    template = path_template(url)
+    try:
+        # A mapping detected moments ago may still be waiting in the write-behind queue
+        existing_form = pending_form(domain, template_prefixes(template) + [None]) or cached_mapping(domain, template)
+        if existing_form is None:
+            existing_form = await find_form_by_path(domain, template, projection={"_id": 0, "mapping.querySelectorAll": 1})
+            if existing_form is not None:
+                cache_mapping(domain, template, existing_form.get("mapping") or {})
+    except BaseException:
+        site_task.cancel()
+        raise
+
+    html_to_process = None
+    stale_mapping = False
+    if existing_form is not None:
+        site_result = await site_task
+        site_format = site_result["response_format"] if site_result else None
+        if site_result:
+            form_elements = site_result["elements"]
+        elif not dom:
+            # Nothing to validate the stored mapping against or extract from, trust it
+            form_elements = []
+        else:
+            query_selector = (existing_form.get("mapping") or {}).get("querySelectorAll")
+            html_to_process = await run_cpu_bound(clean_html, dom)
+            dom = None
+
+            # A mapping that no longer matches the page is re-detected instead of
+            # sending every request for the domain down the fallback path
+            selector_score = await run_cpu_bound(score_selector, html_to_process, query_selector)
+            stale_mapping = not is_acceptable_selector(selector_score)
+            if stale_mapping:
+                logger.info(f"Stored mapping for {domain} failed validation, re-detecting: {selector_score}")
+                forget_mapping(domain, template)
+            elif mode >= NO_LLM_EXTRACTION:
+                form_elements = await run_cpu_bound(extract_form_elements_from_dom, html_to_process, query_selector)
+            else:
+                form_elements = await extract_elements(html_to_process, query_selector, domain)
+
+        if not stale_mapping:
+            form_elements = await fill_form_values(
+                form_elements, fill_history(user_prompt, custom_command), domain,
+                user_prompt=profile_prompt(user_prompt, custom_command), mode=mode, response_format=site_format
+            )
+            logger.info(f"Found existing form for domain: {domain}")
+            return 200, form_elements
+
+    if not dom and html_to_process is None:
+        # No form found and no DOM to process
+        site_task.cancel()
+        raise HTTPException(status_code=404, detail=f"Form with domain '{domain}' not found and no DOM provided")
+
+    if html_to_process is None:
+        html_task = asyncio.ensure_future(run_cpu_bound(clean_html, dom))
+    else:
+        html_task = asyncio.get_running_loop().create_future()
+        html_task.set_result(html_to_process)
+    # The site and cleaning tasks hold the only references to the raw DOM now
+    dom = html_to_process = None
+
+    history = fill_history(user_prompt, custom_command)
+    candidates = [_site_candidate(site_task)]
+    llm_task = None
+    if mode < NO_LLM_EXTRACTION:
+        llm_candidate = _llm_candidate(html_task, domain, user_prompt, history, pipeline_mode)
+        if settings.SPECULATIVE_EXTRACTION:
+            llm_candidate = llm_task = asyncio.ensure_future(llm_candidate)
+        candidates.append(llm_candidate)
+    candidates.append(_local_candidate(html_task))
+    try:
+        winner = await race_candidates(candidates, concurrent=settings.SPECULATIVE_EXTRACTION,
+                                       keep_unstored=(llm_task,) if llm_task else ())
+    except BaseException:
+        if llm_task is not None:
+            llm_task.cancel()
+        raise
+    finally:
+        html_task.cancel()
+
+    if llm_task is not None and winner is not None and not winner["persist"] and not llm_task.cancelled():
+        # The local result answers this request, Gemini's detection is stored for the next one
+        background = asyncio.ensure_future(_store_background_detection(llm_task, domain, template, stale_mapping))
+        _background_detections.add(background)
+        background.add_done_callback(_background_detections.discard)
+
+    if winner is None and mode >= NO_LLM_EXTRACTION:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Form detection is degraded ({mode_name(mode)}) and found no form, retry later",
+            headers={"Retry-After": str(int(settings.DEGRADATION_STEP_SECONDS))}
+        )
+    if winner is None:
+        raise HTTPException(status_code=400, detail="Could not detect form widgets")
+    logger.info(f"Using {winner['source']} extraction for {domain} (confidence {winner['confidence']:.2f})")
+
+    query_selector = winner["querySelectorAll"]
+    persist_mapping = winner["persist"]
+    form_elements = winner["elements"]
+    if winner["filled"]:
+        form_elements = {**fill_response_format(domain), "fillJSON": elements_to_dicts(form_elements)}
+    elif user_prompt:
+        # Fill form values if user prompt is provided
+        form_elements = await fill_form_values(
+            form_elements, history, domain, user_prompt=profile_prompt(user_prompt, custom_command), mode=mode,
+            response_format=winner["response_format"]
+        )
+    else:
+        form_elements = elements_to_dicts(form_elements)
+
+    if persist_mapping:
+        # Queue the write (replacing a stale mapping if there was one) so the
+        # response doesn't wait for Mongo
+        await persist_form(_new_form(domain, query_selector, template), replace=stale_mapping)
+    else:
+        logger.info(f"Not storing a mapping for {domain} from {winner['source']} extraction")
+
+    # Return the form elements for the extension
+    return 201, form_elements
@@ -1,13 +1,42 @@
-import os
 import json
-import google.generativeai as genai # type: ignore
-from google.ai.generativelanguage_v1beta.types import content # type: ignore
-from typing import Dict, Any, List, Union
-import re
+from typing import Dict, Any, List, Optional, Tuple, Union
 import ast
 import logging
+import time
+import asyncio
+import orjson
+from app.models.form_element import FormElement, dump_elements, elements_to_dicts, parse_elements
+from app.services.cpu_pool import run_cpu_bound
+from app.services.degradation import FULL, REDUCED_BUDGET, CACHED_ONLY, DegradationController
+from app.services.llm_limiter import llm_slot
+from app.services.profile_prefill import prefill
+from app.services.site_extractors import fill_response_format
+from app.services.token_budget import fill_output_budget, salvage_json_array
+from app.settings import settings
 logger = logging.getLogger(__name__)
-genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+
+
+class GeminiSDK:
+    """
+    Lazily imported and configured google.generativeai module.
+
+    The SDK pulls in grpc and protobuf, which makes importing it the slowest part
+    of app startup, so it is only loaded on the first call or during warm-up.
+    LLM_PROVIDER=fake swaps in the deterministic provider from app.services.fake_llm.
+    """
+    _genai = None
+
+    @classmethod
+    def get(cls):
+        if cls._genai is None:
+            if settings.LLM_PROVIDER == "fake":
+                from app.services.fake_llm import FakeGenAI
+                cls._genai = FakeGenAI
+                return cls._genai
+            import google.generativeai as genai  # type: ignore
+            genai.configure(api_key=settings.GEMINI_API_KEY)
+            cls._genai = genai
+        return cls._genai
 
 # Configuration for form values filling
 generation_config_form_values = {
@@ -66,6 +95,34 @@ generation_config_element_extraction = {
   "response_mime_type": "application/json",
 }
 
+# Configuration for the one-shot detect + extract + fill call
+generation_config_combined = {
+  "temperature": 0.2,
+  "top_p": 0.4,
+  "top_k": 40,
+  "max_output_tokens": 8192,
+  "response_schema": {
+    "type": "object",
+    "properties": {
+      "querySelectorAll": {"type": "string"},
+      "elements": {
+        "type": "array",
+        "items": {
+          "type": "object",
+          "properties": {
+            "querySelectorInput": {"type": "string"},
+            "label": {"type": "string"},
+            "value": {"type": "string"}
+          },
+          "required": ["querySelectorInput", "label", "value"]
+        }
+      }
+    },
+    "required": ["querySelectorAll", "elements"]
+  },
+  "response_mime_type": "application/json",
+}
+
 # Improved system instruction for widget detection
 system_instruction_widget_detection = """
 You are a specialized form parser. Your job is to analyze HTML form content and identify the common pattern 
@@ -77,6 +134,7 @@ Guidelines:
 3. Return a single CSS selector that will match ALL form element containers
 4. The selector should be specific enough to only target form element containers
 5. Ensure your selector works across the entire form regardless of its length
+6. Comments like <!-- 12 more <tr> like the above --> or <!-- 180 more options --> stand for content left out of the HTML
 
 Your response must be a JSON object with exactly one property: "querySelectorAll" containing the proper CSS selector.
 Example: {"querySelectorAll": ".form-group"} or {"querySelectorAll": "form div.field-container"}
@@ -103,6 +161,7 @@ Examples:
 ]
 
 Ensure each querySelectorInput is unique and specific enough to target exactly one element.
+Comments like <!-- 180 more options --> stand for content left out of the HTML, they are not elements.
 """
 
 # System instruction for form values filling
@@ -116,6 +175,7 @@ Guidelines:
 3. For fields not explicitly mentioned in the input, provide reasonable defaults
 4. Handle all common input types appropriately (text, email, phone, dates, etc.)
 5. Format values appropriately for each field type (e.g., dates in the right format)
+6. When an element has "options", the value must be exactly one of them
 
 Your response must maintain the structure of the input, adding a "value" field to each element:
 [
@@ -126,14 +186,49 @@ Your response must maintain the structure of the input, adding a "value" field t
 Do not add any explanations in your response, just return the JSON array with filled values.
 """
 
-async def form_widget_detection(form_html: str) -> Dict:
-    """Get the CSS selector for form widget containers"""
+# System instruction for the one-shot detect + extract + fill call
+system_instruction_combined = """
+You are a specialized form parser and form filler. Given a form's HTML and the user's instructions,
+do all of the following in one answer:
+
+1. Find the single CSS selector that matches ALL containers grouping an input with its label
+   (elements like div, section, fieldset, tr, li)
+2. For every input element (input, select, textarea) inside those containers, return a CSS selector
+   that targets exactly that one element and the text of its label
+3. Fill a value for every element from the user's information, use reasonable dummy data where the
+   information is not available, and format values for the field type (dates, emails, phones, etc.)
+
+Your response must be a JSON object:
+{
+  "querySelectorAll": "form div.field-container",
+  "elements": [
+    {"querySelectorInput": "input[id='some_id']", "label": "First Name", "value": "John"},
+    {"querySelectorInput": "input[name='email']", "label": "Email Address", "value": "john.doe@example.com"}
+  ]
+}
+
+Comments like <!-- 180 more options --> stand for content left out of the HTML, a select's value may be
+any option that fits. Ensure each querySelectorInput is unique. Do not add any explanations.
+"""
+
+async def form_widget_detection(form_html: str, rejected_selectors: List[str] = None) -> Dict:
+    """
+    Get the CSS selector for form widget containers
+
+    rejected_selectors lists earlier answers that failed validation against the
+    DOM, so a re-detection doesn't return the same selector again.
+    """
+    message = form_html
+    if rejected_selectors:
+        message = (f"{form_html}\n\nThese selectors do not match the form field containers, "
+                   f"return a different one: {json.dumps(rejected_selectors)}")
     try:
         response = await gemini_response(
             system_instruction=system_instruction_widget_detection,
-            message=form_html, 
+            message=message, 
             config=generation_config_widget_detection, 
-            model="gemini-2.0-flash"
+            model="gemini-2.0-flash",
+            stage="widget_detection"
         )
         
         # Parse response to ensure it matches expected format
@@ -152,99 +247,42 @@ async def form_widget_detection(form_html: str) -> Dict:
         logger.error(f"Error in form widget detection: {str(e)}")
         return {"querySelectorAll": "form *"}  # Fallback to a generic selector
 
-async def extract_form_elements(form_html: str, query_selector: str, domain: str = "") -> List[Dict]:
-    """Extract form elements using the provided query selector"""
+async def extract_form_elements(form_html: str, query_selector: str, domain: str = "",
+                                prompt_html: Optional[str] = None) -> List[FormElement]:
+    """
+    Extract form elements using the provided query selector
+
+    prompt_html is the copy of form_html sent to Gemini (collapsed, see
+    app.services.dom_collapse); the DOM fallback always reads form_html.
+    """
     try:
-        # Special handling for Typeform
-        if "typeform" in domain:
-            # Look for window.rendererData in the DOM for Typeform
-            logger.info("Detected typeform domain, using specialized extraction")
-            
-            # Try to find the rendererData in the HTML
-            renderer_data_pattern = r'window\.rendererData\s*=\s*({.+?});'
-            render_data_match = re.search(renderer_data_pattern, form_html, re.DOTALL)
-            
-            if render_data_match:
-                # Get the full rendererData string
-                render_data_str = render_data_match.group(1).strip()
-                # Instead of parsing the entire JSON, use regex to extract just the form object
-                form_pattern = r'form:\s*({.+?"_links":.+?})(?=,\s*(?:messages|hubspotIntegration|intents|integrations|messages):|$)'
-
-                form_match = re.search(form_pattern, render_data_str, re.DOTALL)
-                print(form_match.group(1))
-                if form_match:
-                    form_json_str = form_match.group(1)
-                    logger.info("Successfully extracted form JSON from rendererData")
-                    
-                    # Clean the extracted form JSON
-                    form_json_str = re.sub(r',\s*}', '}', form_json_str)
-                    form_json_str = re.sub(r',\s*]', ']', form_json_str)
-                    
-                    try:
-                        # Try to parse the form JSON
-                        form_data = json.loads(form_json_str)
-                        logger.info("Successfully parsed form JSON")
-                        
-                        # Extract fields from the form data
-                        fields = form_data.get('fields', [])
-                        logger.info(f"Found {len(fields)} form fields")
-                        form_elements = []
-                        
-                        for field in fields:
-                            field_type = field.get('type', '')
-                            field_ref = field.get('ref', '')
-                            field_title = field.get('title', '')
-                            
-                            if field_type and field_ref:
-                                # Create the selector based on the type and ref
-                               
-                                query_selector_input = (f"*[aria-labelledby^=\"{field_type}-{field_ref}\"], "f"*[aria-describedby^=\"{field_type}-{field_ref}\"]")
-                                print(query_selector_input)
-                                print(field_title)
-                                form_elements.append({
-                                    "querySelectorInput": query_selector_input,
-                                    "label": field_title
-                                })
-                        
-                        if form_elements:
-                            logger.info(form_elements)
-                            logger.info(f"Successfully extracted {len(form_elements)} elements from Typeform form data")
-                            return form_elements
-                    except json.JSONDecodeError as je:
-                        pass
-        
-        # Standard extraction for non-Typeform sites
         # Combine the HTML and query selector in a structured message
         message = {
-            "html": form_html,
+            "html": prompt_html or form_html,
             "querySelectorAll": query_selector
         }
         
         response = await gemini_response(
             system_instruction=system_instruction_element_extraction,
-            message=json.dumps(message), 
+            message=orjson.dumps(message).decode(), 
             config=generation_config_element_extraction, 
-            model="gemini-2.0-flash"
+            model="gemini-2.0-flash",
+            stage="extraction"
         )
         
-        # Parse response to ensure it matches expected format
-        if isinstance(response, str):
-            try:
-                parsed_response = json.loads(response)
-                if isinstance(parsed_response, list) and len(parsed_response) > 0:
-                    return parsed_response
-            except json.JSONDecodeError:
-                logger.warning("Failed to parse Gemini response as JSON, falling back to DOM extraction")
-        
-        # Handle when response is already parsed
-        if isinstance(response, list) and len(response) > 0:
-            return response
+        # Validate the answer (decoding it first if it is still text) in one pass
+        try:
+            form_elements = parse_elements(response) if isinstance(response, (str, list)) else []
+            if form_elements:
+                return form_elements
+        except (TypeError, json.JSONDecodeError):
+            logger.warning("Failed to parse Gemini response as JSON, falling back to DOM extraction")
         
         # If we reached here, the Gemini API didn't return a valid result
         # Use the DOM extraction utility as a fallback
         from app.services.dom_utils import extract_form_elements_from_dom
         logger.info(f"Using DOM extraction fallback with selector: {query_selector}")
-        form_elements = extract_form_elements_from_dom(form_html, query_selector)
+        form_elements = await run_cpu_bound(extract_form_elements_from_dom, form_html, query_selector)
         
         if form_elements and len(form_elements) > 0:
             return form_elements
@@ -257,95 +295,218 @@ async def extract_form_elements(form_html: str, query_selector: str, domain: str
         # Try the DOM extraction as a last resort
         try:
             from app.services.dom_utils import extract_form_elements_from_dom
-            return extract_form_elements_from_dom(form_html, query_selector)
+            return await run_cpu_bound(extract_form_elements_from_dom, form_html, query_selector)
         except Exception as inner_e:
             logger.error(f"DOM extraction fallback also failed: {str(inner_e)}")
             return []
 
-async def fill_form_values(form_elements: List[Dict], history: List[Dict], domain: str = "") -> Union[Dict, List[Dict]]:
-    """Fill form values based on user input"""
+async def fill_form_values(
+    form_elements: List[FormElement],
+    history: List[Dict],
+    domain: str = "",
+    user_prompt: Optional[str] = None,
+    mode: int = FULL,
+    response_format: Optional[Dict] = None
+) -> Union[Dict, List[Dict]]:
+    """
+    Fill form values based on user input
+
+    With a user_prompt, fields the user's profile answers outright (email, name,
+    phone, social links) are filled locally and only the rest go to Gemini.
+    A truncated answer keeps the elements that were complete, and only the
+    elements missing from it are requested again (up to FILL_MAX_REPAIR_ROUNDS).
+    A complete answer is taken as is, fields Gemini left out stay unfilled.
+
+    mode is the degradation mode of the request: REDUCED_BUDGET makes a single
+    smaller, time-limited call, CACHED_ONLY only prefills.
+
+    response_format is the envelope of the site extractor that found the form,
+    by default it is looked up by domain.
+    """
+    envelope = response_format or fill_response_format(domain)
     try:
-        form_values_config = generation_config_form_values.copy()
-        form_values_config["max_output_tokens"] = len(form_elements) * 200
-        
-        response = await gemini_response(
-            system_instruction=system_instruction_form_values,
-            message=str(json.dumps(form_elements)),
-            history=history, 
-            config=form_values_config,  # Use the modified config
-            model="gemini-2.0-flash"
-        )
-        print(response)
-        
-        # Parse response to ensure it matches expected format
-        filled_form = None
-        if isinstance(response, str):
-            filled_form = json.loads(response)
-        # Handle when response is already parsed
-        elif isinstance(response, list):
-            filled_form = response
-        else:
-            filled_form = form_elements  # Return original if parsing fails
+        prefilled, unresolved = prefill(form_elements, user_prompt) if settings.PROFILE_PREFILL else ({}, form_elements)
+
+        llm_filled, complete = [], True
+        if unresolved and mode < CACHED_ONLY:
+            llm_filled, complete = await _request_form_values(unresolved, history, reduced=mode >= REDUCED_BUDGET)
+        if llm_filled and mode < REDUCED_BUDGET:
+            for _ in range(settings.FILL_MAX_REPAIR_ROUNDS):
+                if complete:
+                    break
+                missing = _missing_elements(unresolved, llm_filled)
+                if not missing:
+                    break
+                logger.info(f"Fill response was cut off, re-requesting the {len(missing)} of {len(unresolved)} elements it is missing")
+                repaired, complete = await _request_form_values(missing, history)
+                if not repaired:
+                    break
+                llm_filled = llm_filled + repaired
+
+        # Elements nobody filled go back unfilled so the extension sees every field
+        filled_form = _merge_filled(form_elements, prefilled, llm_filled)
         
-        # Format the response based on domain
-        if "typeform" in domain:
-            # For Typeform domains, use the special format
-            return {
-                "type": "enter",
-                "domain": "typeform.com",
-                "fillJSON": filled_form
-            }
-        else:
-            # For all other domains, use the standard format
-            return {
-                "type": "direct",
-                "domain": domain,
-                "fillJSON": filled_form
-            }
+        # Wrap the result in the envelope the extension expects for this platform
+        return {**envelope, "fillJSON": elements_to_dicts(filled_form)}
     except Exception as e:
         logger.error(f"Error in form values filling: {str(e)}")
         # Return in the standard format even on error
-        if "typeform" in domain:
-            return {
-                "type": "enter", 
-                "domain": "typeform.com", 
-                "fillJSON": form_elements
-            }
+        return {**envelope, "fillJSON": elements_to_dicts(form_elements)}
+
+async def _request_form_values(form_elements: List[FormElement], history: List[Dict],
+                               reduced: bool = False) -> Tuple[List[FormElement], bool]:
+    """
+    One fill call with a budget sized to the elements.
+
+    Returns the complete items of the answer and whether the answer itself was
+    complete, False when it was cut off or didn't parse.
+    """
+    form_values_config = generation_config_form_values.copy()
+    form_values_config["max_output_tokens"] = fill_output_budget(form_elements)
+    if reduced:
+        # Degraded: trade complete answers for bounded latency, truncation is salvaged below
+        form_values_config["max_output_tokens"] = max(
+            settings.FILL_MIN_OUTPUT_TOKENS,
+            int(form_values_config["max_output_tokens"] * settings.DEGRADATION_BUDGET_FACTOR)
+        )
+    
+    response = await gemini_response(
+        system_instruction=system_instruction_form_values,
+        message=dump_elements(form_elements),
+        history=history, 
+        config=form_values_config,  # Use the modified config
+        model="gemini-2.0-flash",
+        stage="fill",
+        timeout=settings.DEGRADATION_LLM_TIMEOUT if reduced else None
+    )
+
+    # Handle when response is already parsed
+    if isinstance(response, list):
+        return parse_elements(response), True
+    # Otherwise it is text that didn't parse, usually cut off at max_output_tokens
+    if isinstance(response, str):
+        items, complete = salvage_json_array(response)
+        if not complete:
+            logger.warning(f"Fill response was truncated or invalid, salvaged {len(items)} of {len(form_elements)} elements")
+        return parse_elements(items), complete
+    return [], False
+
+def _missing_elements(form_elements: List[FormElement], filled_form: List[FormElement]) -> List[FormElement]:
+    returned = {element.querySelectorInput for element in filled_form}
+    return [element for element in form_elements if element.querySelectorInput not in returned]
+
+def _merge_filled(form_elements: List[FormElement], prefilled: Dict[int, FormElement],
+                  llm_filled: List[FormElement]) -> List[FormElement]:
+    """Filled elements in form order, extra elements Gemini returned at the end"""
+    by_selector = {}
+    for element in llm_filled:
+        by_selector.setdefault(element.querySelectorInput, element)
+
+    merged = []
+    for position, element in enumerate(form_elements):
+        if position in prefilled:
+            merged.append(prefilled[position])
         else:
-            return {
-                "type": "direct", 
-                "domain": domain, 
-                "fillJSON": form_elements
-            }
+            merged.append(by_selector.get(element.querySelectorInput, element))
+
+    # Each extra once, a repair round may return an element an earlier round already had
+    seen = {element.querySelectorInput for element in form_elements}
+    for element in llm_filled:
+        if element.querySelectorInput not in seen:
+            seen.add(element.querySelectorInput)
+            merged.append(element)
+    return merged
+
+async def detect_extract_and_fill(form_html: str, history: List[Dict]) -> Optional[Dict]:
+    """
+    Detect the widget selector, extract the elements and fill them in one call.
+
+    Returns {"querySelectorAll": ..., "elements": [...]} or None when the model
+    didn't produce a usable answer, in which case the caller runs the staged flow.
+    """
+    try:
+        response = await gemini_response(
+            system_instruction=system_instruction_combined,
+            message=form_html,
+            history=history,
+            config=generation_config_combined,
+            model="gemini-2.0-flash",
+            stage="combined"
+        )
+        if isinstance(response, str):
+            response = orjson.loads(response)
+        if not isinstance(response, dict) or not response.get("querySelectorAll") or not response.get("elements"):
+            logger.warning(f"Combined pipeline returned an unusable response: {str(response)[:200]}")
+            return None
+        elements = parse_elements(response["elements"])
+        if not elements:
+            return None
+        return {"querySelectorAll": response["querySelectorAll"], "elements": elements}
+    except Exception as e:
+        logger.error(f"Error in combined form pipeline: {str(e)}")
+        return None
+
+
+def warm_up_llm():
+    """Load the SDK and build a model instance once so none of it happens on the first request"""
+    if settings.LLM_PROVIDER == "fake":
+        logger.warning("Using the fake LLM provider, no Gemini calls will be made")
+    elif not settings.GEMINI_API_KEY:
+        logger.warning("GEMINI_API_KEY is not set, skipping LLM warm-up")
+        return
+    GeminiSDK.get().GenerativeModel(model_name="gemini-2.0-flash")
+
 
 async def gemini_response(
     system_instruction: str = "", 
     message: str = "",  
     history: List[Dict] = [], 
     config: Dict[str, Any] = None,
-    model: str = "gemini-2.0-flash"
+    model: str = "gemini-2.0-flash",
+    stage: str = "other",
+    timeout: Optional[float] = None
 ) -> Union[Dict, List, str]:
-    """Send a request to Gemini API and get a response"""
+    """
+    Send a request to Gemini API and get a response
+
+    Latency and failures are recorded under stage for the degradation
+    controller; timeout (seconds, slot wait included) turns a slow call into
+    an error instead of waiting for it.
+    """
+    started = time.monotonic()
     try:
-        model_instance = genai.GenerativeModel(
+        model_instance = GeminiSDK.get().GenerativeModel(
             model_name=model,
             generation_config=config,
             system_instruction=system_instruction,
         )
         
         chat_session = model_instance.start_chat(history=history)
-        response = chat_session.send_message(message)
+        # Cancelling the calling task (e.g. a losing speculative path) cancels the
+        # underlying request; CancelledError is not an Exception and propagates
+        response = await asyncio.wait_for(_send_message(chat_session, message), timeout)
+        DegradationController.record(stage, time.monotonic() - started, True)
         
         # Try to parse the response
         try:
             if hasattr(response, 'text'):
-                return json.loads(response.text)
+                return orjson.loads(response.text)
             else:
                 return response
         except json.JSONDecodeError:
             # If response is not valid JSON, return it as is
             return response.text if hasattr(response, 'text') else str(response)
             
+    except asyncio.TimeoutError:
+        DegradationController.record(stage, time.monotonic() - started, False)
+        logger.error(f"API Error: {stage} call timed out after {timeout}s")
+        return f"API Error: timed out after {timeout}s"
     except Exception as e:
+        DegradationController.record(stage, time.monotonic() - started, False)
         logger.error(f"API Error: {str(e)}")
-        return f"API Error: {str(e)}"
\ No newline at end of file
+        return f"API Error: {str(e)}"
+
+
+async def _send_message(chat_session, message: str):
+    async with llm_slot():
+        return await chat_session.send_message_async(message)
\ No newline at end of file
@@ -0,0 +1,286 @@
+# app/services/jobs.py
+import asyncio
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+
+from app.mongodb import get_collection
+from app.services.form_pipeline import process_form
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+'''
+Asynchronous form processing: submitted requests are queued and run by a fixed
+pool of background workers, so an HTTP request returns as soon as the job is
+queued instead of waiting for the LLM calls.
+
+Job state (not the submitted DOM) lives in a JobStore. Queued DOMs are held in
+memory, so the queue is bounded by their total size (JOB_QUEUE_MAX_DOM_CHARS)
+as well as their number; a worker hands the DOM to process_form() as its only
+reference. The memory store only
+works with a single web worker, since polls can reach any worker; the Mongo
+store ("jobs" collection, expired by a TTL index) is shared. Long-polls on the
+worker running the job wake up as soon as it finishes, other workers poll the
+store every JOB_POLL_INTERVAL seconds.
+
+Jobs don't outlive their worker. On shutdown the queue gets the drain timeout
+to finish, then the jobs still queued or running are failed with a 503 so
+clients resubmit them. A worker that crashes can't do that; a job it left
+queued or running is reported failed once it hasn't been updated for
+JOB_STALE_SECONDS.
+'''
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED_STATES = (DONE, FAILED)
+SHUTDOWN_ERROR = "Worker shut down before the job finished, retry"
+LOST_ERROR = "Job was lost by its worker, retry"
+
+
+def _report_lost(job: Optional[Dict]) -> Optional[Dict]:
+    """The job as failed if it is unfinished and its worker stopped updating it"""
+    if (job is not None and job["status"] not in FINISHED_STATES
+            and job["updated_at"] < time.time() - settings.JOB_STALE_SECONDS):
+        return {**job, "status": FAILED, "status_code": 503, "error": LOST_ERROR}
+    return job
+
+
+class JobStore(ABC):
+    def __init__(self):
+        # Finish events of the jobs this worker runs
+        self._events = {}
+
+    @abstractmethod
+    async def create(self, job: Dict) -> None:
+        pass
+
+    @abstractmethod
+    async def update(self, job_id: str, fields: Dict) -> None:
+        pass
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Dict]:
+        pass
+
+    def track(self, job_id: str) -> None:
+        self._events[job_id] = asyncio.Event()
+
+    def finish(self, job_id: str) -> None:
+        event = self._events.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict]:
+        """The job once it has finished or the timeout has passed"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = _report_lost(await self.get(job_id))
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] in FINISHED_STATES or remaining <= 0:
+                return job
+            event = self._events.get(job_id)
+            try:
+                if event is not None:
+                    await asyncio.wait_for(event.wait(), remaining)
+                else:
+                    await asyncio.sleep(min(settings.JOB_POLL_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self):
+        super().__init__()
+        self._jobs = {}
+
+    def _purge(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items() if job["expires_at"] < now]
+        for job_id in expired:
+            self._jobs.pop(job_id, None)
+
+    async def create(self, job: Dict) -> None:
+        self._purge()
+        self._jobs[job["job_id"]] = dict(job)
+
+    async def update(self, job_id: str, fields: Dict) -> None:
+        if job_id in self._jobs:
+            self._jobs[job_id].update(fields)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        job = self._jobs.get(job_id)
+        if job is None or job["expires_at"] < time.time():
+            return None
+        return dict(job)
+
+
+class MongoJobStore(JobStore):
+    @staticmethod
+    def _collection():
+        return get_collection("jobs")
+
+    async def create(self, job: Dict) -> None:
+        # The TTL index only expires documents with a BSON date
+        expires_at = datetime.fromtimestamp(job["expires_at"], tz=timezone.utc)
+        await self._collection().insert_one({"_id": job["job_id"], **job, "expires_at": expires_at})
+
+    async def update(self, job_id: str, fields: Dict) -> None:
+        await self._collection().update_one({"_id": job_id}, {"$set": fields})
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await self._collection().find_one({"_id": job_id}, {"_id": 0, "expires_at": 0})
+
+
+class JobQueue:
+    """Bounded queue of form jobs and the worker tasks that run them"""
+    _store = None
+    _queue = None
+    _workers = []
+    # Jobs the workers have taken off the queue and not finished yet
+    _running = set()
+    # Total DOM characters of the queued jobs
+    _queued_chars = 0
+
+    @classmethod
+    def get_store(cls) -> JobStore:
+        if cls._store is None:
+            cls._store = MongoJobStore() if settings.JOB_STORE == "mongo" else MemoryJobStore()
+        return cls._store
+
+    @classmethod
+    def get_queue(cls) -> asyncio.Queue:
+        if cls._queue is None:
+            cls._queue = asyncio.Queue(maxsize=settings.JOB_QUEUE_MAX_SIZE)
+        return cls._queue
+
+    @classmethod
+    def depth(cls) -> int:
+        return cls._queue.qsize() if cls._queue is not None else 0
+
+
+async def submit_form_job(domain: str, arguments: Dict[str, Any]) -> Dict:
+    """
+    Queue a process_form() call and return the new job.
+
+    Raises a 503 when the queue is full (or the workers aren't running) so
+    clients back off instead of piling up work this worker can't get to.
+    """
+    queue = JobQueue.get_queue()
+    if not JobQueue._workers:
+        raise HTTPException(status_code=503, detail="Job workers are not running")
+    dom_chars = len(arguments.get("dom") or "")
+    if queue.full() or JobQueue._queued_chars + dom_chars > settings.JOB_QUEUE_MAX_DOM_CHARS:
+        raise HTTPException(status_code=503, detail="Job queue is full, retry later")
+
+    now = time.time()
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "status": QUEUED,
+        "domain": domain,
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + settings.JOB_TTL_SECONDS,
+    }
+    store = JobQueue.get_store()
+    await store.create(job)
+    store.track(job["job_id"])
+    try:
+        queue.put_nowait((job["job_id"], domain, arguments))
+    except asyncio.QueueFull:
+        # Concurrent submits filled the queue while the job was being stored;
+        # fail the record so no poll waits for a job no worker will run
+        detail = "Job queue is full, retry later"
+        await store.update(job["job_id"], {"status": FAILED, "status_code": 503, "error": detail, "updated_at": time.time()})
+        store.finish(job["job_id"])
+        raise HTTPException(status_code=503, detail=detail)
+    JobQueue._queued_chars += dom_chars
+    return job
+
+
+async def get_job(job_id: str, wait: float = 0) -> Optional[Dict]:
+    store = JobQueue.get_store()
+    if wait > 0:
+        return await store.wait(job_id, min(wait, settings.JOB_MAX_WAIT_SECONDS))
+    return _report_lost(await store.get(job_id))
+
+
+async def _run_job(store: JobStore, job_id: str, domain: str, arguments: Dict[str, Any]) -> None:
+    await store.update(job_id, {"status": RUNNING, "updated_at": time.time()})
+    try:
+        # Hand the DOM over so process_form holds the only reference to it
+        status_code, content = await process_form(domain, arguments.pop("dom", None), **arguments)
+        fields = {"status": DONE, "status_code": status_code, "result": content}
+    except HTTPException as e:
+        fields = {"status": FAILED, "status_code": e.status_code, "error": e.detail}
+    except Exception as e:
+        logger.error(f"Error processing form job {job_id} for {domain}: {str(e)}")
+        fields = {"status": FAILED, "status_code": 500, "error": f"Failed to process form request: {str(e)}"}
+    fields["updated_at"] = time.time()
+    await store.update(job_id, fields)
+
+
+async def _worker(number: int) -> None:
+    queue = JobQueue.get_queue()
+    store = JobQueue.get_store()
+    while True:
+        job_id, domain, arguments = await queue.get()
+        JobQueue._queued_chars -= len(arguments.get("dom") or "")
+        JobQueue._running.add(job_id)
+        try:
+            await _run_job(store, job_id, domain, arguments)
+        except Exception as e:
+            logger.error(f"Job worker {number} could not record job {job_id}: {str(e)}")
+        finally:
+            JobQueue._running.discard(job_id)
+            store.finish(job_id)
+            queue.task_done()
+
+
+def start_job_workers() -> None:
+    if JobQueue._workers:
+        return
+    JobQueue._workers = [asyncio.create_task(_worker(number)) for number in range(settings.JOB_WORKERS)]
+    logger.info(f"Started {settings.JOB_WORKERS} job workers ({settings.JOB_STORE} job store)")
+
+
+async def stop_job_workers(timeout: float) -> None:
+    """
+    Stop taking jobs, give the queued ones up to timeout to finish, then cancel
+    the workers and fail the jobs they didn't get to
+    """
+    workers, JobQueue._workers = JobQueue._workers, []
+    if not workers:
+        return
+    queue = JobQueue.get_queue()
+    if queue.qsize():
+        logger.info(f"Waiting for {queue.qsize()} queued jobs to finish")
+    try:
+        await asyncio.wait_for(queue.join(), timeout=timeout)
+    except asyncio.TimeoutError:
+        pass
+    unfinished = list(JobQueue._running)
+    while not queue.empty():
+        unfinished.append(queue.get_nowait()[0])
+        queue.task_done()
+    JobQueue._queued_chars = 0
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+
+    if unfinished:
+        logger.warning(f"Shutdown left {len(unfinished)} jobs unfinished, failing them")
+    store = JobQueue.get_store()
+    for job_id in unfinished:
+        try:
+            await store.update(job_id, {"status": FAILED, "status_code": 503, "error": SHUTDOWN_ERROR, "updated_at": time.time()})
+        except Exception as e:
+            logger.error(f"Could not fail job {job_id} on shutdown: {str(e)}")
+        store.finish(job_id)
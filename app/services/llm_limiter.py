@@ -0,0 +1,39 @@
+# app/services/llm_limiter.py
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMLimiter:
+    """
+    Process-wide limit on concurrent Gemini calls plus the in-flight count
+    reported by the health endpoint.
+    """
+    _semaphore = None
+    _inflight = 0
+
+    @classmethod
+    def get_semaphore(cls) -> asyncio.Semaphore:
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        return cls._semaphore
+
+    @classmethod
+    def inflight(cls) -> int:
+        return cls._inflight
+
+
+@asynccontextmanager
+async def llm_slot():
+    """Hold one of the LLM concurrency slots for the duration of a call"""
+    async with LLMLimiter.get_semaphore():
+        LLMLimiter._inflight += 1
+        try:
+            yield
+        finally:
+            LLMLimiter._inflight -= 1
+
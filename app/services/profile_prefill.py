@@ -0,0 +1,188 @@
+# app/services/profile_prefill.py
+import functools
+import logging
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from app.models.form_element import FormElement
+
+logger = logging.getLogger(__name__)
+
+'''
+Deterministic prefill of the fields a user profile answers unambiguously.
+
+parse_profile() pulls email, phone, name and social/website links out of the
+free-text user prompt (once per distinct prompt), classify_field() maps an
+element to one of those profile keys from its label and selector, and
+prefill() fills what it can. Only the unresolved elements are sent to Gemini.
+
+The classifier errs on the side of leaving a field to the LLM: it matches
+whole short labels only, and choice fields (selects, checkboxes, radios) and
+fields about someone else (referrer, emergency contact, company, ...) are
+never prefilled.
+'''
+
+EMAIL = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)*\.[A-Za-z]{2,}')
+PHONE = re.compile(r'(?<![\w/])[+(]?\d[\d\s().-]{7,}\d(?![\w/])')
+# Digit runs that look like a phone number but are year ranges or dates ("2015-2019", "2021-03-01")
+NOT_PHONE = re.compile(r'\b\d{4}\s*[-\u2013]\s*\d{2,4}\b')
+LINKEDIN = re.compile(r'(?:https?://)?(?:[\w-]+\.)?linkedin\.com/in/[\w%-]+/?', re.IGNORECASE)
+GITHUB = re.compile(r'(?:https?://)?(?:www\.)?github\.com/([A-Za-z0-9-]+)', re.IGNORECASE)
+TWITTER_URL = re.compile(r'(?:https?://)?(?:www\.)?(?:twitter|x)\.com/(\w{1,15})\b', re.IGNORECASE)
+TWITTER_HANDLE = re.compile(r'\b(?:twitter|x)\b\s*(?:handle|username)?\s*(?:is|:|-)?\s*@(\w{1,15})\b', re.IGNORECASE)
+WEBSITE = re.compile(
+    r'\b(?:website|portfolio|personal site|homepage|blog)\s*(?:is|:|-|at)?\s*((?:https?://)?[\w-]+(?:\.[\w-]+)+(?:/\S*)?)',
+    re.IGNORECASE
+)
+NAME = re.compile(
+    # Only the cue is case-insensitive, the name itself has to be capitalised
+    r"(?i:\bmy (?:full )?name is|(?:^|[\n,;.])\s*(?:full )?name\s*:)\s*([A-Z][\w'.-]*(?:[ \t]+[A-Z][\w'.-]*){0,3})"
+)
+
+# Capitalised words that end a name rather than continue it
+NAME_STOP_WORDS = {"My", "I", "I'm", "Im", "And", "From", "The", "A", "An", "Currently", "Based"}
+GITHUB_RESERVED = {"orgs", "features", "topics", "about", "pricing", "sponsors", "marketplace"}
+
+# Labels about other people or organisations, never filled from the user's own profile
+FOREIGN_SUBJECT = re.compile(
+    r'\b(?:refer\w*|reference|emergency|friend|manager|supervisor|company|organi[sz]ation|'
+    r'startup|team|partner|co-?founder|parent|guardian|spouse|recruiter|advisor)\b'
+)
+
+# (profile key, pattern on a whole normalized label or selector hint). Anchored, so
+# "Mobile app idea" or "Email me updates?" are left to the LLM
+FIELD_RULES = [
+    ("email", re.compile(r'^(?:your |work |personal |contact )?e ?mail(?: address| id)?$')),
+    ("linkedin", re.compile(r'^(?:your )?linked ?in(?: profile)?(?: url| link)?$')),
+    ("github", re.compile(r'^(?:your )?git ?hub(?: profile| username| handle)?(?: url| link)?$')),
+    ("twitter", re.compile(r'^(?:your )?(?:twitter|x com)(?: profile| username| handle)?(?: url| link)?$|^x (?:username|handle)$')),
+    ("phone", re.compile(
+        r'^(?:your |mobile |cell |contact |primary )?(?:phone|mobile|telephone|tel|cell|whatsapp)(?: phone)?(?: number| no)?$'
+    )),
+    ("website", re.compile(r'^(?:your |personal )?(?:website|personal site|portfolio|homepage)(?: url| link)?$')),
+    ("first_name", re.compile(r'^(?:your )?(?:first ?name|given name|forename)$')),
+    ("last_name", re.compile(r'^(?:your )?(?:last ?name|surname|family name)$')),
+    ("full_name", re.compile(r'^(?:your |full |legal )?name$|^full ?name$|^name (?:and )?surname$')),
+]
+# Label suffixes that don't change what a field asks for
+LABEL_SUFFIX = re.compile(r' (?:required|optional)$')
+# Checkboxes, radios and options of a group: their value is a choice, not profile text
+CHOICE_SELECTOR = re.compile(r"\[type\s*=\s*['\"]?(?:checkbox|radio)\b|\[value\s*[*^$~|]?=|\boption\b", re.IGNORECASE)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r'[^a-z0-9]+', ' ', (text or "").lower()).split())
+
+
+def _selector_hints(selector: str) -> List[str]:
+    # type/name/id values inside the selector, e.g. input[type='email'], #phone_number
+    hints = re.findall(r"\[(?:type|name|id|aria-label)\s*[*^$~|]?=\s*['\"]?([^'\"\]]+)", selector or "")
+    hints += re.findall(r'#([\w-]+)', selector or "")
+    return hints
+
+
+def is_phone_number(candidate: str) -> bool:
+    """
+    Whether a PHONE match is shaped like a phone number: an international
+    (+...) or area-code ((...)) prefix with 8+ digits, or 9+ digits
+    otherwise, and not a year range or a date
+    """
+    candidate = candidate.strip()
+    digits = len(re.sub(r'\D', '', candidate))
+    if candidate[:1] in ("+", "("):
+        return digits >= 8
+    return digits >= 9 and not NOT_PHONE.search(candidate)
+
+
+def _phone_number(text: str) -> Optional[str]:
+    for match in PHONE.finditer(text):
+        if is_phone_number(match.group(0)):
+            return " ".join(match.group(0).split())
+    return None
+
+
+@functools.lru_cache(maxsize=256)
+def parse_profile(user_prompt: str) -> Dict[str, str]:
+    """Profile fields stated in the prompt, parsed once per distinct prompt"""
+    profile = {}
+    text = user_prompt or ""
+
+    email = EMAIL.search(text)
+    if email:
+        profile["email"] = email.group(0)
+
+    phone = _phone_number(EMAIL.sub(" ", text))
+    if phone:
+        profile["phone"] = phone
+
+    linkedin = LINKEDIN.search(text)
+    if linkedin:
+        url = linkedin.group(0).rstrip("/")
+        profile["linkedin"] = url if url.lower().startswith("http") else f"https://{url}"
+
+    # Repository links point at orgs too, the account linked most often is the user's
+    github_users = Counter(user for user in GITHUB.findall(text) if user.lower() not in GITHUB_RESERVED)
+    if github_users:
+        profile["github"] = f"https://github.com/{github_users.most_common(1)[0][0]}"
+
+    twitter = TWITTER_URL.search(text) or TWITTER_HANDLE.search(text)
+    if twitter:
+        profile["twitter"] = f"https://twitter.com/{twitter.group(1)}"
+
+    website = WEBSITE.search(text)
+    if website:
+        url = website.group(1).rstrip(".,;)")
+        profile["website"] = url if url.lower().startswith("http") else f"https://{url}"
+
+    name = NAME.search(text)
+    if name:
+        words = []
+        for word in name.group(1).split():
+            if word in NAME_STOP_WORDS:
+                break
+            # Keep the dot of an initial, drop a sentence's full stop
+            words.append(word.rstrip(",") if len(word) <= 2 else word.rstrip(".,"))
+        if words:
+            profile["full_name"] = " ".join(words)
+            profile["first_name"] = words[0]
+            if len(words) > 1:
+                profile["last_name"] = " ".join(words[1:])
+    return profile
+
+
+def classify_field(element: FormElement) -> Optional[str]:
+    """The profile key an element asks for, None when it isn't obvious"""
+    if element.options or CHOICE_SELECTOR.search(element.querySelectorInput or ""):
+        return None
+    label = LABEL_SUFFIX.sub("", _normalize(element.label))
+    if FOREIGN_SUBJECT.search(label):
+        return None
+    # The label first, then each type/name/id hint of the selector on its own
+    for text in [label] + [_normalize(hint) for hint in _selector_hints(element.querySelectorInput)]:
+        if not text:
+            continue
+        for key, pattern in FIELD_RULES:
+            if pattern.search(text):
+                return key
+    return None
+
+
+def prefill(form_elements: List[FormElement], user_prompt: Optional[str]) -> Tuple[Dict[int, FormElement], List[FormElement]]:
+    """
+    Fill the elements the profile answers.
+
+    Returns ({position in form_elements: filled element}, unresolved elements).
+    """
+    profile = parse_profile(user_prompt) if user_prompt else {}
+    filled = {}
+    unresolved = []
+    for position, element in enumerate(form_elements):
+        key = classify_field(element) if profile else None
+        if key and profile.get(key):
+            filled[position] = element.with_value(profile[key])
+        else:
+            unresolved.append(element)
+    if filled:
+        logger.info(f"Prefilled {len(filled)} of {len(form_elements)} elements from the user profile")
+    return filled, unresolved
@@ -0,0 +1,101 @@
+# app/services/selector_utils.py
+import functools
+import logging
+from typing import Dict, Optional
+
+import soupsieve as sv
+from bs4 import BeautifulSoup
+
+from app.services.clean_html import release_soup
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Fillable controls a container selector is expected to cover
+FORM_INPUTS_SELECTOR = (
+    'input:not([type="hidden"]):not([type="submit"]):not([type="button"]):not([type="image"]), '
+    'select, textarea'
+)
+
+
+@functools.lru_cache(maxsize=2048)
+def compile_selector(selector: str) -> Optional[sv.SoupSieve]:
+    """
+    Compile a CSS selector once per process.
+
+    Returns None for selectors soupsieve can't parse, so callers can treat a
+    broken selector like one that matches nothing.
+    """
+    if not selector:
+        return None
+    try:
+        return sv.compile(selector)
+    except Exception as e:
+        logger.warning(f"Invalid CSS selector {selector!r}: {str(e)}")
+        return None
+
+
+def select(soup, selector: str) -> list:
+    """soup.select() through the compiled-selector cache"""
+    compiled = compile_selector(selector)
+    if compiled is None:
+        return []
+    return compiled.select(soup)
+
+
+def score_selector(html: str, selector: str) -> Dict:
+    """
+    Score how well a container selector describes the form in html.
+
+    - matches: number of elements the selector matches
+    - coverage: share of the form's inputs that sit inside a matched container
+    - precision: share of matched containers that hold at least one input
+    - score: coverage * precision
+
+    A generic selector like "form *" matches every node, so its precision (and
+    score) collapses even though coverage is perfect.
+    """
+    compiled = compile_selector(selector)
+    if compiled is None:
+        return {"selector": selector, "valid": False, "matches": 0, "coverage": 0.0, "precision": 0.0, "score": 0.0}
+
+    soup = BeautifulSoup(html, 'html.parser')
+    containers = compiled.select(soup)
+    inputs = compile_selector(FORM_INPUTS_SELECTOR).select(soup)
+
+    container_ids = {id(container) for container in containers}
+    covered = 0
+    containers_with_inputs = set()
+    for input_element in inputs:
+        # Walk up from each input instead of searching every container's subtree
+        node = input_element
+        while node is not None:
+            if id(node) in container_ids:
+                covered += 1
+                containers_with_inputs.add(id(node))
+                break
+            node = node.parent
+
+    coverage = covered / len(inputs) if inputs else 0.0
+    precision = len(containers_with_inputs) / len(containers) if containers else 0.0
+    # The tree is full of parent/child cycles, free it now rather than at the next GC run
+    release_soup(soup)
+    return {
+        "selector": selector,
+        "valid": True,
+        "matches": len(containers),
+        "inputs": len(inputs),
+        "coverage": round(coverage, 3),
+        "precision": round(precision, 3),
+        "score": round(coverage * precision, 3),
+    }
+
+
+def is_acceptable_selector(selector_score: Dict) -> bool:
+    """Whether a scored mapping is good enough to persist and reuse"""
+    return (
+        selector_score.get("valid", False)
+        and selector_score.get("matches", 0) > 0
+        and selector_score.get("coverage", 0.0) >= settings.SELECTOR_MIN_COVERAGE
+        and selector_score.get("precision", 0.0) >= settings.SELECTOR_MIN_PRECISION
+    )
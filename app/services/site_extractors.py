@@ -0,0 +1,359 @@
+# app/services/site_extractors.py
+import json
+import logging
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup
+
+from app.models.form_element import FormElement
+from app.services.clean_html import release_soup
+
+logger = logging.getLogger(__name__)
+
+'''
+Registry of deterministic, site-specific form extractors.
+
+Well known form platforms embed the full form definition in the page
+(Typeform's window.rendererData, Google Forms' FB_PUBLIC_LOAD_DATA_, the
+Next.js payload of Fillout and Tally) or render a fixed markup (Jotform).
+For those we can build the form elements directly, without any Gemini call.
+
+Every extractor returns FormElement records (querySelectorInput, label and,
+for choice questions, options) like the rest of the pipeline.
+
+An extractor is matched by domain pattern or, for custom domains, by a DOM
+signature. extract() must work on the raw (uncleaned) DOM because most of the
+data lives in <script> tags that clean_html removes.
+'''
+
+
+class SiteExtractor(ABC):
+    name: str = ""
+    # Hosts handled by this extractor, matched exactly or as a parent domain
+    domain_patterns: tuple = ()
+    # Regex identifying the platform in the raw DOM (custom domains, embeds)
+    dom_signature: Optional[re.Pattern] = None
+    # Dummy container selector stored with the mapping, ignored on lookup
+    query_selector: str = "form"
+    # Response format expected by the extension for this platform
+    fill_type: str = "direct"
+    response_domain: Optional[str] = None
+
+    def matches_domain(self, domain: str) -> bool:
+        domain = (domain or "").lower()
+        return any(domain == pattern or domain.endswith("." + pattern) for pattern in self.domain_patterns)
+
+    def matches(self, domain: str, html: Optional[str] = None) -> bool:
+        if self.matches_domain(domain):
+            return True
+        return bool(html and self.dom_signature is not None and self.dom_signature.search(html))
+
+    @abstractmethod
+    def extract(self, html: str) -> List[FormElement]:
+        pass
+
+
+_registry: List[SiteExtractor] = []
+
+
+def register_extractor(extractor_class):
+    """Class decorator adding an extractor instance to the registry"""
+    _registry.append(extractor_class())
+    return extractor_class
+
+
+def get_extractors() -> List[SiteExtractor]:
+    return list(_registry)
+
+
+def find_extractor(domain: str, html: Optional[str] = None) -> Optional[SiteExtractor]:
+    """
+    Return the extractor for a domain, falling back to DOM signatures.
+
+    Domain patterns are checked first for every extractor so a cheap host match
+    always wins over scanning the DOM.
+    """
+    for extractor in _registry:
+        if extractor.matches_domain(domain):
+            return extractor
+    if html:
+        for extractor in _registry:
+            if extractor.dom_signature is not None and extractor.dom_signature.search(html):
+                return extractor
+    return None
+
+
+def extract_with_registry(domain: str, html: str) -> Optional[Dict]:
+    """
+    Run the matching site extractor on the raw DOM.
+
+    Returns {"extractor": name, "querySelectorAll": selector, "elements": [...],
+    "response_format": envelope} or None when no extractor matches or the
+    extractor found nothing, in which case the caller continues with the
+    generic pipeline. The envelope is the matched extractor's, also when it was
+    found by DOM signature on a domain fill_response_format() doesn't know.
+    """
+    if not html:
+        return None
+    extractor = find_extractor(domain, html)
+    if extractor is None:
+        return None
+    try:
+        form_elements = extractor.extract(html)
+    except Exception as e:
+        logger.error(f"{extractor.name} extractor failed: {str(e)}")
+        return None
+    if not form_elements:
+        logger.info(f"{extractor.name} extractor matched {domain} but found no form elements")
+        return None
+    logger.info(f"Extracted {len(form_elements)} elements with {extractor.name} extractor")
+    return {
+        "extractor": extractor.name,
+        "querySelectorAll": extractor.query_selector,
+        "elements": form_elements,
+        "response_format": response_format(extractor, domain),
+    }
+
+
+def fill_response_format(domain: str) -> Dict:
+    """The type/domain envelope the extension expects for a filled form"""
+    return response_format(find_extractor(domain), domain)
+
+
+def response_format(extractor: Optional[SiteExtractor], domain: str) -> Dict:
+    """The fill envelope of an extractor's platform, "direct" without one"""
+    if extractor is not None and extractor.fill_type != "direct":
+        return {"type": extractor.fill_type, "domain": extractor.response_domain or domain}
+    return {"type": "direct", "domain": domain}
+
+
+def _strip_tags(text: str) -> str:
+    return re.sub(r'<[^>]+>', '', text or '').strip()
+
+
+def _css_string(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _load_next_data(html: str) -> Optional[Dict]:
+    match = re.search(r'<script id="__NEXT_DATA__"[^>]*>(.*?)</script>', html, re.DOTALL)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return None
+
+
+@register_extractor
+class TypeformExtractor(SiteExtractor):
+    name = "typeform"
+    domain_patterns = ("typeform.com",)
+    dom_signature = re.compile(r'window\.rendererData\s*=')
+    fill_type = "enter"
+    response_domain = "typeform.com"
+
+    def extract(self, html: str) -> List[FormElement]:
+        # Try to find the rendererData in the HTML
+        renderer_data_pattern = r'window\.rendererData\s*=\s*({.+?});'
+        render_data_match = re.search(renderer_data_pattern, html, re.DOTALL)
+        if not render_data_match:
+            return []
+
+        # Get the full rendererData string
+        render_data_str = render_data_match.group(1).strip()
+        # Instead of parsing the entire JSON, use regex to extract just the form object
+        form_pattern = r'form:\s*({.+?"_links":.+?})(?=,\s*(?:messages|hubspotIntegration|intents|integrations|messages):|$)'
+        form_match = re.search(form_pattern, render_data_str, re.DOTALL)
+        if not form_match:
+            return []
+
+        # Clean the extracted form JSON
+        form_json_str = form_match.group(1)
+        form_json_str = re.sub(r',\s*}', '}', form_json_str)
+        form_json_str = re.sub(r',\s*]', ']', form_json_str)
+
+        try:
+            form_data = json.loads(form_json_str)
+        except json.JSONDecodeError:
+            logger.warning("Failed to parse Typeform form JSON from rendererData")
+            return []
+
+        form_elements = []
+        for field in form_data.get('fields', []):
+            field_type = field.get('type', '')
+            field_ref = field.get('ref', '')
+            if field_type and field_ref:
+                # Create the selector based on the type and ref
+                query_selector_input = (f"*[aria-labelledby^=\"{field_type}-{field_ref}\"], "
+                                        f"*[aria-describedby^=\"{field_type}-{field_ref}\"]")
+                form_elements.append(FormElement(query_selector_input, field.get('title', '')))
+        return form_elements
+
+
+@register_extractor
+class GoogleFormsExtractor(SiteExtractor):
+    name = "google_forms"
+    domain_patterns = ("docs.google.com", "forms.gle")
+    dom_signature = re.compile(r'FB_PUBLIC_LOAD_DATA_\s*=')
+
+    # Item types carrying an answer, see FB_PUBLIC_LOAD_DATA_[1][1][i][3]
+    input_types = {
+        0: "input[type='text']",   # short answer
+        1: "textarea",             # paragraph
+        2: "[role='radio']",       # multiple choice
+        3: "[role='listbox']",     # dropdown
+        4: "[role='checkbox']",    # checkboxes
+        5: "[role='radio']",       # linear scale
+        7: "[role='radio']",       # grid
+        9: "input[type='date']",   # date
+        10: "input[type='text']",  # time
+    }
+
+    def extract(self, html: str) -> List[FormElement]:
+        match = re.search(r'FB_PUBLIC_LOAD_DATA_\s*=\s*(.*?);\s*</script>', html, re.DOTALL)
+        if not match:
+            return []
+        try:
+            load_data = json.loads(match.group(1))
+            items = load_data[1][1] or []
+        except (json.JSONDecodeError, IndexError, TypeError):
+            logger.warning("Failed to parse FB_PUBLIC_LOAD_DATA_")
+            return []
+
+        form_elements = []
+        for item in items:
+            if len(item) < 5 or item[3] not in self.input_types or not item[4]:
+                continue
+            entry_id = item[4][0][0]
+            # The question container carries the entry id in its data-params attribute
+            container = f"[data-params*=\"[[{entry_id},\"]"
+            options = [option[0] for option in (item[4][0][1] or []) if option and option[0]]
+            form_elements.append(FormElement(
+                f"{container} {self.input_types[item[3]]}",
+                (item[1] or "").strip(),
+                options=options or None
+            ))
+        return form_elements
+
+
+@register_extractor
+class FilloutExtractor(SiteExtractor):
+    name = "fillout"
+    domain_patterns = ("fillout.com",)
+    dom_signature = re.compile(r'"flowSnapshot"\s*:')
+
+    input_widgets = {
+        "ShortAnswer", "LongAnswer", "EmailInput", "PhoneNumber", "NumberInput",
+        "URLInput", "Dropdown", "MultipleChoice", "Checkboxes", "DatePicker",
+    }
+    choice_widgets = {"MultipleChoice", "Checkboxes"}
+
+    def extract(self, html: str) -> List[FormElement]:
+        next_data = _load_next_data(html)
+        if not next_data:
+            return []
+        try:
+            template = next_data["props"]["pageProps"]["flowSnapshot"]["template"]
+            steps = template["steps"]
+        except (KeyError, TypeError):
+            return []
+
+        # Walk the steps in flow order starting from firstStep
+        ordered_steps = []
+        step_id = template.get("firstStep")
+        while step_id in steps and steps[step_id] not in ordered_steps:
+            ordered_steps.append(steps[step_id])
+            step_id = (steps[step_id].get("nextStep") or {}).get("defaultNextStep")
+        ordered_steps += [step for step in steps.values() if step not in ordered_steps]
+
+        form_elements = []
+        for step in ordered_steps:
+            widgets = ((step.get("template") or {}).get("widgets") or {}).values()
+            widgets = sorted(widgets, key=lambda w: ((w.get("position") or {}).get("row", 0),
+                                                     (w.get("position") or {}).get("column", 0)))
+            for widget in widgets:
+                if widget.get("type") not in self.input_widgets:
+                    continue
+                label_logic = ((widget.get("template") or {}).get("label") or {}).get("logic") or {}
+                label = _strip_tags(label_logic.get("value", ""))
+                if not label:
+                    continue
+                if widget.get("type") in self.choice_widgets:
+                    # Choice groups point at the "<widget id>-label" element
+                    query_selector_input = f"[aria-labelledby~=\"{widget.get('id')}-label\"]"
+                else:
+                    # Text-like inputs carry the question label as their aria-label
+                    label_attr = _css_string(label)
+                    query_selector_input = f"input[aria-label=\"{label_attr}\"], textarea[aria-label=\"{label_attr}\"]"
+                form_elements.append(FormElement(query_selector_input, label))
+        return form_elements
+
+
+@register_extractor
+class TallyExtractor(SiteExtractor):
+    name = "tally"
+    domain_patterns = ("tally.so",)
+    dom_signature = re.compile(r'"blocks"\s*:\s*\[\s*{\s*"uuid"')
+
+    label_blocks = {"TITLE", "LABEL", "QUESTION"}
+    input_blocks = {
+        "INPUT_TEXT", "INPUT_EMAIL", "INPUT_PHONE_NUMBER", "INPUT_NUMBER", "INPUT_LINK",
+        "INPUT_DATE", "INPUT_TIME", "TEXTAREA", "DROPDOWN", "MULTIPLE_CHOICE", "CHECKBOXES",
+    }
+
+    def extract(self, html: str) -> List[FormElement]:
+        next_data = _load_next_data(html)
+        if not next_data:
+            return []
+        blocks = (next_data.get("props") or {}).get("pageProps", {}).get("blocks") or []
+
+        form_elements = []
+        labels_by_group = {}
+        for block in blocks:
+            block_type = block.get("type", "")
+            payload = block.get("payload") or {}
+            if block_type in self.label_blocks:
+                text = _strip_tags(payload.get("html") or payload.get("text") or "")
+                if text:
+                    labels_by_group[block.get("groupUuid")] = text
+                continue
+            if block_type not in self.input_blocks:
+                continue
+            uuid = block.get("uuid")
+            if not uuid:
+                continue
+            label = labels_by_group.get(block.get("groupUuid")) or payload.get("placeholder", "")
+            form_elements.append(FormElement(f"[name=\"{uuid}\"], [id=\"{uuid}\"]", label))
+        return form_elements
+
+
+@register_extractor
+class JotformExtractor(SiteExtractor):
+    name = "jotform"
+    domain_patterns = ("jotform.com", "jotform.me", "jotform.co", "jotform.eu")
+    dom_signature = re.compile(r'class="[^"]*jotform-form')
+    query_selector = "li.form-line"
+
+    def extract(self, html: str) -> List[FormElement]:
+        soup = BeautifulSoup(html, 'html.parser')
+        form_elements = []
+        for line in soup.select("li.form-line"):
+            label = line.select_one("label.form-label")
+            label_text = label.get_text(" ", strip=True).rstrip("*").strip() if label else ""
+            for input_element in line.find_all(['input', 'select', 'textarea']):
+                if input_element.get('type') in ('hidden', 'submit', 'button'):
+                    continue
+                input_id = input_element.get('id')
+                if not input_id:
+                    continue
+                # Sub-fields (first/last name, address lines) have their own sublabel
+                sublabel = line.find('label', attrs={'for': input_id}, class_='form-sub-label')
+                element_label = label_text
+                if sublabel:
+                    element_label = f"{label_text} - {sublabel.get_text(strip=True)}" if label_text else sublabel.get_text(strip=True)
+                form_elements.append(FormElement(f"#{input_id}", element_label))
+        release_soup(soup)
+        return form_elements
@@ -0,0 +1,98 @@
+# app/services/token_budget.py
+import json
+import logging
+from typing import Any, List, Tuple
+
+from app.models.form_element import FormElement, dump_elements
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+'''
+Output-token budgets for the Gemini calls and repair of truncated JSON answers.
+
+Counts use tiktoken's cl100k_base encoding. Gemini tokenizes differently, so
+budgets carry a safety margin (TOKEN_BUDGET_MARGIN) rather than relying on an
+exact count. The encoding file is downloaded on first use (baked into the
+image through TIKTOKEN_CACHE_DIR); until it is loaded, or if it can't be,
+counts fall back to four characters per token.
+'''
+
+ENCODING_NAME = "cl100k_base"
+
+
+class TokenEncoding:
+    """Lazily loaded tiktoken encoding, loading is attempted once per process"""
+    _encoding = None
+    _attempted = False
+
+    @classmethod
+    def load(cls):
+        if not cls._attempted:
+            cls._attempted = True
+            try:
+                import tiktoken  # type: ignore
+                cls._encoding = tiktoken.get_encoding(ENCODING_NAME)
+            except Exception as e:
+                logger.warning(f"tiktoken encoding unavailable, estimating tokens from length: {str(e)}")
+        return cls._encoding
+
+    @classmethod
+    def get(cls):
+        # Never triggers the download on the request path, see warm_up_token_counter()
+        return cls._encoding
+
+
+def warm_up_token_counter():
+    """Load the encoding (and download it if it isn't cached) before taking traffic"""
+    TokenEncoding.load()
+
+
+def count_tokens(text: str) -> int:
+    encoding = TokenEncoding.get()
+    if encoding is None:
+        return len(text or "") // 4 + 1
+    return len(encoding.encode(text or "", disallowed_special=()))
+
+
+def fill_output_budget(form_elements: List[FormElement]) -> int:
+    """
+    max_output_tokens for fill_form_values.
+
+    The answer repeats every element and adds a value, so the budget is the
+    token count of the elements themselves plus FILL_VALUE_TOKENS per element
+    for the value and its key, with the safety margin on top. Options are
+    input only (the answer schema has no options), so they aren't counted.
+    """
+    echoed = count_tokens(dump_elements([FormElement(element.querySelectorInput, element.label) for element in form_elements]))
+    values = len(form_elements) * settings.FILL_VALUE_TOKENS
+    budget = int((echoed + values) * settings.TOKEN_BUDGET_MARGIN)
+    return max(settings.FILL_MIN_OUTPUT_TOKENS, min(budget, settings.FILL_MAX_OUTPUT_TOKENS))
+
+
+def salvage_json_array(text: str) -> Tuple[List[Any], bool]:
+    """
+    Decode the complete items at the start of a (possibly truncated) JSON array.
+
+    Returns (items, complete); complete is False when the text stops before the
+    closing bracket or an item couldn't be decoded.
+    """
+    decoder = json.JSONDecoder()
+    text = (text or "").strip()
+    if not text.startswith("["):
+        return [], False
+
+    items = []
+    position = 1
+    while True:
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        if position >= len(text):
+            return items, False
+        if text[position] == "]":
+            return items, True
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            return items, False
+        items.append(item)
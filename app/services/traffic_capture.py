@@ -0,0 +1,250 @@
+# app/services/traffic_capture.py
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import random
+import re
+import time
+from typing import Any, Dict, Optional, Set
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import orjson
+
+from bs4 import BeautifulSoup
+
+from app.services.clean_html import release_soup
+from app.services.profile_prefill import EMAIL, PHONE, is_phone_number
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+'''
+Opt-in capture of sampled API traffic for replay against new builds
+(scripts/replay_traffic.py).
+
+Each worker appends to its own gzip JSONL file in TRAFFIC_CAPTURE_DIR. A
+"request" line holds the arrival time (seconds since the capture started),
+method, path, query, scrubbed JSON body, status and duration. DOMs are
+replaced by their hash in the body and written once per file as a "dom"
+line, so a page requested a thousand times is stored once.
+
+Scrubbing happens before anything touches the disk:
+- user_prompt and custom_command are replaced by synthetic text of the same
+  length, so prompt sizes and token budgets stay realistic
+- DOMs lose input values, textarea and contenteditable contents, the
+  selected/checked state of options, and the query string and fragment of
+  their href/src/action URLs
+- text in DOMs is only scrubbed of email addresses and phone numbers; names,
+  addresses and other text on the page are kept as they are
+- URLs lose their query string and fragment
+Headers are never captured.
+
+Records are encoded and written by a background task off the request path;
+when the queue is full, records are dropped rather than slowing requests.
+'''
+
+SYNTHETIC_PROFILE = (
+    "My name is Jane Doe, my email is jane.doe@example.com and my phone is +1 555 0100 123. "
+    "LinkedIn linkedin.com/in/janedoe, GitHub github.com/janedoe. I am a software engineer "
+    "building developer tools and looking for a role on a small product team. "
+)
+SCRUBBED_FIELDS = ("user_prompt", "custom_command")
+URL_FIELDS = ("url",)
+
+INPUT_VALUE = re.compile(r'(<input\b[^>]*?\svalue\s*=\s*)("[^"]*"|\'[^\']*\'|[^\s>]+)', re.IGNORECASE)
+TEXTAREA_CONTENT = re.compile(r'(<textarea\b[^>]*>)(.*?)(</textarea>)', re.IGNORECASE | re.DOTALL)
+CHOICE_TAG = re.compile(r'<(?:input|option)\b[^>]*>', re.IGNORECASE)
+CHOICE_STATE = re.compile(r'\s(?:selected|checked)(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s>]+))?', re.IGNORECASE)
+TEXT_NODE = re.compile(r'>([^<]+)<')
+URL_ATTRIBUTE = re.compile(r'(\s(?:href|src|action|formaction)\s*=\s*)("[^"]*"|\'[^\']*\'|[^\s>]+)', re.IGNORECASE)
+SYNTHETIC_PHONE = "+1 555 0100 123"
+
+
+def synthetic_text(length: int) -> str:
+    repeats = length // len(SYNTHETIC_PROFILE) + 1
+    return (SYNTHETIC_PROFILE * repeats)[:length]
+
+
+def scrub_url(url: Any) -> Any:
+    if not isinstance(url, str):
+        return url
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return ""
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+
+
+def scrub_query(query: str) -> str:
+    """Query strings of the detect endpoints carry URLs, keep the parameters but scrub the URLs"""
+    pairs = parse_qsl(query, keep_blank_values=True)
+    return urlencode([(key, scrub_url(value) if key in URL_FIELDS else value) for key, value in pairs])
+
+
+def _scrub_phones(match: re.Match) -> str:
+    text = PHONE.sub(lambda phone: SYNTHETIC_PHONE if is_phone_number(phone.group(0)) else phone.group(0), match.group(1))
+    return f">{text}<"
+
+
+def _scrub_url_attribute(match: re.Match) -> str:
+    value = match.group(2)
+    quote = value[0] if value[:1] in ('"', "'") else ""
+    url = value[1:-1] if quote else value
+    return f"{match.group(1)}{quote}{scrub_url(url)}{quote}"
+
+
+def _clear_contenteditable(dom: str) -> str:
+    # Editors nest their own markup, so this needs a parse rather than a regex
+    soup = BeautifulSoup(dom, 'html.parser')
+    try:
+        for editable in soup.find_all(attrs={"contenteditable": True}):
+            if (editable.get("contenteditable") or "").lower() != "false":
+                editable.clear()
+        return str(soup)
+    finally:
+        release_soup(soup)
+
+
+def scrub_dom(dom: str) -> str:
+    dom = INPUT_VALUE.sub(r'\1""', dom)
+    dom = TEXTAREA_CONTENT.sub(r'\1\3', dom)
+    dom = CHOICE_TAG.sub(lambda tag: CHOICE_STATE.sub("", tag.group(0)), dom)
+    # Reset, invite and session links carry their tokens in the query string
+    dom = URL_ATTRIBUTE.sub(_scrub_url_attribute, dom)
+    if "contenteditable" in dom.lower():
+        dom = _clear_contenteditable(dom)
+    # Phone numbers only in text, digits in ids and attributes are part of the page structure
+    dom = TEXT_NODE.sub(_scrub_phones, dom)
+    return EMAIL.sub("jane.doe@example.com", dom)
+
+
+def dom_hash(dom: str) -> str:
+    return hashlib.sha1(dom.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def scrub_body(body: Any, doms: Dict[str, str]) -> Any:
+    """
+    Scrub a request body, moving DOMs into doms (hash -> scrubbed DOM).
+
+    Works on the form request, the batch request (items) and the list/URL
+    bodies of the detect endpoints.
+    """
+    if isinstance(body, list):
+        return [scrub_url(item) if isinstance(item, str) else scrub_body(item, doms) for item in body]
+    if not isinstance(body, dict):
+        return body
+    scrubbed = {}
+    for key, value in body.items():
+        if key in SCRUBBED_FIELDS and isinstance(value, str):
+            scrubbed[key] = synthetic_text(len(value))
+        elif key in URL_FIELDS:
+            scrubbed[key] = scrub_url(value)
+        elif key == "dom" and isinstance(value, str):
+            dom = scrub_dom(value)
+            digest = dom_hash(dom)
+            doms[digest] = dom
+            scrubbed[key] = {"$dom": digest}
+        elif key == "items" and isinstance(value, list):
+            scrubbed[key] = [scrub_body(item, doms) for item in value]
+        else:
+            scrubbed[key] = value
+    return scrubbed
+
+
+class CaptureWriter:
+    """Per-process capture file, queue and writer task"""
+    _queue: Optional[asyncio.Queue] = None
+    _task = None
+    _file = None
+    _path = None
+    _started = 0.0
+    _written_doms: Set[str] = set()
+
+    @classmethod
+    def running(cls) -> bool:
+        return cls._task is not None and not cls._task.done()
+
+
+def should_capture(path: str) -> bool:
+    if not CaptureWriter.running():
+        return False
+    if not any(path.startswith(prefix) for prefix in settings.TRAFFIC_CAPTURE_PATHS):
+        return False
+    return random.random() < settings.TRAFFIC_CAPTURE_SAMPLE_RATE
+
+
+def capture_offset() -> float:
+    return time.monotonic() - CaptureWriter._started
+
+
+def submit_capture(record: Dict[str, Any], body: Optional[bytes]) -> None:
+    """Queue a finished request for the writer, dropped when the writer is behind"""
+    try:
+        CaptureWriter._queue.put_nowait((record, body))
+    except asyncio.QueueFull:
+        logger.debug("Traffic capture queue is full, dropping a record")
+
+
+def _encode(record: Dict[str, Any], body: Optional[bytes]) -> bytes:
+    doms: Dict[str, str] = {}
+    record["query"] = scrub_query(record.get("query", ""))
+    if body:
+        try:
+            record["body"] = scrub_body(orjson.loads(body), doms)
+        except orjson.JSONDecodeError:
+            record["body"] = None
+    lines = []
+    for digest, dom in doms.items():
+        if digest not in CaptureWriter._written_doms:
+            CaptureWriter._written_doms.add(digest)
+            lines.append(orjson.dumps({"type": "dom", "hash": digest, "dom": dom}))
+    lines.append(orjson.dumps({"type": "request", **record}))
+    return b"\n".join(lines) + b"\n"
+
+
+def _write(record: Dict[str, Any], body: Optional[bytes]) -> None:
+    CaptureWriter._file.write(_encode(record, body))
+
+
+async def _writer_loop() -> None:
+    queue = CaptureWriter._queue
+    while True:
+        record, body = await queue.get()
+        try:
+            await asyncio.to_thread(_write, record, body)
+        except Exception as e:
+            logger.warning(f"Failed to write a captured request: {str(e)}")
+        finally:
+            queue.task_done()
+
+
+def start_traffic_capture() -> None:
+    if not settings.TRAFFIC_CAPTURE_ENABLED or CaptureWriter.running():
+        return
+    os.makedirs(settings.TRAFFIC_CAPTURE_DIR, exist_ok=True)
+    CaptureWriter._path = os.path.join(
+        settings.TRAFFIC_CAPTURE_DIR, f"capture-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.jsonl.gz"
+    )
+    CaptureWriter._file = gzip.open(CaptureWriter._path, "ab")
+    CaptureWriter._started = time.monotonic()
+    CaptureWriter._written_doms = set()
+    CaptureWriter._queue = asyncio.Queue(maxsize=settings.TRAFFIC_CAPTURE_QUEUE_SIZE)
+    CaptureWriter._task = asyncio.create_task(_writer_loop())
+    logger.info(f"Capturing {settings.TRAFFIC_CAPTURE_SAMPLE_RATE:.1%} of API traffic to {CaptureWriter._path}")
+
+
+async def stop_traffic_capture() -> None:
+    """Write what is queued and close the file so the gzip stream is complete"""
+    task, CaptureWriter._task = CaptureWriter._task, None
+    if task is None:
+        return
+    try:
+        await asyncio.wait_for(CaptureWriter._queue.join(), timeout=5)
+    except asyncio.TimeoutError:
+        logger.warning("Traffic capture stopped with records still queued")
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    CaptureWriter._file.close()
+    CaptureWriter._file = None
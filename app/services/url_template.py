@@ -0,0 +1,57 @@
+# app/services/url_template.py
+import logging
+import re
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+'''
+Normalizes form URLs into path templates so mappings can be stored per form
+rather than per domain.
+
+https://docs.google.com/forms/d/e/1FAIpQLSd.../viewform?usp=sf_link
+    -> /forms/d/e/{id}/viewform
+https://forms.fillout.com/t/8nZx1y4kUous
+    -> /t/{id}
+
+Segments that look like identifiers (numbers, UUIDs, hex digests and long
+mixed letter/digit tokens) are collapsed into {id}; the query string and
+fragment are dropped.
+'''
+
+ID_PLACEHOLDER = "{id}"
+
+ID_PATTERNS = [
+    re.compile(r'^\d+$'),
+    re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'),
+    re.compile(r'^[0-9a-fA-F]{16,}$'),
+    # Short ids and slugs with a random suffix, e.g. 8nZx1y4kUous, form-3f9a2c
+    re.compile(r'^(?=[\w-]*\d)(?=[\w-]*[A-Za-z])[\w-]{6,}$'),
+]
+
+
+def _is_id(segment: str) -> bool:
+    return any(pattern.match(segment) for pattern in ID_PATTERNS)
+
+
+def path_template(url: Optional[str]) -> Optional[str]:
+    """The normalized path template of a URL, None when there is no usable URL"""
+    if not url:
+        return None
+    try:
+        path = urlsplit(url if "//" in url else f"//{url}").path
+    except ValueError:
+        logger.warning(f"Could not parse form URL: {url}")
+        return None
+
+    segments = [segment for segment in path.split("/") if segment]
+    return "/" + "/".join(ID_PLACEHOLDER if _is_id(segment) else segment for segment in segments)
+
+
+def template_prefixes(template: Optional[str]) -> List[str]:
+    """The template and each of its parent paths, longest first, ending with "/" """
+    if not template:
+        return []
+    segments = [segment for segment in template.split("/") if segment]
+    return ["/" + "/".join(segments[:length]) for length in range(len(segments), -1, -1)]
@@ -0,0 +1,138 @@
+# app/services/write_behind.py
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.metrics import FORM_WRITE_BATCH_SIZE, FORM_WRITE_FAILURES, FORM_WRITES_PENDING
+from app.models.form import Form
+from app.mongodb import get_forms
+from app.services.caches import cache_mapping
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+'''
+Write-behind persistence of form mappings.
+
+persist_form() queues the write and returns immediately; a background task
+flushes the queue with one unordered bulk_write every
+WRITE_BEHIND_FLUSH_INTERVAL seconds, or as soon as WRITE_BEHIND_BATCH_SIZE
+writes are waiting. Writes for the same (domain, path_template) are coalesced,
+a replace wins over an insert. Until a write is flushed, pending_form() makes
+it visible to lookups in this worker, so the next request for the same form
+doesn't re-detect it.
+'''
+
+FormKey = Tuple[str, Optional[str]]
+
+
+class FormWriteQueue:
+    _pending: Dict[FormKey, Tuple[Form, bool]] = {}
+    _flushing: Dict[FormKey, Tuple[Form, bool]] = {}
+    _wakeup = None
+    _task = None
+    _stopping = False
+
+    @classmethod
+    def running(cls) -> bool:
+        return cls._task is not None and not cls._task.done()
+
+    @classmethod
+    def get_wakeup(cls) -> asyncio.Event:
+        if cls._wakeup is None:
+            cls._wakeup = asyncio.Event()
+        return cls._wakeup
+
+    @classmethod
+    def size(cls) -> int:
+        return len(cls._pending)
+
+
+def _key(form: Form) -> FormKey:
+    return form.document["domain"], form.document["path_template"]
+
+
+async def persist_form(form: Form, replace: bool = False) -> None:
+    """Queue a save() (or replace() when replace=True), writing directly when the queue isn't running"""
+    cache_mapping(form.document["domain"], form.document["path_template"], form.document["mapping"])
+    if not settings.WRITE_BEHIND_ENABLED or not FormWriteQueue.running():
+        await get_forms().bulk_write([form.write_operation(replace)])
+        return
+
+    key = _key(form)
+    if key not in FormWriteQueue._pending and FormWriteQueue.size() >= settings.WRITE_BEHIND_MAX_PENDING:
+        # The database is falling behind, don't let the backlog grow without bound
+        FORM_WRITE_FAILURES.labels("queue_full").inc()
+        logger.error(f"Write-behind queue is full, dropping the mapping for {key}")
+        return
+    queued = FormWriteQueue._pending.get(key)
+    FormWriteQueue._pending[key] = (form, replace or (queued is not None and queued[1]))
+    FORM_WRITES_PENDING.set(FormWriteQueue.size())
+    if FormWriteQueue.size() >= settings.WRITE_BEHIND_BATCH_SIZE:
+        FormWriteQueue.get_wakeup().set()
+
+
+def pending_form(domain: str, path_templates: List[Optional[str]]) -> Optional[Dict]:
+    """The first queued or in-flight mapping for the domain among path_templates, most specific first"""
+    for path_template in path_templates:
+        for buffer in (FormWriteQueue._pending, FormWriteQueue._flushing):
+            queued = buffer.get((domain, path_template))
+            if queued is not None:
+                return queued[0].document
+    return None
+
+
+async def flush_form_writes() -> int:
+    """Write everything queued so far in one bulk_write, returns the number of operations"""
+    if not FormWriteQueue._pending:
+        return 0
+    batch, FormWriteQueue._pending = FormWriteQueue._pending, {}
+    FormWriteQueue._flushing = batch
+    FORM_WRITES_PENDING.set(0)
+    try:
+        await get_forms().bulk_write(
+            [form.write_operation(replace) for form, replace in batch.values()],
+            ordered=False
+        )
+        FORM_WRITE_BATCH_SIZE.observe(len(batch))
+    except Exception as e:
+        FORM_WRITE_FAILURES.labels("bulk_write").inc(len(batch))
+        logger.error(f"Write-behind flush of {len(batch)} form writes failed: {str(e)}")
+        # Retry with the next flush; newer writes for the same form take precedence
+        for key, queued in batch.items():
+            FormWriteQueue._pending.setdefault(key, queued)
+        FORM_WRITES_PENDING.set(FormWriteQueue.size())
+    finally:
+        FormWriteQueue._flushing = {}
+    return len(batch)
+
+
+async def _flush_loop() -> None:
+    wakeup = FormWriteQueue.get_wakeup()
+    while not FormWriteQueue._stopping:
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=settings.WRITE_BEHIND_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+        await flush_form_writes()
+
+
+def start_write_behind() -> None:
+    if settings.WRITE_BEHIND_ENABLED and not FormWriteQueue.running():
+        FormWriteQueue._stopping = False
+        FormWriteQueue._task = asyncio.create_task(_flush_loop())
+
+
+async def stop_write_behind() -> None:
+    """Stop the flush loop and write whatever is still queued"""
+    task = FormWriteQueue._task
+    if task is not None:
+        # Let a flush in progress finish rather than cancelling it halfway
+        FormWriteQueue._stopping = True
+        FormWriteQueue.get_wakeup().set()
+        await asyncio.gather(task, return_exceptions=True)
+        FormWriteQueue._task = None
+    if FormWriteQueue._pending:
+        logger.info(f"Flushing {FormWriteQueue.size()} queued form writes before shutdown")
+        await flush_form_writes()
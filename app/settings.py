@@ -13,5 +13,124 @@ class Settings:
     DB_NAME: str = os.getenv("DB_NAME")
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
 
+    # Mongo connection pool, size it to LLM_MAX_CONCURRENCY plus headroom for the detect endpoints
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    MONGO_CONNECT_TIMEOUT_MS: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    MONGO_SOCKET_TIMEOUT_MS: int = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+    MONGO_READ_PREFERENCE: str = os.getenv("MONGO_READ_PREFERENCE", "primaryPreferred")
+
+    # Server / lifecycle
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "0"))  # 0 = one worker per available CPU
+    HOST: str = os.getenv("HOST", "0.0.0.0")
+    PORT: int = int(os.getenv("PORT", "8000"))
+    SHUTDOWN_DRAIN_TIMEOUT: float = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+    # Seconds a worker reports not-ready after SIGTERM before it stops accepting connections
+    SHUTDOWN_READINESS_DELAY: float = float(os.getenv("SHUTDOWN_READINESS_DELAY", "5"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+    # Form pipeline: "staged" (three Gemini calls), "combined" (one call) or "auto"
+    PIPELINE_MODE: str = os.getenv("PIPELINE_MODE", "staged")
+    # Fill fields the user's profile answers outright (email, name, links) without Gemini
+    PROFILE_PREFILL: bool = os.getenv("PROFILE_PREFILL", "true").lower() == "true"
+    # Output budget of the fill call: echoed elements plus FILL_VALUE_TOKENS per value, times the margin
+    FILL_VALUE_TOKENS: int = int(os.getenv("FILL_VALUE_TOKENS", "48"))
+    TOKEN_BUDGET_MARGIN: float = float(os.getenv("TOKEN_BUDGET_MARGIN", "1.3"))
+    FILL_MIN_OUTPUT_TOKENS: int = int(os.getenv("FILL_MIN_OUTPUT_TOKENS", "256"))
+    FILL_MAX_OUTPUT_TOKENS: int = int(os.getenv("FILL_MAX_OUTPUT_TOKENS", "8192"))
+    FILL_MAX_REPAIR_ROUNDS: int = int(os.getenv("FILL_MAX_REPAIR_ROUNDS", "2"))
+    COMBINED_PIPELINE_MAX_DOM_TOKENS: int = int(os.getenv("COMBINED_PIPELINE_MAX_DOM_TOKENS", "30000"))
+    # Prompt HTML: runs of DOM_COLLAPSE_MIN_RUN+ identical sibling subtrees without inputs and selects with more
+    # than DOM_COLLAPSE_MAX_OPTIONS options keep DOM_COLLAPSE_KEEP representatives and a count
+    DOM_COLLAPSE_ENABLED: bool = os.getenv("DOM_COLLAPSE_ENABLED", "true").lower() == "true"
+    DOM_COLLAPSE_MIN_RUN: int = int(os.getenv("DOM_COLLAPSE_MIN_RUN", "6"))
+    DOM_COLLAPSE_MAX_OPTIONS: int = int(os.getenv("DOM_COLLAPSE_MAX_OPTIONS", "15"))
+    DOM_COLLAPSE_KEEP: int = int(os.getenv("DOM_COLLAPSE_KEEP", "3"))
+    # Race site extractors, local DOM extraction and Gemini on new domains
+    SPECULATIVE_EXTRACTION: bool = os.getenv("SPECULATIVE_EXTRACTION", "true").lower() == "true"
+    SPECULATIVE_MIN_CONFIDENCE: float = float(os.getenv("SPECULATIVE_MIN_CONFIDENCE", "0.9"))
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "10"))
+
+    # Async job API: "mongo" job store is shared by all web workers, "memory" only works with one
+    JOB_STORE: str = os.getenv("JOB_STORE", "mongo")
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_QUEUE_MAX_SIZE: int = int(os.getenv("JOB_QUEUE_MAX_SIZE", "100"))
+    # Total DOM characters the queued jobs of a worker may hold
+    JOB_QUEUE_MAX_DOM_CHARS: int = int(os.getenv("JOB_QUEUE_MAX_DOM_CHARS", "50000000"))
+    JOB_TTL_SECONDS: int = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+    JOB_MAX_WAIT_SECONDS: float = float(os.getenv("JOB_MAX_WAIT_SECONDS", "30"))
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+    # Unfinished jobs not updated for this long are reported failed, their worker died
+    JOB_STALE_SECONDS: float = float(os.getenv("JOB_STALE_SECONDS", "900"))
+
+    # Cache-Control max-age (seconds) of the GET detection endpoints and the domain snapshot
+    DETECT_CACHE_MAX_AGE: int = int(os.getenv("DETECT_CACHE_MAX_AGE", "300"))
+    SNAPSHOT_CACHE_MAX_AGE: int = int(os.getenv("SNAPSHOT_CACHE_MAX_AGE", "60"))
+
+    # Request ingestion: bodies over MAX_REQUEST_BYTES and DOMs over MAX_DOM_CHARS get a 413,
+    # bodies over REQUEST_SPOOL_MAX_BYTES are buffered on disk while they are read
+    MAX_REQUEST_BYTES: int = int(os.getenv("MAX_REQUEST_BYTES", "26214400"))
+    MAX_DOM_CHARS: int = int(os.getenv("MAX_DOM_CHARS", "5242880"))
+    REQUEST_SPOOL_MAX_BYTES: int = int(os.getenv("REQUEST_SPOOL_MAX_BYTES", "1048576"))
+
+    # Write-behind queue for form mappings, flushed with bulk_write on an interval or batch size
+    WRITE_BEHIND_ENABLED: bool = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+    WRITE_BEHIND_FLUSH_INTERVAL: float = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+    WRITE_BEHIND_BATCH_SIZE: int = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+    WRITE_BEHIND_MAX_PENDING: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+
+    # SLO-aware degradation: per-stage Gemini latency (percentile, seconds) and error-rate targets
+    # over a rolling window; modes step down when the budget is exceeded and back up after a hold
+    DEGRADATION_ENABLED: bool = os.getenv("DEGRADATION_ENABLED", "true").lower() == "true"
+    DEGRADATION_WINDOW_SECONDS: float = float(os.getenv("DEGRADATION_WINDOW_SECONDS", "60"))
+    DEGRADATION_MIN_SAMPLES: int = int(os.getenv("DEGRADATION_MIN_SAMPLES", "20"))
+    DEGRADATION_LATENCY_PERCENTILE: float = float(os.getenv("DEGRADATION_LATENCY_PERCENTILE", "0.95"))
+    DEGRADATION_LATENCY_SLO: float = float(os.getenv("DEGRADATION_LATENCY_SLO", "8.0"))
+    DEGRADATION_ERROR_RATE_SLO: float = float(os.getenv("DEGRADATION_ERROR_RATE_SLO", "0.1"))
+    DEGRADATION_RECOVER_RATIO: float = float(os.getenv("DEGRADATION_RECOVER_RATIO", "0.7"))
+    DEGRADATION_STEP_SECONDS: float = float(os.getenv("DEGRADATION_STEP_SECONDS", "10"))
+    DEGRADATION_HOLD_SECONDS: float = float(os.getenv("DEGRADATION_HOLD_SECONDS", "60"))
+    DEGRADATION_BUDGET_FACTOR: float = float(os.getenv("DEGRADATION_BUDGET_FACTOR", "0.5"))
+    DEGRADATION_LLM_TIMEOUT: float = float(os.getenv("DEGRADATION_LLM_TIMEOUT", "5.0"))
+
+    # LLM provider: "gemini", or "fake" for load tests and traffic replay (answers after FAKE_LLM_LATENCY seconds)
+    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "gemini").lower()
+    FAKE_LLM_LATENCY: float = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))
+
+    # Sampled capture of API traffic (scrubbed, gzip JSONL per worker) for scripts/replay_traffic.py
+    TRAFFIC_CAPTURE_ENABLED: bool = os.getenv("TRAFFIC_CAPTURE_ENABLED", "false").lower() == "true"
+    TRAFFIC_CAPTURE_SAMPLE_RATE: float = float(os.getenv("TRAFFIC_CAPTURE_SAMPLE_RATE", "0.01"))
+    TRAFFIC_CAPTURE_DIR: str = os.getenv("TRAFFIC_CAPTURE_DIR", "/tmp/kleo-capture")
+    TRAFFIC_CAPTURE_PATHS: tuple = tuple(
+        path.strip() for path in os.getenv("TRAFFIC_CAPTURE_PATHS", "/api/v1/form,/api/v1/detect").split(",") if path.strip()
+    )
+    TRAFFIC_CAPTURE_MAX_BODY_BYTES: int = int(os.getenv("TRAFFIC_CAPTURE_MAX_BODY_BYTES", "5242880"))
+    TRAFFIC_CAPTURE_QUEUE_SIZE: int = int(os.getenv("TRAFFIC_CAPTURE_QUEUE_SIZE", "200"))
+
+    # In-process caches (TTL seconds, max entries) and their snapshot file, restored at startup.
+    # An empty CACHE_SNAPSHOT_PATH disables snapshots
+    MAPPING_CACHE_TTL: int = int(os.getenv("MAPPING_CACHE_TTL", "600"))
+    MAPPING_CACHE_SIZE: int = int(os.getenv("MAPPING_CACHE_SIZE", "5000"))
+    DETECTION_CACHE_TTL: int = int(os.getenv("DETECTION_CACHE_TTL", "300"))
+    DETECTION_CACHE_SIZE: int = int(os.getenv("DETECTION_CACHE_SIZE", "20000"))
+    WIDGET_CACHE_TTL: int = int(os.getenv("WIDGET_CACHE_TTL", "86400"))
+    WIDGET_CACHE_SIZE: int = int(os.getenv("WIDGET_CACHE_SIZE", "5000"))
+    CACHE_SNAPSHOT_PATH: str = os.getenv("CACHE_SNAPSHOT_PATH", "/tmp/kleo-cache-snapshot.json")
+    CACHE_SNAPSHOT_INTERVAL: float = float(os.getenv("CACHE_SNAPSHOT_INTERVAL", "60"))
+    CACHE_SNAPSHOT_MAX_AGE: float = float(os.getenv("CACHE_SNAPSHOT_MAX_AGE", "3600"))
+
+    # Minimum quality of a querySelectorAll mapping before it is stored or reused
+    SELECTOR_MIN_COVERAGE: float = float(os.getenv("SELECTOR_MIN_COVERAGE", "0.6"))
+    SELECTOR_MIN_PRECISION: float = float(os.getenv("SELECTOR_MIN_PRECISION", "0.5"))
+
+    # Process pool for CPU-bound HTML parsing
+    CPU_POOL_ENABLED: bool = os.getenv("CPU_POOL_ENABLED", "true").lower() == "true"
+    CPU_POOL_WORKERS: int = int(os.getenv("CPU_POOL_WORKERS", "0"))  # 0 = derive from CPU count
+    CPU_POOL_MAX_PENDING: int = int(os.getenv("CPU_POOL_MAX_PENDING", "32"))
+    CPU_POOL_INLINE_MAX_BYTES: int = int(os.getenv("CPU_POOL_INLINE_MAX_BYTES", "100000"))
+
 
 settings = Settings()
@@ -0,0 +1,155 @@
+# scripts/bench_degradation.py
+"""
+Simulate a Gemini slowdown and compare request latency with and without the
+degradation controller.
+
+Gemini is replaced by a fake SDK that answers every stage after a delay that
+follows the phases below (healthy, degraded, healthy again); Mongo lookups
+and writes are stubbed out. Requests run through process_form() with a
+synthetic form whose inputs have no labels, so the full mode needs the LLM
+extraction path, and report p50/p99 per phase plus the modes seen.
+
+Controller timings are scaled down so a run takes about two minutes:
+
+    python scripts/bench_degradation.py --rate 10 --phase-seconds 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson  # noqa: E402
+
+from app.settings import settings  # noqa: E402
+import app.services.form_pipeline as form_pipeline  # noqa: E402
+import app.services.gemini_prompt as gemini_prompt  # noqa: E402
+from app.services.degradation import DegradationController, mode_name  # noqa: E402
+
+FIELDS = 12
+DOM = "<html><body><form>" + "".join(
+    f'<div class="question"><span>Question {i}</span><input name="q{i}" placeholder="Answer {i}"></div>'
+    for i in range(FIELDS)
+) + "</form></body></html>"
+USER_PROMPT = "My name is Jane Doe and my email is jane@example.com. I build developer tools."
+
+
+class Upstream:
+    latency = 0.0
+
+
+class FakeChat:
+    def __init__(self, config):
+        self.config = config or {}
+
+    async def send_message_async(self, message):
+        await asyncio.sleep(Upstream.latency)
+        properties = self.config.get("response_schema", {}).get("properties", {})
+        if "elements" in properties:
+            answer = {"querySelectorAll": "div.question", "elements": [
+                {"querySelectorInput": f"input[name='q{i}']", "label": f"Question {i}", "value": "x"} for i in range(FIELDS)
+            ]}
+        elif "querySelectorAll" in properties:
+            answer = {"querySelectorAll": "div.question"}
+        elif "value" in self.config.get("response_schema", {}).get("items", {}).get("properties", {}):
+            answer = [{**element, "value": "x"} for element in orjson.loads(message)]
+        else:
+            answer = [{"querySelectorInput": f"input[name='q{i}']", "label": f"Question {i}"} for i in range(FIELDS)]
+        return types.SimpleNamespace(text=orjson.dumps(answer).decode())
+
+
+class FakeGenAI:
+    class GenerativeModel:
+        def __init__(self, model_name=None, generation_config=None, system_instruction=None):
+            self.config = generation_config
+
+        def start_chat(self, history=None):
+            return FakeChat(self.config)
+
+
+def install_fakes():
+    gemini_prompt.GeminiSDK._genai = FakeGenAI
+
+    async def no_form(*args, **kwargs):
+        return None
+
+    async def no_write(*args, **kwargs):
+        return None
+
+    form_pipeline.find_form_by_path = no_form
+    form_pipeline.persist_form = no_write
+
+
+async def one_request(latencies, modes):
+    started = time.monotonic()
+    try:
+        await form_pipeline.process_form("bench.example.com", DOM, USER_PROMPT, None, "staged")
+    except Exception:
+        pass
+    latencies.append(time.monotonic() - started)
+    modes.add(mode_name())
+
+
+async def run_phase(seconds, latency, rate):
+    """Open-loop arrivals at rate requests per second, slow responses don't slow the clients down"""
+    Upstream.latency = latency
+    latencies, modes = [], set()
+    deadline = time.monotonic() + seconds
+    requests = []
+    while time.monotonic() < deadline:
+        requests.append(asyncio.ensure_future(one_request(latencies, modes)))
+        await asyncio.sleep(1 / rate)
+    await asyncio.gather(*requests)
+    return latencies, modes
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))] if ordered else 0.0
+
+
+async def bench(enabled, phases, rate):
+    settings.DEGRADATION_ENABLED = enabled
+    DegradationController.reset()
+    form_pipeline.Caches.get("widget_selectors").cache.clear()
+    print(f"controller {'on' if enabled else 'off'}")
+    for name, seconds, latency in phases:
+        latencies, modes = await run_phase(seconds, latency, rate)
+        print(f"  {name:<10} upstream {latency:4.1f}s  requests {len(latencies):4d}  "
+              f"p50 {statistics.median(latencies):5.2f}s  p99 {percentile(latencies, 0.99):5.2f}s  "
+              f"modes {','.join(sorted(modes))}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=10, help="Requests per second")
+    parser.add_argument("--phase-seconds", type=float, default=20)
+    parser.add_argument("--healthy-latency", type=float, default=0.2)
+    parser.add_argument("--degraded-latency", type=float, default=2.0)
+    parser.add_argument("--slo", type=float, default=0.8, help="DEGRADATION_LATENCY_SLO for the run")
+    args = parser.parse_args()
+
+    install_fakes()
+    settings.CPU_POOL_ENABLED = False
+    settings.DEGRADATION_LATENCY_SLO = args.slo
+    settings.DEGRADATION_LLM_TIMEOUT = args.slo
+    settings.DEGRADATION_WINDOW_SECONDS = args.phase_seconds / 3
+    settings.DEGRADATION_MIN_SAMPLES = 10
+    settings.DEGRADATION_STEP_SECONDS = 1
+    settings.DEGRADATION_HOLD_SECONDS = args.phase_seconds / 3
+
+    phases = [
+        ("healthy", args.phase_seconds, args.healthy_latency),
+        ("degraded", args.phase_seconds, args.degraded_latency),
+        ("recovered", args.phase_seconds, args.healthy_latency),
+    ]
+    await bench(False, phases, args.rate)
+    await bench(True, phases, args.rate)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
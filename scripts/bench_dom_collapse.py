@@ -0,0 +1,127 @@
+# scripts/bench_dom_collapse.py
+"""
+Measure how much collapse_dom() shrinks the HTML sent to Gemini.
+
+Runs clean_html() and then collapse_dom() over the saved templates and a few
+synthetic worst-case pages (long country/university selects, a page with
+large tables and navigation lists, a radio grid) and reports characters,
+estimated prompt tokens and the reduction per page. It also checks what the
+collapse must not change:
+
+- inputs: fillable controls in the full and the collapsed HTML
+- selectors: labelled-input selectors computed on the collapsed HTML that
+  don't match the same input in the full HTML (must be 0)
+- options: option lists put back on extracted selects by attach_select_options()
+
+    python scripts/bench_dom_collapse.py
+    python scripts/bench_dom_collapse.py --dom page.html
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from app.services.clean_html import clean_html  # noqa: E402
+from app.services.dom_collapse import attach_select_options, collapse_dom  # noqa: E402
+from app.services.dom_utils import extract_labelled_inputs  # noqa: E402
+from app.services.form_pipeline import estimate_tokens  # noqa: E402
+from app.services.selector_utils import FORM_INPUTS_SELECTOR, select  # noqa: E402
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "tests", "templates")
+
+
+def field(name, label, control):
+    return f'<div class="field"><label for="{name}">{label}</label>{control}</div>'
+
+
+def select_field(name, label, options):
+    choices = '<option value="">Select...</option>' + "".join(
+        f'<option value="{value}">{value}</option>' for value in options
+    )
+    return field(name, label, f'<select id="{name}" name="{name}">{choices}</select>')
+
+
+def long_selects_page():
+    return "<html><body><form>" + "".join([
+        field("name", "Full name", '<input id="name" name="name">'),
+        field("email", "Email", '<input id="email" name="email" type="email">'),
+        select_field("country", "Country", [f"Country {i}" for i in range(250)]),
+        select_field("university", "University", [f"University of Somewhere number {i}" for i in range(2000)]),
+        select_field("year", "Graduation year", [str(year) for year in range(1950, 2031)]),
+        select_field("degree", "Degree", ["High school", "Bachelor", "Master", "PhD"]),
+    ]) + "</form></body></html>"
+
+
+def tables_page():
+    nav = "<ul>" + "".join(f'<li class="nav-item"><a href="/p/{i}">Page {i}</a></li>' for i in range(60)) + "</ul>"
+    rows = "".join(
+        f'<tr><td class="title">Software Engineer {i}</td><td>Remote</td><td>2024-01-{i % 28 + 1:02d}</td></tr>'
+        for i in range(300)
+    )
+    form = "<form>" + "".join(
+        field(f"q{i}", f"Question {i}", f'<input id="q{i}" name="q{i}">') for i in range(10)
+    ) + "</form>"
+    footer = "<ul>" + "".join(f'<li><a href="/f/{i}">Link {i}</a></li>' for i in range(40)) + "</ul>"
+    return (f"<html><body><header><nav>{nav}</nav></header><section><table><tbody>{rows}</tbody></table></section>"
+            f"<main>{form}</main><footer>{footer}</footer></body></html>")
+
+
+def radio_grid_page():
+    rows = "".join(
+        f'<tr><td>Statement {i}</td>' + "".join(
+            f'<td><input type="radio" name="s{i}" value="{value}"></td>' for value in range(1, 6)
+        ) + "</tr>"
+        for i in range(40)
+    )
+    return f"<html><body><form><table><tbody>{rows}</tbody></table></form></body></html>"
+
+
+def inputs(html):
+    return len(select(BeautifulSoup(html, 'html.parser'), FORM_INPUTS_SELECTOR))
+
+
+def broken_selectors(full_html, collapsed_html):
+    """Selectors written against the collapsed HTML that don't find the same input in the full HTML"""
+    soup = BeautifulSoup(full_html, 'html.parser')
+    broken = 0
+    for element in extract_labelled_inputs(collapsed_html)["elements"]:
+        if len(select(soup, element.querySelectorInput)) != 1:
+            broken += 1
+    return broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dom", action="append", help="Saved DOM to measure (repeatable)")
+    args = parser.parse_args()
+
+    cases = [(os.path.basename(path), open(path).read()) for path in (args.dom or [])]
+    if not cases:
+        for name in ("forms_fillout.txt", "google_docs.txt"):
+            path = os.path.join(TEMPLATES_DIR, name)
+            if os.path.exists(path):
+                cases.append((name, open(path).read()))
+        cases += [("long_selects", long_selects_page()), ("tables_and_lists", tables_page()),
+                  ("radio_grid", radio_grid_page())]
+
+    print(f"{'page':<18} {'cleaned':>9} {'collapsed':>9} {'tokens':>15} {'saved':>6} {'ms':>6} "
+          f"{'inputs':>9} {'broken':>6} {'options':>7}")
+    for name, dom in cases:
+        cleaned = clean_html(dom)
+        started = time.perf_counter()
+        collapsed = collapse_dom(cleaned)
+        elapsed = (time.perf_counter() - started) * 1000
+        elements = attach_select_options(cleaned, extract_labelled_inputs(collapsed)["elements"])
+        options = sum(len(element.options) for element in elements if element.options)
+        saved = 1 - len(collapsed) / len(cleaned) if cleaned else 0.0
+        print(f"{name:<18} {len(cleaned):9d} {len(collapsed):9d} "
+              f"{estimate_tokens(cleaned):7d}>{estimate_tokens(collapsed):<7d} {saved:6.1%} {elapsed:6.1f} "
+              f"{inputs(cleaned):4d}/{inputs(collapsed):<4d} {broken_selectors(cleaned, collapsed):6d} {options:7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# scripts/bench_import_time.py
+"""
+Import-time benchmark for the API worker.
+
+Runs `python -X importtime -c "import app.main"` in a clean interpreter without
+GEMINI_API_KEY and reports the wall time plus the slowest modules. Use
+--max-ms to fail (exit 1) when startup regresses past a budget.
+
+    python scripts/bench_import_time.py --runs 5 --top 15 --max-ms 1500
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_once(module: str):
+    env = {k: v for k, v in os.environ.items() if k != "GEMINI_API_KEY"}
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"import {module} failed")
+
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|").split("|")]
+        modules.append((int(cumulative_us), int(self_us), name))
+    return wall_ms, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    walls = []
+    modules = []
+    for _ in range(args.runs):
+        wall_ms, modules = run_once(args.module)
+        walls.append(wall_ms)
+
+    print(f"import {args.module}: median {statistics.median(walls):.0f} ms, "
+          f"min {min(walls):.0f} ms over {args.runs} runs (interpreter start included)")
+    print("\nSlowest modules (cumulative, last run):")
+    for cumulative_us, self_us, name in sorted(modules, reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    if args.max_ms is not None and statistics.median(walls) > args.max_ms:
+        print(f"\nFAIL: median import time exceeds {args.max_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
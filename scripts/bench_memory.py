@@ -0,0 +1,117 @@
+# scripts/bench_memory.py
+"""
+Measure peak memory per request for large DOM payloads with tracemalloc.
+
+Builds a request body of the given size from the bundled templates, then
+reports the peak traced allocation for each ingestion stage:
+
+- buffered: the body collected as a chunk list and joined, as Starlette's
+  request.body() does, then parsed with the bytes still alive
+- spooled: the body read through read_spooled_json, one buffer that moves to
+  a temporary file past REQUEST_SPOOL_MAX_BYTES and is parsed in place (from
+  an mmap of the file once spilled, which tracemalloc doesn't count)
+- clean_html, extract_labelled_inputs, score_selector on the parsed DOM,
+  plus how much each leaves behind before the next GC run
+
+No server, Mongo or Gemini access is needed; the parsing stages run inline.
+
+    python scripts/bench_memory.py --sizes 1 5 --chunk-kb 64
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+from app.middleware import read_spooled_json  # noqa: E402
+from app.services.clean_html import clean_html  # noqa: E402
+from app.services.dom_utils import extract_labelled_inputs  # noqa: E402
+from app.services.selector_utils import score_selector  # noqa: E402
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "tests", "templates")
+MB = 1024 * 1024
+
+
+def build_body(size_mb: float) -> bytes:
+    templates = []
+    for name in sorted(os.listdir(TEMPLATES_DIR)):
+        with open(os.path.join(TEMPLATES_DIR, name)) as f:
+            templates.append(f.read())
+    page = "".join(templates)
+    dom = page * max(1, int(size_mb * MB / len(page)))
+    return orjson.dumps({"url": "https://example.com/apply", "dom": dom, "user_prompt": "Jane Doe"})
+
+
+def fake_request(body: bytes, chunk_size: int) -> Request:
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    del body
+
+    async def receive():
+        if chunks:
+            chunk = chunks.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+        return {"type": "http.disconnect"}
+
+    return Request({"type": "http", "method": "POST", "headers": []}, receive)
+
+
+async def buffered_ingest(request: Request):
+    chunks = []
+    async for chunk in request.stream():
+        chunks.append(chunk)
+    body = b"".join(chunks)
+    # Starlette keeps the body (and json) cached on the request for the whole request
+    payload = orjson.loads(body)
+    return payload, body
+
+
+async def spooled_ingest(request: Request):
+    return await read_spooled_json(request)
+
+
+def measure(label: str, func, *args):
+    gc.collect()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func(*args)
+    if asyncio.iscoroutine(result):
+        result = asyncio.run(result)
+    current, peak = tracemalloc.get_traced_memory()
+    print(f"  {label:<24} peak {(peak - before) / MB:8.1f} MB   left before GC {(current - before) / MB:8.1f} MB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 5], help="Body sizes in MB")
+    parser.add_argument("--chunk-kb", type=int, default=64, help="Size of the ASGI body chunks")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    for size_mb in args.sizes:
+        body = build_body(size_mb)
+        print(f"\n=== {len(body) / MB:.1f} MB body ===")
+        chunk_size = args.chunk_kb * 1024
+
+        result = measure("buffered ingest", buffered_ingest, fake_request(body, chunk_size))
+        del result
+        payload = measure("spooled ingest", spooled_ingest, fake_request(body, chunk_size))
+        del body
+
+        dom = payload.pop("dom")
+        html = measure("clean_html", clean_html, dom)
+        del dom
+        measure("extract_labelled_inputs", extract_labelled_inputs, html)
+        measure("score_selector", score_selector, html, "form *")
+        del html, payload
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
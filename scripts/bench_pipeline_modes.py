@@ -0,0 +1,121 @@
+# scripts/bench_pipeline_modes.py
+"""
+Compare the staged (detect -> extract -> fill) and combined (one call) pipelines.
+
+Runs both modes against saved DOMs with the real Gemini API (GEMINI_API_KEY
+must be set; Mongo is not touched) and reports per-mode latency plus two
+accuracy measures:
+
+- selectors: share of returned querySelectorInput values matching exactly one
+  element in the original DOM
+- labels: share of the reference labels found in the output, where the
+  reference comes from the site extractor for that DOM (if one matches)
+
+    python scripts/bench_pipeline_modes.py --runs 3
+    python scripts/bench_pipeline_modes.py --dom page.html --domain example.com
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from app.services.clean_html import clean_html  # noqa: E402
+from app.services.form_pipeline import detect_query_selector, fill_history  # noqa: E402
+from app.models.form_element import elements_to_dicts  # noqa: E402
+from app.services.gemini_prompt import detect_extract_and_fill, extract_form_elements, fill_form_values  # noqa: E402
+from app.services.site_extractors import extract_with_registry  # noqa: E402
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "tests", "templates")
+DEFAULT_CASES = [
+    ("forms.fillout.com", os.path.join(TEMPLATES_DIR, "forms_fillout.txt")),
+    ("docs.google.com", os.path.join(TEMPLATES_DIR, "google_docs.txt")),
+]
+USER_PROMPT = (
+    "My name is Jane Doe, email jane.doe@example.com, phone +1 555 0100. "
+    "Twitter @janedoe, LinkedIn linkedin.com/in/janedoe, GitHub github.com/janedoe. "
+    "I build developer tools and want to join to meet other founders."
+)
+
+
+async def run_staged(html, domain, history):
+    query_selector, _ = await detect_query_selector(html)
+    form_elements = await extract_form_elements(html, query_selector, domain)
+    filled = await fill_form_values(form_elements, history, domain)
+    return filled.get("fillJSON", []) if isinstance(filled, dict) else filled
+
+
+async def run_combined(html, domain, history):
+    combined = await detect_extract_and_fill(html, history)
+    return elements_to_dicts(combined["elements"]) if combined else []
+
+
+def _normalize(text):
+    return " ".join((text or "").lower().split()).rstrip("*").strip()
+
+
+def score(elements, soup, reference_labels):
+    selectors_ok = 0
+    for element in elements:
+        try:
+            if len(soup.select(element.get("querySelectorInput", ""))) == 1:
+                selectors_ok += 1
+        except Exception:
+            pass
+    selector_accuracy = selectors_ok / len(elements) if elements else 0.0
+
+    label_recall = None
+    if reference_labels:
+        found = {_normalize(element.get("label")) for element in elements}
+        label_recall = sum(1 for label in reference_labels if _normalize(label) in found) / len(reference_labels)
+    return selector_accuracy, label_recall
+
+
+async def bench_case(domain, path, runs):
+    with open(path) as f:
+        dom = f.read()
+    html = clean_html(dom)
+    soup = BeautifulSoup(dom, "html.parser")
+    reference = extract_with_registry(domain, dom)
+    reference_labels = [element.label for element in reference["elements"]] if reference else []
+    history = fill_history(USER_PROMPT, None)
+
+    print(f"\n=== {domain} ({len(html)} chars cleaned, {len(reference_labels)} reference fields) ===")
+    for mode, runner in (("staged", run_staged), ("combined", run_combined)):
+        latencies, selector_scores, label_scores, counts = [], [], [], []
+        for _ in range(runs):
+            start = time.perf_counter()
+            elements = await runner(html, domain, history)
+            latencies.append(time.perf_counter() - start)
+            selector_accuracy, label_recall = score(elements, soup, reference_labels)
+            selector_scores.append(selector_accuracy)
+            counts.append(len(elements))
+            if label_recall is not None:
+                label_scores.append(label_recall)
+        labels = f"{statistics.mean(label_scores):.0%}" if label_scores else "n/a"
+        print(f"{mode:>9}: median {statistics.median(latencies):6.2f}s  max {max(latencies):6.2f}s  "
+              f"elements {statistics.mean(counts):5.1f}  selectors {statistics.mean(selector_scores):4.0%}  labels {labels}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--dom", help="Path to a saved DOM, defaults to the bundled templates")
+    parser.add_argument("--domain", default="example.com")
+    args = parser.parse_args()
+
+    if not os.getenv("GEMINI_API_KEY"):
+        raise SystemExit("GEMINI_API_KEY must be set to benchmark the pipelines")
+
+    cases = [(args.domain, args.dom)] if args.dom else DEFAULT_CASES
+    for domain, path in cases:
+        await bench_case(domain, path, args.runs)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,208 @@
+# scripts/replay_traffic.py
+"""
+Replay captured API traffic against a running build and compare it with a
+saved baseline.
+
+Capture files come from TRAFFIC_CAPTURE_ENABLED=true (gzip JSONL, see
+app/services/traffic_capture.py). Requests are re-issued with their original
+relative timing divided by --speed (--speed 0 sends them back to back, limited
+by --concurrency); DOMs are restored from the deduplicated "dom" lines. Run
+the target with LLM_PROVIDER=fake so Gemini latency and quotas don't decide
+the result:
+
+    LLM_PROVIDER=fake python -m app.server
+    python scripts/replay_traffic.py /tmp/kleo-capture/*.jsonl.gz --speed 2 --save-baseline baseline.json
+    # ... new build ...
+    python scripts/replay_traffic.py /tmp/kleo-capture/*.jsonl.gz --speed 2 --baseline baseline.json
+
+The report has throughput and latency percentiles per endpoint group. With a
+baseline, the exit status is 1 when a p99 or the error rate regressed by more
+than --max-regression.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import statistics
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+import requests
+
+thread_state = threading.local()
+
+
+def load_capture(paths):
+    """Requests sorted by arrival time, with their DOMs restored"""
+    doms = {}
+    records = []
+    for path in paths:
+        try:
+            with gzip.open(path, "rb") as capture:
+                for line in capture:
+                    record = orjson.loads(line)
+                    if record.get("type") == "dom":
+                        doms[record["hash"]] = record["dom"]
+                    elif record.get("type") == "request":
+                        records.append(record)
+        except (EOFError, zlib.error, orjson.JSONDecodeError):
+            # A worker that was killed leaves a truncated gzip stream; keep what was complete
+            print(f"{path}: truncated capture, using the records read so far", file=sys.stderr)
+
+    def restore(body):
+        if isinstance(body, dict):
+            if set(body) == {"$dom"}:
+                return doms.get(body["$dom"])
+            return {key: restore(value) for key, value in body.items()}
+        if isinstance(body, list):
+            return [restore(item) for item in body]
+        return body
+
+    for record in records:
+        record["body"] = restore(record.get("body"))
+    records.sort(key=lambda record: record["t"])
+    return records
+
+
+def endpoint_group(path):
+    for prefix, group in (("/api/v1/form/batch", "form_batch"), ("/api/v1/form", "form"), ("/api/v1/detect", "detect")):
+        if path.startswith(prefix):
+            return group
+    return "other"
+
+
+def send(target, record, timeout):
+    session = getattr(thread_state, "session", None)
+    if session is None:
+        session = thread_state.session = requests.Session()
+    url = f"{target}{record['path']}" + (f"?{record['query']}" if record.get("query") else "")
+    body = record.get("body")
+    started = time.monotonic()
+    try:
+        response = session.request(
+            record["method"], url,
+            data=orjson.dumps(body) if body is not None else None,
+            headers={"Content-Type": "application/json"} if body is not None else None,
+            timeout=timeout,
+        )
+        status = response.status_code
+    except requests.RequestException:
+        status = 0
+    return time.monotonic() - started, status
+
+
+async def replay(records, target, speed, concurrency, timeout):
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    slots = asyncio.Semaphore(concurrency)
+    results = []
+    started = time.monotonic()
+
+    async def one(record):
+        if speed > 0:
+            delay = record["t"] / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        async with slots:
+            seconds, status = await loop.run_in_executor(executor, send, target, record, timeout)
+        results.append((endpoint_group(record["path"]), seconds, status, record.get("status")))
+
+    base = records[0]["t"] if records else 0
+    for record in records:
+        record["t"] -= base
+    await asyncio.gather(*[one(record) for record in records])
+    executor.shutdown()
+    return results, time.monotonic() - started
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))] if ordered else 0.0
+
+
+def summarize(results, wall_seconds):
+    summary = {"wall_seconds": round(wall_seconds, 3), "groups": {}}
+    for group in sorted({result[0] for result in results} | {"all"}):
+        rows = [result for result in results if group == "all" or result[0] == group]
+        latencies = [row[1] for row in rows]
+        errors = sum(1 for row in rows if row[2] == 0 or row[2] >= 500)
+        # Status changes against the capture (e.g. 200 captured, 404 replayed) point at data the target lacks
+        mismatched = sum(1 for row in rows if row[3] is not None and row[2] != row[3])
+        summary["groups"][group] = {
+            "requests": len(rows),
+            "throughput": round(len(rows) / wall_seconds, 2) if wall_seconds else 0.0,
+            "p50": round(statistics.median(latencies), 4) if latencies else 0.0,
+            "p95": round(percentile(latencies, 0.95), 4),
+            "p99": round(percentile(latencies, 0.99), 4),
+            "error_rate": round(errors / len(rows), 4) if rows else 0.0,
+            "status_mismatches": mismatched,
+        }
+    return summary
+
+
+def compare(summary, baseline, max_regression):
+    """Print the deltas against the baseline, returns False when something regressed"""
+    ok = True
+    for group, current in summary["groups"].items():
+        before = baseline["groups"].get(group)
+        if before is None:
+            continue
+        for metric in ("throughput", "p50", "p95", "p99", "error_rate"):
+            old, new = before[metric], current[metric]
+            change = (new - old) / old if old else 0.0
+            regressed = False
+            if metric == "p99" and change > max_regression:
+                regressed = True
+            if metric == "error_rate" and new - old > max_regression / 10:
+                regressed = True
+            ok = ok and not regressed
+            delta = f"{change:+7.1%}" if old else "      -"
+            print(f"  {group:<11} {metric:<11} {old:10.4f} -> {new:10.4f}  {delta}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("captures", nargs="+", help="Capture files (.jsonl.gz)")
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="Timing multiplier, 0 = as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--limit", type=int, help="Replay only the first N requests")
+    parser.add_argument("--baseline", help="Summary JSON of an earlier run to compare with")
+    parser.add_argument("--save-baseline", help="Write this run's summary JSON here")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="Allowed relative p99 increase")
+    args = parser.parse_args()
+
+    records = load_capture(args.captures)[:args.limit]
+    if not records:
+        print("No captured requests found", file=sys.stderr)
+        return 2
+    pace = f"{args.speed}x the captured rate" if args.speed else "full speed"
+    print(f"Replaying {len(records)} requests against {args.target} at {pace}")
+    results, wall_seconds = asyncio.run(replay(records, args.target.rstrip("/"), args.speed, args.concurrency, args.timeout))
+    summary = summarize(results, wall_seconds)
+
+    for group, stats in summary["groups"].items():
+        print(f"  {group:<11} requests {stats['requests']:6d}  {stats['throughput']:8.2f} req/s  "
+              f"p50 {stats['p50']:7.3f}s  p95 {stats['p95']:7.3f}s  p99 {stats['p99']:7.3f}s  "
+              f"errors {stats['error_rate']:6.1%}  status changes {stats['status_mismatches']}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline}:")
+        if not compare(summary, baseline, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())